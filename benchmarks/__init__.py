@@ -0,0 +1,13 @@
+"""
+Benchmarks
+
+A reproducible load test of the service. A dataset with realistic skew is
+seeded with the test factories, every endpoint of service/routes.py is
+driven through the Flask test client or a real gunicorn process, and the
+latency percentiles, throughput and peak memory are written to a JSON
+file that can be compared with a stored baseline.
+
+Run with:
+    python -m benchmarks run --output results.json
+    python -m benchmarks compare benchmarks/baselines/sqlite-small.json results.json
+"""
@@ -0,0 +1,179 @@
+"""
+Benchmark commands
+
+    python -m benchmarks run [options]
+    python -m benchmarks compare BASELINE CURRENT
+"""
+import datetime
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import click
+from benchmarks import runner
+
+DEFAULT_DATABASE_URI = "sqlite:///" + os.path.join(
+    tempfile.gettempdir(), "wishlists-benchmark.db"
+)
+
+
+@click.group()
+def cli():
+    """Load tests of the wishlists service"""
+
+
+@cli.command("run")
+@click.option(
+    "--database-uri",
+    default=DEFAULT_DATABASE_URI,
+    show_default=True,
+    help="The database to benchmark against. ALL OF ITS WISHLISTS ARE DELETED.",
+)
+@click.option("--wishlists", default=1000, show_default=True)
+@click.option("--customers", default=200, show_default=True)
+@click.option("--max-items", default=50, show_default=True)
+@click.option("--products", default=5000, show_default=True)
+@click.option("--skew", default=1.1, show_default=True, help="The Zipf exponent.")
+@click.option("--seed", default=2022, show_default=True, help="The random seed.")
+@click.option(
+    "--requests", default=200, show_default=True, help="Timed requests per scenario."
+)
+@click.option("--concurrency", default=1, show_default=True)
+@click.option(
+    "--gunicorn", is_flag=True, help="Send the requests to a gunicorn server."
+)
+@click.option("--worker-class", help="gunicorn worker class, else gunicorn.conf.py's.")
+@click.option("--workers", type=int, help="gunicorn workers, else gunicorn.conf.py's.")
+@click.option("--threads", type=int, help="gunicorn threads, else gunicorn.conf.py's.")
+@click.option("--scenario", "names", multiple=True, help="Run only these scenarios.")
+@click.option("--output", "-o", type=click.File("w"), default="-")
+def run_command(database_uri, seed, requests, concurrency, names, output, **options):
+    """Seeds a dataset, runs the scenarios and writes the results as JSON"""
+    # the service reads its configuration when it is first imported
+    os.environ["DATABASE_URI"] = database_uri
+    # pylint: disable=import-outside-toplevel
+    from service import app
+    from service.models import db
+    from benchmarks.dataset import seed as seed_dataset
+    from benchmarks.drivers import GunicornServer, TestClientDriver
+    from benchmarks.scenarios import SCENARIOS
+
+    # logging every request, or every repeated query, would be timed too
+    app.logger.setLevel(logging.WARNING)
+    logging.getLogger("flask.app.slow_query").setLevel(logging.ERROR)
+    scenarios = [s for s in SCENARIOS if not names or s.name in names]
+    dataset_options = {
+        key: options[key]
+        for key in ("wishlists", "customers", "max_items", "products", "skew")
+    }
+    rng = random.Random(seed)
+    click.echo(f"Seeding {options['wishlists']} wishlists...", err=True)
+    dataset = seed_dataset(rng=rng, **dataset_options)
+
+    def progress(name, summary):
+        click.echo(
+            f"{name:28} p50 {summary['p50_ms']:8.2f} ms  p95 {summary['p95_ms']:8.2f} ms"
+            f"  p99 {summary['p99_ms']:8.2f} ms  {summary['throughput_rps']:8.1f}/s"
+            f"  errors {summary['errors']}",
+            err=True,
+        )
+
+    if options["gunicorn"]:
+        env = {
+            "DATABASE_URI": database_uri,
+            "REPEATED_QUERY_THRESHOLD": os.getenv(
+                "REPEATED_QUERY_THRESHOLD", "1000000"
+            ),
+        }
+        server = GunicornServer(
+            options["workers"], options["threads"], options["worker_class"], env
+        )
+        with server as driver:
+            results = runner.run(
+                driver, dataset, scenarios, requests, concurrency, progress
+            )
+            peak_rss = driver.peak_rss()
+    else:
+        driver = TestClientDriver(app)
+        results = runner.run(
+            driver, dataset, scenarios, requests, concurrency, progress
+        )
+        peak_rss = driver.peak_rss()
+
+    report = {
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "driver": driver.name,
+        "database": db.engine.dialect.name,
+        "dataset": dict(dataset_options, seed=seed, items=dataset.item_count),
+        "requests": requests,
+        "concurrency": concurrency,
+        "server": (
+            {
+                key: options[key] or "profile"
+                for key in ("worker_class", "workers", "threads")
+            }
+            if options["gunicorn"]
+            else None
+        ),
+        "environment": runner.environment(),
+        "peak_rss_mb": round(peak_rss / 2**20, 1) if peak_rss else None,
+        "scenarios": results,
+    }
+    json.dump(report, output, indent=2)
+    output.write("\n")
+
+
+@cli.command("compare")
+@click.argument("baseline", type=click.File("r"))
+@click.argument("current", type=click.File("r"))
+@click.option(
+    "--threshold",
+    default=0.2,
+    show_default=True,
+    help="The relative change that counts as a regression.",
+)
+@click.option(
+    "--min-ms",
+    default=1.0,
+    show_default=True,
+    help="Smaller p95 increases are noise, whatever their relative change.",
+)
+def compare_command(baseline, current, threshold, min_ms):
+    """Compares results with a baseline, fails when a scenario regressed"""
+    baseline, current = json.load(baseline), json.load(current)
+    for key in ("driver", "database", "dataset", "concurrency"):
+        if baseline.get(key) != current.get(key):
+            click.echo(
+                f"warning: {key} differs, {baseline.get(key)} != {current.get(key)}",
+                err=True,
+            )
+    rows = runner.compare(baseline, current, threshold, min_ms)
+    click.echo(
+        f"{'scenario':28} {'p50':>8} {'p95':>8} {'p99':>8} {'throughput':>11}  regressed"
+    )
+    for name, before, after, regressions in rows:
+        if not before or not after:
+            click.echo(f"{name:28} only in the {'baseline' if before else 'current'}")
+            continue
+        click.echo(
+            f"{name:28}"
+            f" {runner.change(before['p50_ms'], after['p50_ms']):>8}"
+            f" {runner.change(before['p95_ms'], after['p95_ms']):>8}"
+            f" {runner.change(before['p99_ms'], after['p99_ms']):>8}"
+            f" {runner.change(before['throughput_rps'], after['throughput_rps']):>11}"
+            f"  {', '.join(regressions)}"
+        )
+    click.echo(
+        f"peak RSS {baseline.get('peak_rss_mb')} MB -> {current.get('peak_rss_mb')} MB"
+    )
+    regressed = [name for name, _, _, regressions in rows if regressions]
+    if regressed:
+        click.echo(f"{len(regressed)} scenarios regressed: {', '.join(regressed)}")
+        sys.exit(1)
+    click.echo("No regressions")
+
+
+if __name__ == "__main__":
+    cli()  # pylint: disable=no-value-for-parameter
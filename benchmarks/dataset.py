@@ -0,0 +1,111 @@
+"""
+Benchmark dataset
+
+Seeds the database with wishlists and items made by the test factories.
+Real wishlists are not uniform: a few customers own many wishlists, most
+wishlists hold a handful of items while some hold many, and a few products
+are on everybody's list. All three are drawn from Zipf distributions.
+"""
+import itertools
+import random
+from service import models
+from service.models import Items, Wishlists, db, item_totals
+from tests.factories import ItemsFactory, WishlistsFactory
+
+
+class Zipf:
+    """Draws the integers 1 to n, k with a probability proportional to 1 / k**s"""
+
+    def __init__(self, n, s=1.1, rng=random):
+        self.values = range(1, n + 1)
+        self.cum_weights = list(itertools.accumulate(1 / k**s for k in self.values))
+        self.rng = rng
+
+    def __call__(self):
+        return self.rng.choices(self.values, cum_weights=self.cum_weights)[0]
+
+
+class Dataset:
+    """The ids of the seeded rows, and skewed picks among them"""
+
+    def __init__(self, items_by_wishlist, customers, skew=1.1, rng=random):
+        self.items_by_wishlist = items_by_wishlist
+        self.rng = rng
+        # the popular rows are spread over the table, not the first ids
+        self.wishlist_ids = list(items_by_wishlist)
+        rng.shuffle(self.wishlist_ids)
+        self.with_items = [w for w in self.wishlist_ids if items_by_wishlist[w]]
+        self._wishlist = Zipf(max(len(self.wishlist_ids), 1), skew, rng)
+        self._with_items = Zipf(max(len(self.with_items), 1), skew, rng)
+        self.customer = Zipf(customers, skew, rng)
+
+    @property
+    def item_count(self):
+        """The number of seeded items"""
+        return sum(len(items) for items in self.items_by_wishlist.values())
+
+    def wishlist(self):
+        """Returns the id of a wishlist, popular ones more often"""
+        return self.wishlist_ids[self._wishlist() - 1]
+
+    def item(self):
+        """Returns the wishlist id and id of an item, of popular wishlists more often"""
+        wishlist_id = self.with_items[self._with_items() - 1]
+        return wishlist_id, self.rng.choice(self.items_by_wishlist[wishlist_id])
+
+
+def seed(
+    wishlists=1000,
+    customers=200,
+    max_items=50,
+    products=5000,
+    skew=1.1,
+    rng=random,
+    batch_size=500,
+):
+    """
+    Empties the tables and fills them with a skewed dataset
+
+    Args:
+        wishlists (int): the number of wishlists
+        customers (int): the number of customers owning them
+        max_items (int): the most items a wishlist holds
+        products (int): the number of distinct products
+        skew (float): the exponent of the Zipf distributions
+        rng (Random): the source of randomness, seed it to repeat a dataset
+        batch_size (int): the wishlists written per transaction
+    Returns:
+        Dataset: the ids of what was written
+    """
+    db.session.query(Items).delete()
+    db.session.query(Wishlists).delete()
+    db.session.commit()
+    customer = Zipf(customers, skew, rng)
+    item_count = Zipf(max_items, skew, rng)
+    product = Zipf(products, skew, rng)
+    items_by_wishlist = {}
+    for start in range(0, wishlists, batch_size):
+        batch = [
+            WishlistsFactory(id=None, customer_id=customer())
+            for _ in range(min(batch_size, wishlists - start))
+        ]
+        db.session.add_all(batch)
+        db.session.flush()
+        items = [
+            ItemsFactory(
+                id=None, wishlist_id=wishlist.id, product_id=product(), rank=rank
+            )
+            for wishlist in batch
+            for rank in range(1, item_count() + 1)
+        ]
+        db.session.add_all(items)
+        db.session.flush()
+        Wishlists.touch([], item_totals(item.total_row() for item in items))
+        for wishlist in batch:
+            items_by_wishlist[wishlist.id] = []
+        for item in items:
+            items_by_wishlist[item.wishlist_id].append(item.id)
+        db.session.commit()
+    db.session.expunge_all()
+    models.finder_cache.clear()
+    return Dataset(items_by_wishlist, customers, skew, rng)
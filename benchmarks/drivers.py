@@ -0,0 +1,178 @@
+"""
+Benchmark drivers
+
+Send the requests of the scenarios, either in process through the Flask
+test client, which measures the application alone, or over HTTP to a
+gunicorn server, which adds the WSGI server, the sockets and the workers.
+"""
+import http.client
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+
+class Driver:
+    """Sends requests and reads their whole response"""
+
+    name = None
+
+    def send(self, request):
+        """Returns the status, headers and body of the response to a Request"""
+        raise NotImplementedError
+
+    def send_json(self, request):
+        """Sends a Request that must succeed and returns its decoded body"""
+        status, _, body = self.send(request)
+        if status >= 400:
+            raise RuntimeError(f"{request.method} {request.path} failed: {status}")
+        return json.loads(body)
+
+    def peak_rss(self):
+        """Returns the peak resident memory of the service in bytes, or None"""
+        raise NotImplementedError
+
+
+class TestClientDriver(Driver):
+    """Sends requests through the Flask test client, in this process"""
+
+    __test__ = False  # not a test case, whatever pytest thinks of its name
+    name = "test-client"
+
+    def __init__(self, app):
+        self.app = app
+        self.local = threading.local()
+
+    def send(self, request):
+        if not hasattr(self.local, "client"):
+            self.local.client = self.app.test_client()
+        response = self.local.client.open(
+            request.path,
+            method=request.method,
+            json=request.body,
+            headers=request.headers,
+        )
+        body = response.get_data()  # streamed responses are read to the end
+        response.close()
+        return response.status_code, response.headers, body
+
+    def peak_rss(self):
+        return process_peak_rss(os.getpid())
+
+
+class HttpDriver(Driver):
+    """Sends requests over HTTP, one connection each like a sync worker wants"""
+
+    name = "gunicorn"
+
+    def __init__(self, host, port, pids=lambda: []):
+        self.host = host
+        self.port = port
+        self.pids = pids
+
+    def send(self, request):
+        connection = http.client.HTTPConnection(self.host, self.port, timeout=60)
+        headers = dict(request.headers or {})
+        body = None
+        if request.body is not None:
+            body = json.dumps(request.body)
+            headers["Content-Type"] = "application/json"
+        try:
+            connection.request(request.method, request.path, body, headers)
+            response = connection.getresponse()
+            return response.status, response.headers, response.read()
+        finally:
+            connection.close()
+
+    def peak_rss(self):
+        peaks = [process_peak_rss(pid) for pid in self.pids()]
+        return sum(peaks) if peaks and None not in peaks else None
+
+
+class GunicornServer:
+    """Runs the service in gunicorn, with the configuration of gunicorn.conf.py"""
+
+    def __init__(self, workers=None, threads=None, worker_class=None, env=None):
+        """The profile of gunicorn.conf.py is used for the options left out"""
+        self.options = {
+            "workers": workers,
+            "threads": threads,
+            "worker-class": worker_class,
+        }
+        self.env = dict(os.environ, **(env or {}))
+        self.port = free_port()
+        self.process = None
+
+    def __enter__(self):
+        options = [f"--{name}={value}" for name, value in self.options.items() if value]
+        self.process = subprocess.Popen(  # pylint: disable=consider-using-with
+            [sys.executable, "-m", "gunicorn"]
+            + options
+            + [f"--bind=127.0.0.1:{self.port}", "--log-level=warning", "service:app"],
+            env=self.env,
+        )
+        self.wait_until_ready()
+        return HttpDriver("127.0.0.1", self.port, self.pids)
+
+    def __exit__(self, *exc_info):
+        self.process.terminate()
+        self.process.wait(timeout=30)
+
+    def wait_until_ready(self, timeout=60):
+        """Waits until the workers answer the health check"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError("gunicorn exited before it was ready")
+            connection = http.client.HTTPConnection("127.0.0.1", self.port)
+            try:
+                connection.request("GET", "/healthcheck")
+                if connection.getresponse().status == 200:
+                    return
+            except OSError:
+                pass
+            finally:
+                connection.close()
+            time.sleep(0.2)
+        raise RuntimeError("gunicorn was not ready in time")
+
+    def pids(self):
+        """The process ids of the gunicorn master and its workers"""
+        return [self.process.pid] + child_pids(self.process.pid)
+
+
+def free_port():
+    """Returns a TCP port that nothing listens on"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def child_pids(pid):
+    """Returns the ids of the child processes of a process, on Linux"""
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children", encoding="ascii") as children:
+            return [int(child) for child in children.read().split()]
+    except OSError:
+        return []
+
+
+def process_peak_rss(pid):
+    """Returns the peak resident memory of a process in bytes, on Linux"""
+    try:
+        with open(f"/proc/{pid}/status", encoding="ascii") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if pid == os.getpid():
+        import resource  # pylint: disable=import-outside-toplevel
+
+        # ru_maxrss is in kilobytes on Linux, bytes on macOS
+        scale = 1 if sys.platform == "darwin" else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+    return None
@@ -0,0 +1,136 @@
+"""
+Benchmark runner
+
+Times the scenarios, summarizes them into latency percentiles and
+throughput, and compares two sets of results.
+"""
+import math
+import os
+import platform
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def percentile(sorted_values, percent):
+    """Returns the nearest rank percentile of sorted values"""
+    if not sorted_values:
+        return None
+    rank = math.ceil(percent / 100 * len(sorted_values))
+    return sorted_values[max(rank, 1) - 1]
+
+
+def summarize(latencies, errors, elapsed):
+    """Summarizes the latencies in seconds of the requests of one scenario"""
+    latencies = sorted(latencies)
+
+    def milliseconds(value):
+        return round(value * 1000, 3) if value is not None else None
+
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "p50_ms": milliseconds(percentile(latencies, 50)),
+        "p95_ms": milliseconds(percentile(latencies, 95)),
+        "p99_ms": milliseconds(percentile(latencies, 99)),
+        "mean_ms": milliseconds(sum(latencies) / len(latencies)) if latencies else None,
+        "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed else None,
+    }
+
+
+def run_scenario(driver, dataset, scenario, requests, warmup=5, concurrency=1):
+    """
+    Sends the requests of a scenario and times each of them
+
+    Args:
+        driver (Driver): sends the requests
+        dataset (Dataset): the seeded rows the requests are about
+        scenario (Scenario): builds the requests
+        requests (int): the number of requests, before the scenario's weight
+        warmup (int): untimed requests sent first, to fill caches and pools
+        concurrency (int): the number of requests in flight at once
+    Returns:
+        dict: the summary of the timed requests
+    """
+    count = max(1, round(requests * scenario.weight))
+    for request in scenario.prepare(driver, dataset, min(warmup, count)):
+        driver.send(request)
+    prepared = scenario.prepare(driver, dataset, count)
+
+    def timed(request):
+        started = time.perf_counter()
+        status = driver.send(request)[0]
+        return time.perf_counter() - started, status
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(timed, prepared))
+    elapsed = time.perf_counter() - started
+    errors = sum(1 for _, status in outcomes if status != scenario.expect)
+    summary = summarize([latency for latency, _ in outcomes], errors, elapsed)
+    return dict(summary, method=scenario.method, route=scenario.route)
+
+
+def run(driver, dataset, scenarios, requests=200, concurrency=1, progress=None):
+    """Runs the scenarios one after the other and returns their summaries"""
+    results = {}
+    for scenario in scenarios:
+        results[scenario.name] = run_scenario(
+            driver, dataset, scenario, requests, concurrency=concurrency
+        )
+        if progress:
+            progress(scenario.name, results[scenario.name])
+    return results
+
+
+def environment():
+    """Describes where the benchmark ran, results only compare on the same one"""
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+    }
+
+
+######################################################################
+#  C O M P A R I S O N
+######################################################################
+
+
+def compare(baseline, current, threshold=0.2, min_ms=1.0):
+    """
+    Compares the scenarios of two results
+
+    A scenario regressed when its p95 latency grew by more than threshold,
+    as a fraction, and by more than min_ms, so the noise of sub-millisecond
+    routes is not reported, or when its throughput fell by more than
+    threshold, or when it has errors it did not have before.
+
+    Returns:
+        list: (scenario name, baseline summary, current summary, regressions)
+        for each scenario in either result
+    """
+    rows = []
+    old, new = baseline["scenarios"], current["scenarios"]
+    for name in list(old) + [name for name in new if name not in old]:
+        before, after = old.get(name), new.get(name)
+        regressions = []
+        if before and after:
+            growth = after["p95_ms"] - before["p95_ms"]
+            if growth > min_ms and growth > before["p95_ms"] * threshold:
+                regressions.append("p95")
+            if after["throughput_rps"] < before["throughput_rps"] * (1 - threshold):
+                regressions.append("throughput")
+            if after["errors"] > before["errors"]:
+                regressions.append("errors")
+        rows.append((name, before, after, regressions))
+    return rows
+
+
+def change(before, after):
+    """Formats the relative change between two numbers"""
+    if before is None or after is None:
+        return "n/a"
+    if not before:
+        return "+inf" if after else "+0%"
+    return f"{(after - before) / before:+.0%}"
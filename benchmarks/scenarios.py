@@ -0,0 +1,360 @@
+"""
+Benchmark scenarios
+
+One scenario per route and method of service/routes.py, plus the variants
+that take a different path through the code, like ?expand=items and
+conditional GETs. A scenario prepares all of its requests before any of
+them is timed, so the rows that a DELETE removes are created up front and
+only the DELETE itself is measured.
+"""
+import uuid
+from collections import namedtuple
+
+BASE_URL = "/api/wishlists"
+
+Request = namedtuple("Request", "method path body headers", defaults=(None, None))
+
+
+class Scenario:
+    """Builds the requests to one route"""
+
+    def __init__(self, name, method, route, expect, build, weight=1.0):
+        """
+        Args:
+            name (string): unique name of the scenario in the results
+            method (string): the HTTP method
+            route (string): the route rule as Flask registers it
+            expect (int): the status code of a successful response
+            build (callable): called with the driver and the dataset, returns a
+                Request; it may send untimed requests to set things up
+            weight (float): the share of the requested count to send, for the
+                expensive routes
+        """
+        self.name = name
+        self.method = method
+        self.route = route
+        self.expect = expect
+        self.build = build
+        self.weight = weight
+
+    def prepare(self, driver, dataset, count):
+        """Returns count requests, ready to be timed"""
+        return [self.build(driver, dataset) for _ in range(count)]
+
+
+######################################################################
+#  S E T U P   H E L P E R S
+######################################################################
+
+
+def new_wishlist(driver, dataset, items=0):
+    """Creates a wishlist, with some items, and returns its id"""
+    wishlist = driver.send_json(
+        Request("POST", BASE_URL, {"name": "bench", "customer_id": dataset.customer()})
+    )
+    if items:
+        new_items(driver, wishlist["id"], items)
+    return wishlist["id"]
+
+
+def new_items(driver, wishlist_id, count):
+    """Adds items to a wishlist and returns their ids"""
+    results = driver.send_json(
+        Request("POST", f"{BASE_URL}/{wishlist_id}/items/batch", item_bodies(count))
+    )
+    return [result["item"]["id"] for result in results]
+
+
+def item_bodies(count):
+    """Returns the bodies of count new items"""
+    return [
+        {"name": f"bench {n}", "product_id": n + 1, "quantity": 1, "price": 100}
+        for n in range(count)
+    ]
+
+
+def new_item_path(driver, dataset):
+    """Creates an item in a new wishlist and returns its path"""
+    wishlist_id = new_wishlist(driver, dataset)
+    return f"{BASE_URL}/{wishlist_id}/items/{new_items(driver, wishlist_id, 1)[0]}"
+
+
+def reorder_request(driver, dataset):
+    """Reverses the order of the items of a new wishlist"""
+    wishlist_id = new_wishlist(driver, dataset)
+    ids = new_items(driver, wishlist_id, 20)
+    path = f"{BASE_URL}/{wishlist_id}/items/order"
+    return Request("PUT", path, {"item_ids": ids[::-1]})
+
+
+def move_request(driver, dataset):
+    """Drags the last item of a new wishlist up to second place"""
+    wishlist_id = new_wishlist(driver, dataset)
+    ids = new_items(driver, wishlist_id, 20)
+    path = f"{BASE_URL}/{wishlist_id}/items/{ids[-1]}/move"
+    return Request("PUT", path, {"after": ids[0]})
+
+
+def transfer_request(operation, key):
+    """Returns the builder of a copy, move or merge between two new wishlists"""
+
+    def build(driver, dataset):
+        source = new_wishlist(driver, dataset, items=20)
+        target = new_wishlist(driver, dataset, items=10)
+        return Request("POST", f"{BASE_URL}/{source}/{operation}", {key: target})
+
+    return build
+
+
+def replayed_create(driver, dataset):
+    """A retry of a wishlist creation, answered from its Idempotency-Key"""
+    key = str(uuid.uuid4())
+    body = {"name": "bench", "customer_id": dataset.customer()}
+    request = Request("POST", BASE_URL, body, {"Idempotency-Key": key})
+    driver.send(request)
+    return request
+
+
+def etag(driver, path):
+    """Returns the ETag of a GET"""
+    return driver.send(Request("GET", path))[1]["ETag"]
+
+
+######################################################################
+#  S C E N A R I O S
+######################################################################
+
+
+def wishlist_path(dataset, suffix=""):
+    """The path of a popular wishlist"""
+    return f"{BASE_URL}/{dataset.wishlist()}{suffix}"
+
+
+def item_path(dataset):
+    """The path of an item of a popular wishlist"""
+    wishlist_id, item_id = dataset.item()
+    return f"{BASE_URL}/{wishlist_id}/items/{item_id}"
+
+
+def wishlist_not_modified(driver, dataset):
+    """A conditional GET of a wishlist that did not change"""
+    path = wishlist_path(dataset)
+    return Request("GET", path, headers={"If-None-Match": etag(driver, path)})
+
+
+SCENARIOS = [
+    Scenario("index", "GET", "/", 200, lambda d, ds: Request("GET", "/")),
+    Scenario(
+        "healthcheck",
+        "GET",
+        "/healthcheck",
+        200,
+        lambda d, ds: Request("GET", "/healthcheck"),
+    ),
+    Scenario(
+        "cache_stats",
+        "GET",
+        "/cache/stats",
+        200,
+        lambda d, ds: Request("GET", "/cache/stats"),
+    ),
+    Scenario(
+        "metrics", "GET", "/metrics", 200, lambda d, ds: Request("GET", "/metrics")
+    ),
+    Scenario(
+        "list_wishlists",
+        "GET",
+        BASE_URL,
+        200,
+        lambda d, ds: Request("GET", BASE_URL),
+    ),
+    Scenario(
+        "list_wishlists_by_customer",
+        "GET",
+        BASE_URL,
+        200,
+        lambda d, ds: Request("GET", f"{BASE_URL}?customer_id={ds.customer()}"),
+    ),
+    Scenario(
+        "list_wishlists_expanded",
+        "GET",
+        BASE_URL,
+        200,
+        lambda d, ds: Request("GET", f"{BASE_URL}?expand=items&limit=20"),
+    ),
+    Scenario(
+        "create_wishlist",
+        "POST",
+        BASE_URL,
+        201,
+        lambda d, ds: Request(
+            "POST", BASE_URL, {"name": "bench", "customer_id": ds.customer()}
+        ),
+    ),
+    Scenario("create_wishlist_replayed", "POST", BASE_URL, 201, replayed_create),
+    Scenario(
+        "export_wishlists",
+        "GET",
+        f"{BASE_URL}/export",
+        200,
+        lambda d, ds: Request("GET", f"{BASE_URL}/export"),
+        weight=0.05,
+    ),
+    Scenario(
+        "search_customer",
+        "GET",
+        f"{BASE_URL}/search",
+        200,
+        lambda d, ds: Request(
+            "GET", f"{BASE_URL}/search?q=jo&customer_id={ds.customer()}"
+        ),
+    ),
+    Scenario(
+        "search_wishlist",
+        "GET",
+        f"{BASE_URL}/search",
+        200,
+        lambda d, ds: Request(
+            "GET", f"{BASE_URL}/search?q=jo&wishlist_id={ds.wishlist()}"
+        ),
+    ),
+    Scenario(
+        "customer_summary",
+        "GET",
+        "/api/customers/<int:customer_id>/summary",
+        200,
+        lambda d, ds: Request("GET", f"/api/customers/{ds.customer()}/summary"),
+    ),
+    Scenario(
+        "get_wishlist",
+        "GET",
+        f"{BASE_URL}/<wishlist_id>",
+        200,
+        lambda d, ds: Request("GET", wishlist_path(ds)),
+    ),
+    Scenario(
+        "get_wishlist_expanded",
+        "GET",
+        f"{BASE_URL}/<wishlist_id>",
+        200,
+        lambda d, ds: Request("GET", wishlist_path(ds, "?expand=items")),
+    ),
+    Scenario(
+        "get_wishlist_not_modified",
+        "GET",
+        f"{BASE_URL}/<wishlist_id>",
+        304,
+        wishlist_not_modified,
+    ),
+    Scenario(
+        "rename_wishlist",
+        "PUT",
+        f"{BASE_URL}/<wishlist_id>",
+        200,
+        lambda d, ds: Request("PUT", wishlist_path(ds), {"name": "renamed"}),
+    ),
+    Scenario(
+        "delete_wishlist",
+        "DELETE",
+        f"{BASE_URL}/<wishlist_id>",
+        204,
+        lambda d, ds: Request("DELETE", f"{BASE_URL}/{new_wishlist(d, ds, items=5)}"),
+    ),
+    Scenario(
+        "clear_wishlist",
+        "PUT",
+        f"{BASE_URL}/<wishlist_id>/clear",
+        204,
+        lambda d, ds: Request(
+            "PUT", f"{BASE_URL}/{new_wishlist(d, ds, items=5)}/clear"
+        ),
+    ),
+    Scenario(
+        "list_items",
+        "GET",
+        f"{BASE_URL}/<int:wishlist_id>/items",
+        200,
+        lambda d, ds: Request("GET", wishlist_path(ds, "/items")),
+    ),
+    Scenario(
+        "create_item",
+        "POST",
+        f"{BASE_URL}/<int:wishlist_id>/items",
+        201,
+        lambda d, ds: Request("POST", wishlist_path(ds, "/items"), item_bodies(1)[0]),
+    ),
+    Scenario(
+        "delete_items",
+        "DELETE",
+        f"{BASE_URL}/<int:wishlist_id>/items",
+        204,
+        lambda d, ds: Request(
+            "DELETE", f"{BASE_URL}/{new_wishlist(d, ds, items=5)}/items"
+        ),
+    ),
+    Scenario(
+        "create_items_batch",
+        "POST",
+        f"{BASE_URL}/<int:wishlist_id>/items/batch",
+        201,
+        lambda d, ds: Request(
+            "POST", wishlist_path(ds, "/items/batch"), item_bodies(20)
+        ),
+    ),
+    Scenario(
+        "get_item",
+        "GET",
+        f"{BASE_URL}/<int:wishlist_id>/items/<int:item_id>",
+        200,
+        lambda d, ds: Request("GET", item_path(ds)),
+    ),
+    Scenario(
+        "update_item",
+        "PUT",
+        f"{BASE_URL}/<int:wishlist_id>/items/<int:item_id>",
+        202,
+        lambda d, ds: Request("PUT", item_path(ds), {"product_name": "renamed"}),
+    ),
+    Scenario(
+        "reorder_items",
+        "PUT",
+        f"{BASE_URL}/<int:wishlist_id>/items/order",
+        200,
+        reorder_request,
+    ),
+    Scenario(
+        "move_item",
+        "PUT",
+        f"{BASE_URL}/<int:wishlist_id>/items/<int:item_id>/move",
+        200,
+        move_request,
+    ),
+    Scenario(
+        "copy_items",
+        "POST",
+        f"{BASE_URL}/<int:wishlist_id>/items/copy",
+        200,
+        transfer_request("items/copy", "to"),
+    ),
+    Scenario(
+        "move_items",
+        "POST",
+        f"{BASE_URL}/<int:wishlist_id>/items/move",
+        200,
+        transfer_request("items/move", "to"),
+    ),
+    Scenario(
+        "merge_wishlist",
+        "POST",
+        f"{BASE_URL}/<int:wishlist_id>/merge",
+        200,
+        transfer_request("merge", "into"),
+    ),
+    Scenario(
+        "delete_item",
+        "DELETE",
+        f"{BASE_URL}/<int:wishlist_id>/items/<int:item_id>",
+        204,
+        lambda d, ds: Request("DELETE", new_item_path(d, ds)),
+    ),
+]
@@ -0,0 +1,163 @@
+"""
+Gunicorn configuration
+
+Gunicorn reads this file from the working directory when it starts.
+Settings given on the command line, like in the Procfile, take precedence.
+
+The server profile is sized to the host: the worker processes and their
+threads follow the CPUs this process may use and the memory it may take,
+both capped by the cgroup limits of its container. The environment can
+override every choice:
+
+    GUNICORN_WORKER_CLASS   sync, gthread (the default) or gevent
+    WEB_CONCURRENCY         the number of worker processes
+    GUNICORN_THREADS        the threads of each gthread worker
+    GUNICORN_WORKER_CONNECTIONS  the requests each gevent worker takes at once
+    GUNICORN_WORKER_MEMORY_MB    the memory budgeted per worker
+    GUNICORN_PRELOAD        load the app once in the master, true by default
+"""
+import glob
+import math
+import os
+import sys
+import tempfile
+
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+
+if worker_class == "gevent":
+    # patched before anything else is imported, including the preloaded app
+    from gevent import monkey  # pylint: disable=import-error
+
+    monkey.patch_all()
+    try:
+        # without it every query blocks all of the greenlets of the worker
+        from psycogreen.gevent import patch_psycopg  # pylint: disable=import-error
+
+        patch_psycopg()
+    except ImportError:
+        pass
+
+# The workers share their Prometheus metrics through files in this directory,
+# which must be set before prometheus_client is imported
+os.environ.setdefault(
+    "PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "wishlists-metrics")
+)
+
+# pylint: disable=wrong-import-position
+from prometheus_client import multiprocess  # noqa: E402
+
+CGROUP = "/sys/fs/cgroup"
+UNLIMITED = 2**60  # cgroup v1 reports no memory limit as a huge number
+
+
+def read_first(*paths):
+    """Returns the stripped content of the first of the files that exists"""
+    for path in paths:
+        try:
+            with open(path, encoding="ascii") as file:
+                return file.read().strip()
+        except OSError:
+            continue
+    return None
+
+
+def cpu_limit(cgroup=CGROUP):
+    """Returns the CPUs this process may use, capped by its cgroup quota"""
+    if hasattr(os, "sched_getaffinity"):
+        cpus = len(os.sched_getaffinity(0))
+    else:
+        cpus = os.cpu_count() or 1
+    quota = read_first(os.path.join(cgroup, "cpu.max"))  # cgroup v2
+    if quota:
+        limit, period = quota.split()
+    else:
+        limit = read_first(os.path.join(cgroup, "cpu", "cpu.cfs_quota_us"))
+        period = read_first(os.path.join(cgroup, "cpu", "cpu.cfs_period_us"))
+    if limit and period and limit not in ("max", "-1"):
+        cpus = min(cpus, math.ceil(int(limit) / int(period)))
+    return max(cpus, 1)
+
+
+def memory_limit(cgroup=CGROUP):
+    """Returns the memory limit of the cgroup of this process in bytes, or None"""
+    limit = read_first(
+        os.path.join(cgroup, "memory.max"),
+        os.path.join(cgroup, "memory", "memory.limit_in_bytes"),
+    )
+    if not limit or limit == "max" or int(limit) >= UNLIMITED:
+        return None
+    return int(limit)
+
+
+def server_profile(kind, cpus, memory=None, worker_memory=128 * 2**20):
+    """
+    Returns the (workers, threads) for a worker class on a host
+
+    Sync workers handle one request at a time, so there are two per CPU
+    to keep the CPUs busy while others wait on the database. A gthread
+    worker waits on the database in one thread while running Python in
+    another, so fewer processes with 4 threads each do the same with less
+    memory. A gevent worker switches greenlets while waiting, one process
+    per CPU is enough. The workers are capped by the memory limit.
+    """
+    if kind == "sync":
+        workers, threads = 2 * cpus + 1, 1
+    elif kind == "gthread":
+        workers, threads = cpus + 1, 4
+    else:
+        workers, threads = cpus + 1, 1
+    if memory:
+        workers = min(workers, max(memory // worker_memory, 1))
+    return workers, threads
+
+
+default_workers, default_threads = server_profile(
+    worker_class,
+    cpu_limit(),
+    memory_limit(),
+    int(os.getenv("GUNICORN_WORKER_MEMORY_MB", "128")) * 2**20,
+)
+workers = int(os.getenv("WEB_CONCURRENCY", str(default_workers)))
+threads = int(os.getenv("GUNICORN_THREADS", str(default_threads)))
+worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", "100"))
+
+# Import the app, and run its migrations, once in the master rather than in
+# every worker at the same time; the workers share its memory pages
+preload_app = os.getenv("GUNICORN_PRELOAD", "true").lower() == "true"
+
+# Each thread of a worker holds a database connection while it works
+if worker_class == "gthread":
+    os.environ.setdefault("DB_POOL_SIZE", str(threads))
+
+
+def dispose_engine(close=True):
+    """Drops the pooled database connections of the preloaded app, if any"""
+    if "service" not in sys.modules:
+        return
+    from service import app  # pylint: disable=import-outside-toplevel
+    from service.models import db  # pylint: disable=import-outside-toplevel
+
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose(close=close)
+
+
+def on_starting(server):  # pylint: disable=unused-argument
+    """Empties the metrics directory of a previous run"""
+    directory = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    os.makedirs(directory, exist_ok=True)
+    for path in glob.glob(os.path.join(directory, "*.db")):
+        os.remove(path)
+    # the master serves no requests, it need not keep the preload's connections
+    dispose_engine()
+
+
+def post_fork(server, worker):  # pylint: disable=unused-argument
+    """Gives a worker its own connections instead of the ones of the master"""
+    # close=False leaves the sockets the worker inherited to the master
+    dispose_engine(close=False)
+
+
+def child_exit(server, worker):  # pylint: disable=unused-argument
+    """Drops the in flight gauges of a worker that exited"""
+    multiprocess.mark_process_dead(worker.pid)
@@ -39,8 +39,13 @@ app.config.from_object(config)
 
 # Dependencies require we import the routes AFTER the Flask app is created
 # pylint: disable=wrong-import-position, wrong-import-order, cyclic-import
-from service import routes, models  # noqa: F401, E402
+from service import routes, models, idempotency  # noqa: F401, E402
 from service.common import error_handlers, cli_commands  # noqa: F401, E402
+from service.common import metrics, query_stats  # noqa: E402
+
+# Count and time every request and its SQL statements
+metrics.init_metrics(app)
+query_stats.init_query_stats(app)
 
 # Set up logging for production
 log_handlers.init_logging(app, "gunicorn.error")
@@ -51,6 +56,7 @@ app.logger.info(70 * "*")
 
 try:
     models.init_db(app)  # make our sqlalchemy tables
+    idempotency.init_store(app)
 except Exception as error:  # pylint: disable=broad-except
     app.logger.critical("%s: Cannot continue", error)
     # gunicorn requires exit code 4 to stop spawning workers when they die
@@ -0,0 +1,135 @@
+######################################################################
+# Copyright 2016, 2022 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Caches
+
+In-process key/value caches with a common interface, so the backend can
+be picked by configuration. Every backend provides get, set, invalidate,
+invalidate_where, clear and stats.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    A thread safe cache bounded in size and in the age of its entries
+
+    When the cache is full the least recently used entry is evicted, and
+    an entry older than the time to live is treated as a miss.
+    """
+
+    def __init__(self, max_entries=4096, ttl=10.0, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Returns the value cached for a key, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= self._clock():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        """Caches the value of a key"""
+        with self._lock:
+            self._entries[key] = (self._clock() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        """Removes a key from the cache"""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def invalidate_where(self, predicate):
+        """Removes every key for which predicate(key, value) is true"""
+        with self._lock:
+            stale = [k for k, (_, v) in self._entries.items() if predicate(k, v)]
+            for key in stale:
+                del self._entries[key]
+
+    def clear(self):
+        """Removes every key from the cache"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Returns the counters of the cache"""
+        with self._lock:
+            return {
+                "backend": "lru",
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+            }
+
+
+class NullCache:
+    """A cache that never stores anything, every lookup is a miss"""
+
+    def __init__(self, **_):
+        self.misses = 0
+
+    def get(self, key):  # pylint: disable=unused-argument
+        """Returns None, nothing is ever cached"""
+        self.misses += 1
+        return None
+
+    def set(self, key, value):
+        """Does nothing"""
+
+    def invalidate(self, key):
+        """Does nothing"""
+
+    def invalidate_where(self, predicate):
+        """Does nothing"""
+
+    def clear(self):
+        """Does nothing"""
+
+    def stats(self):
+        """Returns the counters of the cache"""
+        return {"backend": "none", "hits": 0, "misses": self.misses}
+
+
+BACKENDS = {"lru": LRUCache, "none": NullCache}
+
+
+def create_cache(backend, **options):
+    """Creates a cache from the name of its backend and its options"""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown cache backend: {backend}")
+    return BACKENDS[backend](**options)
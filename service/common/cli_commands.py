@@ -1,8 +1,13 @@
 """
 Flask CLI Command Extensions
 """
-from service import app
-from service.models import db
+import os
+import click
+from sqlalchemy import create_engine
+from sqlalchemy.pool import NullPool
+from service import app, idempotency, importer, migrations
+from service.common import ndjson
+from service.models import Wishlists, db
 
 
 ######################################################################
@@ -18,3 +23,157 @@ def db_create():
     db.drop_all()
     db.create_all()
     db.session.commit()
+    migrations.upgrade(db)  # record the fresh schema as up to date
+
+
+######################################################################
+# Command to bulk load wishlists and items
+# Usage: flask import-wishlists wishlists.ndjson
+#        flask import-wishlists --table items items.csv
+######################################################################
+@app.cli.command("import-wishlists")
+@click.argument("source", type=click.File("r"), default="-")
+@click.option(
+    "--format",
+    "input_format",
+    type=click.Choice(importer.FORMATS),
+    default=None,
+    help="Format of the input, guessed from the file name by default.",
+)
+@click.option(
+    "--table",
+    type=click.Choice(importer.CSV_TABLES),
+    default="wishlists",
+    help="Table the rows of a CSV file go to.",
+)
+@click.option(
+    "--chunk-size",
+    type=click.IntRange(min=1),
+    default=10000,
+    help="Rows validated and written per transaction.",
+)
+def import_wishlists(source, input_format, table, chunk_size):
+    """
+    Loads wishlists and items from NDJSON or CSV. NDJSON has one wishlist
+    per line with its items nested, like the export. CSV has one row of
+    --table per line. Invalid rows are reported and skipped.
+    """
+    if input_format is None:
+        extension = os.path.splitext(source.name)[1].lower()
+        input_format = "csv" if extension == ".csv" else "ndjson"
+
+    def progress(stats):
+        click.echo(f"Imported {stats.rows} rows ({stats.rate:.0f} rows/s)", err=True)
+
+    def reject(number, reason):
+        click.echo(f"Line {number} rejected: {reason}", err=True)
+
+    stats = importer.import_file(
+        db.engine,
+        source,
+        input_format,
+        table,
+        chunk_size=chunk_size,
+        progress=progress,
+        reject=reject,
+    )
+    click.echo(
+        f"Imported {stats.wishlists} wishlists and {stats.items} items, "
+        f"rejected {stats.rejected} rows ({stats.rate:.0f} rows/s)",
+        err=True,
+    )
+
+
+######################################################################
+# Command to apply the pending schema migrations
+# Usage: flask db-upgrade
+######################################################################
+@app.cli.command("db-upgrade")
+def db_upgrade():
+    """Applies all of the pending schema migrations"""
+    engine = db.engine
+    if app.config["DB_PGBOUNCER"]:
+        uri = app.config["DB_MIGRATION_URI"]
+        if not uri:
+            raise click.ClickException(
+                "DB_MIGRATION_URI must reach the database directly, "
+                "not through pgbouncer"
+            )
+        engine = create_engine(uri, poolclass=NullPool)
+    try:
+        applied = migrations.upgrade(db, engine)
+        for version in applied:
+            click.echo(f"Applied migration {version}")
+        with engine.connect() as conn:
+            version = migrations.current_version(conn, db.metadata)
+    finally:
+        if engine is not db.engine:
+            engine.dispose()
+    click.echo(f"Database schema is at version {version}")
+
+
+######################################################################
+# Command to export all of the wishlists and their items
+# Usage: flask export [--output wishlists.ndjson]
+######################################################################
+@app.cli.command("export")
+@click.option(
+    "--output",
+    "-o",
+    type=click.File("w", lazy=False),
+    default="-",
+    help="File to write to, standard output by default.",
+)
+@click.option(
+    "--batch-size",
+    type=click.IntRange(min=1),
+    default=None,
+    help="Rows fetched at once, EXPORT_BATCH_SIZE by default.",
+)
+def export(output, batch_size):
+    """Writes every wishlist with its items as NDJSON, one wishlist per line"""
+    batch_size = batch_size or app.config["EXPORT_BATCH_SIZE"]
+    count = 0
+    with db.engine.connect() as conn:
+        for wishlist in Wishlists.export(conn, batch_size):
+            output.write(ndjson.dumps(wishlist))
+            count += 1
+    click.echo(f"Exported {count} wishlists", err=True)
+
+
+######################################################################
+# Command to recompute the totals of the items of wishlists
+# Usage: flask reconcile-totals [--batch-size 1000]
+######################################################################
+@app.cli.command("reconcile-totals")
+@click.option(
+    "--batch-size",
+    type=click.IntRange(min=1),
+    default=1000,
+    help="Wishlists locked and checked per transaction.",
+)
+def reconcile_totals(batch_size):
+    """Recomputes the item totals of every wishlist and corrects those that are off"""
+    checked = corrected = 0
+    for batch_checked, batch_corrected in Wishlists.reconcile_totals(batch_size):
+        checked += batch_checked
+        corrected += batch_corrected
+    click.echo(f"Checked {checked} wishlists, corrected {corrected}", err=True)
+
+
+######################################################################
+# Command to delete the expired idempotency keys
+# Usage: flask sweep-idempotency-keys [--batch-size 1000]
+######################################################################
+@app.cli.command("sweep-idempotency-keys")
+@click.option(
+    "--batch-size",
+    type=click.IntRange(min=1),
+    default=None,
+    help="Keys deleted per transaction, IDEMPOTENCY_SWEEP_BATCH by default.",
+)
+def sweep_idempotency_keys(batch_size):
+    """Deletes the Idempotency-Keys that have expired"""
+    batch_size = batch_size or app.config["IDEMPOTENCY_SWEEP_BATCH"]
+    deleted = idempotency.store.sweep(batch_size) if idempotency.store else 0
+    click.echo(f"Deleted {deleted} expired idempotency keys", err=True)
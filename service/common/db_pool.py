@@ -0,0 +1,90 @@
+######################################################################
+# Copyright 2016, 2022 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Database Connection Pool
+
+Turns the DB_* settings of the configuration into the create_engine options
+that Flask-SQLAlchemy reads from SQLALCHEMY_ENGINE_OPTIONS.
+
+By default the engine keeps a QueuePool of DB_POOL_SIZE connections, plus
+DB_MAX_OVERFLOW more under load, recycles connections older than
+DB_POOL_RECYCLE seconds and pings each one as it is checked out, so the
+connections left broken by a database failover are replaced instead of
+failing a request.
+
+With DB_PGBOUNCER on, pgbouncer in transaction pooling mode does the
+pooling: the engine opens a connection per checkout with NullPool and
+never prepares statements on the server, which a transaction pooler can't
+follow from one server connection to the next. psycopg2 never prepares
+statements, so there is nothing to turn off with it. Nor can it keep the
+session-level advisory lock that serializes the schema migrations, so the
+workers don't migrate on start behind pgbouncer: flask db-upgrade applies
+the migrations over DB_MIGRATION_URI, a direct connection to Postgres,
+before the new workers are started.
+
+DB_STATEMENT_TIMEOUT_MS cancels the statements that run longer on
+Postgres. It is a startup option of each connection, except behind
+pgbouncer, which refuses startup options and shares server sessions
+between clients, so there it is SET LOCAL at the start of each transaction.
+"""
+from sqlalchemy import event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.pool import NullPool
+
+STATEMENT_TIMEOUT_OPTION = "statement_timeout_ms"
+
+
+def init_pool(app):
+    """Sets the engine options of the app from its DB_* settings"""
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(app.config)
+    if not event.contains(Engine, "begin", set_statement_timeout):
+        event.listen(Engine, "begin", set_statement_timeout)
+
+
+def engine_options(config):
+    """
+    Returns the create_engine options for the database of a configuration
+
+    SQLite gets none, Flask-SQLAlchemy already picks the pool it needs.
+    """
+    url = make_url(config["SQLALCHEMY_DATABASE_URI"])
+    if url.get_backend_name() == "sqlite":
+        return {}
+    timeout = config["DB_STATEMENT_TIMEOUT_MS"]
+    postgres = url.get_backend_name() == "postgresql"
+    if config["DB_PGBOUNCER"]:
+        options = {"poolclass": NullPool}
+        if timeout and postgres:
+            options["execution_options"] = {STATEMENT_TIMEOUT_OPTION: timeout}
+        return options
+    options = {
+        "pool_size": config["DB_POOL_SIZE"],
+        "max_overflow": config["DB_MAX_OVERFLOW"],
+        "pool_timeout": config["DB_POOL_TIMEOUT"],
+        "pool_recycle": config["DB_POOL_RECYCLE"],
+        "pool_pre_ping": config["DB_POOL_PRE_PING"],
+    }
+    if timeout and postgres:
+        options["connect_args"] = {"options": f"-c statement_timeout={timeout}"}
+    return options
+
+
+def set_statement_timeout(conn):
+    """Limits the statements of a transaction, when the engine asks for it"""
+    timeout = conn.get_execution_options().get(STATEMENT_TIMEOUT_OPTION)
+    if timeout:
+        conn.exec_driver_sql(f"SET LOCAL statement_timeout = {int(timeout)}")
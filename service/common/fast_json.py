@@ -0,0 +1,132 @@
+######################################################################
+# Copyright 2016, 2022 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Fast JSON
+
+Encodes query rows straight into a JSON response, without building models,
+serialized dicts and marshalled dicts first. An encoder is compiled once
+per Flask-RESTX model into a function that turns a row mapping into the
+dict API.marshal would return for it, so the Swagger models remain the
+contract. The dicts are then dumped with orjson when it is installed, or
+with the json module.
+"""
+import json
+from flask import current_app
+from flask_restx import fields
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+MEDIA_TYPE = "application/json"
+
+
+def dumps(value):
+    """Returns a value as compact JSON bytes"""
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, separators=(",", ":")).encode("utf-8")
+
+
+def response(value, status=200, headers=None):
+    """Returns a JSON response with a value, dumped without marshalling it"""
+    return current_app.response_class(
+        dumps(value), status=status, headers=headers, mimetype=MEDIA_TYPE
+    )
+
+
+######################################################################
+#  E N C O D E R S
+######################################################################
+
+
+# Encoders compiled by encoder(), by model name, skip_none and fields
+encoders = {}
+
+
+def encoder(model, skip_none=False, only=None):
+    """Returns the encoder of a model and subset of its fields, compiled once"""
+    key = (model.name, skip_none, only)
+    if key not in encoders:
+        encoders[key] = compile_encoder(model, skip_none, only)
+    return encoders[key]
+
+
+def compile_encoder(model, skip_none=False, only=None):
+    """
+    Compiles a function that marshals a row mapping like API.marshal would
+
+    Args:
+        model (Model): the Flask-RESTX model of the response
+        skip_none (bool): leave out the keys whose value is None, like the
+            skip_none argument of API.marshal
+        only (tuple): the names of the fields to output, all of them when None
+    Returns:
+        function: takes a mapping, like a dict or the _mapping of a Row, and
+        returns the dict of the model
+    """
+    namespace = {}
+    lines = ["def encode(row):", "    out = {}"]
+    for index, (key, field) in enumerate(model.resolved.items()):
+        if only is not None and key not in only:
+            continue
+        value = f"value{index}"
+        if callable(field.attribute):
+            namespace[f"attribute{index}"] = field.attribute
+            lines.append(f"    {value} = attribute{index}(row)")
+        else:
+            lines.append(f"    {value} = row.get({field.attribute or key!r})")
+        if field.default is not None:
+            if callable(field.default):
+                raise TypeError(f"No fast encoder for the callable default of {key}")
+            lines.append(f"    if {value} is None:")
+            lines.append(f"        {value} = {field.default!r}")
+        converted = field_expression(field, value, index, namespace)
+        if skip_none:
+            lines.append(f"    if {value} is not None:")
+            lines.append(f"        out[{key!r}] = {converted}")
+        else:
+            lines.append(f"    out[{key!r}] = None if {value} is None else {converted}")
+    lines.append("    return out")
+    exec("\n".join(lines), namespace)  # pylint: disable=exec-used
+    return namespace["encode"]
+
+
+def field_expression(field, value, index, namespace):
+    """Returns the Python expression that formats a value as a field would"""
+    if isinstance(field, fields.List) and isinstance(field.container, fields.Nested):
+        namespace[f"nested{index}"] = nested_encoder(field.container)
+        return f"[nested{index}(element) for element in {value}]"
+    for field_type, converter in CONVERTERS:
+        if isinstance(field, field_type):
+            return f"{converter}({value})"
+    raise TypeError(f"No fast encoder for {type(field).__name__} fields")
+
+
+def nested_encoder(field):
+    """Compiles the encoder of the model of a Nested field in a List"""
+    return compile_encoder(field.nested, field.skip_none)
+
+
+# the same conversions as the format methods of the fields
+CONVERTERS = [
+    (fields.Integer, "int"),
+    (fields.Float, "float"),
+    (fields.Boolean, "bool"),
+    (fields.String, "str"),
+]
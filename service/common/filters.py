@@ -0,0 +1,141 @@
+######################################################################
+# Copyright 2016, 2022 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Collection Filters
+
+Turns the query parameters of a collection route into the WHERE and ORDER BY
+clauses of a single SQL query. A FilterSet names the columns of a model that
+can be filtered and sorted on:
+
+    equal   name=x, or id=1,2,3 to match any of several integers
+    ranges  price_min=10&price_max=20, both bounds included
+    sort    sort=price, or sort=-price for the descending order
+
+Every filter given applies, so they combine freely.
+"""
+from flask_restx import inputs
+from sqlalchemy import DateTime, Integer
+
+
+def local_datetime(value):
+    """Parses an ISO 8601 date or time into the naive local time of the columns"""
+    value = inputs.datetime_from_iso8601(value)
+    if value.tzinfo is not None:
+        value = value.astimezone().replace(tzinfo=None)
+    return value
+
+
+local_datetime.__schema__ = {"type": "string", "format": "date-time"}
+
+
+def argument_type(column):
+    """Returns the reqparse type that parses the values of a column"""
+    if isinstance(column.type, Integer):
+        return int
+    if isinstance(column.type, DateTime):
+        return local_datetime
+    return str
+
+
+class FilterSet:
+    """
+    The filters and sort orders accepted by the collection of a model
+
+    Args:
+        equal (list): the columns matched by equality, integer ones also
+            take a comma separated list of values
+        ranges (list): the columns with _min and _max bounds
+        sort (list): the columns the collection can be sorted by, they
+            should not be nullable for the keyset pagination
+
+    The columns may be those of a model class body, whose keys are only set
+    once the class is mapped, so the keys are read as the filters are used.
+    """
+
+    def __init__(self, equal=(), ranges=(), sort=()):
+        self.equal = list(equal)
+        self.ranges = list(ranges)
+        self.sort = list(sort)
+
+    def add_arguments(self, parser):
+        """Adds the arguments of the filters to a request parser"""
+        for column in self.equal:
+            if isinstance(column.type, Integer):
+                parser.add_argument(
+                    column.key,
+                    type=int,
+                    action="split",
+                    location="args",
+                    required=False,
+                    help=f"The {column.key} to match, or a comma separated list.",
+                )
+            else:
+                parser.add_argument(
+                    column.key,
+                    type=argument_type(column),
+                    location="args",
+                    required=False,
+                    help=f"The {column.key} to match.",
+                )
+        for column in self.ranges:
+            for bound in ("min", "max"):
+                parser.add_argument(
+                    f"{column.key}_{bound}",
+                    type=argument_type(column),
+                    location="args",
+                    required=False,
+                    help=f"The {bound}imum {column.key}, included.",
+                )
+        if self.sort:
+            parser.add_argument(
+                "sort",
+                type=str,
+                location="args",
+                required=False,
+                choices=[p + c.key for c in self.sort for p in ("", "-")],
+                help="The field to sort by, with a - in front for descending order.",
+            )
+        return parser
+
+    def apply(self, query, args):
+        """Returns a query filtered by the arguments parsed from a request"""
+        for column in self.equal:
+            value = args.get(column.key)
+            if value is None:
+                continue
+            if not isinstance(value, list):
+                query = query.filter(column == value)
+            elif len(value) == 1:
+                query = query.filter(column == value[0])
+            else:
+                query = query.filter(column.in_(value))
+        for column in self.ranges:
+            low = args.get(f"{column.key}_min")
+            high = args.get(f"{column.key}_max")
+            if low is not None:
+                query = query.filter(column >= low)
+            if high is not None:
+                query = query.filter(column <= high)
+        return query
+
+    def sort_key(self, args):
+        """Returns the (column, descending) of the sort argument, or None"""
+        sort = args.get("sort")
+        if not sort:
+            return None
+        column = next(c for c in self.sort if c.key == sort.lstrip("-"))
+        return column, sort.startswith("-")
@@ -0,0 +1,159 @@
+######################################################################
+# Copyright 2016, 2022 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Prometheus Metrics
+
+Request counts, latencies and requests in flight per route, and the
+checkouts of the SQLAlchemy connection pools.
+
+Under gunicorn every worker is a separate process. When the
+PROMETHEUS_MULTIPROC_DIR environment variable names a directory, which
+gunicorn.conf.py sets up, each worker writes its samples to memory mapped
+files there and /metrics adds up the files of all of the workers.
+"""
+import os
+import time
+from flask import g, request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from sqlalchemy import event
+from sqlalchemy.pool import Pool
+
+MULTIPROC_DIR_VARIABLE = "PROMETHEUS_MULTIPROC_DIR"
+
+REQUESTS = Counter(
+    "http_requests_total",
+    "HTTP requests handled, by route, method and status",
+    ["endpoint", "method", "status"],
+)
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Time to handle an HTTP request, by route and method",
+    ["endpoint", "method"],
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "http_requests_in_flight",
+    "HTTP requests being handled, by route and method",
+    ["endpoint", "method"],
+    multiprocess_mode="livesum",
+)
+POOL_CHECKOUTS = Counter(
+    "db_pool_checkouts_total",
+    "Connections checked out of the SQLAlchemy pool",
+)
+POOL_CONNECTIONS = Counter(
+    "db_pool_connections_total",
+    "New database connections opened by the SQLAlchemy pool",
+)
+POOL_INVALIDATIONS = Counter(
+    "db_pool_invalidations_total",
+    "Pooled database connections found broken and discarded",
+)
+POOL_CHECKED_OUT = Gauge(
+    "db_pool_checked_out",
+    "Connections checked out of the SQLAlchemy pool right now",
+    multiprocess_mode="livesum",
+)
+
+
+def init_metrics(app):
+    """Instruments the requests of the app and the SQLAlchemy connection pools"""
+    app.before_request(start_request)
+    app.after_request(finish_request)
+    app.teardown_request(leave_request)
+    # pools are recreated with their engine, listening on the class sees them all
+    if not event.contains(Pool, "checkout", pool_checkout):
+        event.listen(Pool, "checkout", pool_checkout)
+        event.listen(Pool, "checkin", pool_checkin)
+        event.listen(Pool, "connect", pool_connect)
+        event.listen(Pool, "invalidate", pool_invalidate)
+
+
+def latest():
+    """Returns the metrics of all of the workers in the Prometheus text format"""
+    registry = REGISTRY
+    if os.environ.get(MULTIPROC_DIR_VARIABLE):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+######################################################################
+#  R E Q U E S T   H O O K S
+######################################################################
+
+
+def route_labels():
+    """Returns the route template and method of the request, unique routes only"""
+    endpoint = request.url_rule.rule if request.url_rule else "<unmatched>"
+    return endpoint, request.method
+
+
+def start_request():
+    """Starts timing a request"""
+    g.metrics_labels = route_labels()
+    g.metrics_started = time.perf_counter()
+    REQUESTS_IN_FLIGHT.labels(*g.metrics_labels).inc()
+
+
+def finish_request(response):
+    """Counts and times a request once its response is ready"""
+    if "metrics_started" in g:
+        elapsed = time.perf_counter() - g.metrics_started
+        REQUEST_LATENCY.labels(*g.metrics_labels).observe(elapsed)
+        REQUESTS.labels(*g.metrics_labels, str(response.status_code)).inc()
+    return response
+
+
+def leave_request(_):
+    """Takes a request out of flight, whatever happened to it"""
+    if "metrics_labels" in g:
+        REQUESTS_IN_FLIGHT.labels(*g.pop("metrics_labels")).dec()
+
+
+######################################################################
+#  P O O L   E V E N T S
+######################################################################
+
+
+def pool_checkout(dbapi_connection, connection_record, connection_proxy):
+    """Counts a connection leaving the pool"""
+    POOL_CHECKOUTS.inc()
+    POOL_CHECKED_OUT.inc()
+
+
+def pool_checkin(dbapi_connection, connection_record):
+    """Counts a connection back in the pool"""
+    POOL_CHECKED_OUT.dec()
+
+
+def pool_connect(dbapi_connection, connection_record):
+    """Counts a new database connection"""
+    POOL_CONNECTIONS.inc()
+
+
+def pool_invalidate(dbapi_connection, connection_record, exception):
+    """Counts a discarded connection"""
+    POOL_INVALIDATIONS.inc()
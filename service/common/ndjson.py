@@ -0,0 +1,71 @@
+######################################################################
+# Copyright 2016, 2022 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Newline delimited JSON
+
+One JSON document per line, so a stream of records can be written and
+read back one record at a time.
+"""
+import datetime
+import json
+
+MEDIA_TYPE = "application/x-ndjson"
+
+
+def encode_value(value):
+    """Encodes the values the json module does not know, like datetimes"""
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(record):
+    """Returns a record as one line of NDJSON, with its newline"""
+    return json.dumps(record, default=encode_value, separators=(",", ":")) + "\n"
+
+
+def iter_dumps(records, chunk_size=0):
+    """
+    Encodes a stream of records into a stream of NDJSON text
+
+    Args:
+        records (iterable): the records to encode
+        chunk_size (int): the lines are joined into chunks of at least this
+            many characters, so a response is not written one line at a time
+    """
+    chunk, size = [], 0
+    for record in records:
+        line = dumps(record)
+        chunk.append(line)
+        size += len(line)
+        if size >= chunk_size:
+            yield "".join(chunk)
+            chunk, size = [], 0
+    if chunk:
+        yield "".join(chunk)
+
+
+def iter_loads(lines):
+    """
+    Decodes a stream of NDJSON lines into a stream of records
+
+    Blank lines are skipped. Yields (line number, record) pairs so that
+    errors can be reported against the input.
+    """
+    for number, line in enumerate(lines, start=1):
+        if line.strip():
+            yield number, json.loads(line)
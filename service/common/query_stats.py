@@ -0,0 +1,154 @@
+######################################################################
+# Copyright 2016, 2022 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+SQL Query Statistics
+
+Counts and times the SQL statements of every request through SQLAlchemy
+engine events. With DB_QUERY_HEADERS on, the totals are returned in the
+X-DB-Query-Count and X-DB-Time-Ms response headers.
+
+Statements slower than SLOW_QUERY_MS, and statements a single request runs
+REPEATED_QUERY_THRESHOLD times or more (the mark of an N+1 query), are
+logged in normalized form with the route that ran them, on the
+flask.app.slow_query logger.
+"""
+import logging
+import re
+import time
+from collections import Counter
+from flask import g, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from service.common.metrics import route_labels
+
+logger = logging.getLogger("flask.app.slow_query")
+
+# Thresholds, set from the app configuration by init_query_stats()
+settings = {"headers": False, "slow_seconds": 0.1, "repeated": 10}
+
+
+class RequestQueries:
+    """The statements run by one request"""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = Counter()
+
+    def record(self, statement, seconds):
+        """Adds a statement that took some seconds"""
+        self.count += 1
+        self.seconds += seconds
+        self.statements[statement] += 1
+
+
+def init_query_stats(app):
+    """Counts the SQL statements of the requests of the app"""
+    settings["headers"] = app.config["DB_QUERY_HEADERS"]
+    settings["slow_seconds"] = app.config["SLOW_QUERY_MS"] / 1000
+    settings["repeated"] = app.config["REPEATED_QUERY_THRESHOLD"]
+    app.before_request(start_request)
+    app.after_request(finish_request)
+    # engines are recreated by init_app, listening on the class sees them all
+    if not event.contains(Engine, "before_cursor_execute", before_execute):
+        event.listen(Engine, "before_cursor_execute", before_execute)
+        event.listen(Engine, "after_cursor_execute", after_execute)
+        event.listen(Engine, "handle_error", execute_failed)
+
+
+######################################################################
+#  R E Q U E S T   H O O K S
+######################################################################
+
+
+def start_request():
+    """Starts counting the statements of a request"""
+    g.db_queries = RequestQueries()
+
+
+def finish_request(response):
+    """Reports the statements of a request"""
+    queries = g.pop("db_queries", None)
+    if queries is None:
+        return response
+    if settings["headers"]:
+        response.headers["X-DB-Query-Count"] = str(queries.count)
+        response.headers["X-DB-Time-Ms"] = f"{queries.seconds * 1000:.2f}"
+    for statement, times in queries.statements.items():
+        if times >= settings["repeated"]:
+            logger.warning(
+                "Repeated query x%d on %s %s: %s",
+                times,
+                *route_labels(),
+                normalize(statement),
+            )
+    return response
+
+
+######################################################################
+#  E N G I N E   E V E N T S
+######################################################################
+
+
+# pylint: disable=unused-argument,too-many-arguments
+def before_execute(conn, cursor, statement, parameters, context, executemany):
+    """Notes when a statement started"""
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def after_execute(conn, cursor, statement, parameters, context, executemany):
+    """Counts a statement and logs it when it was slow"""
+    seconds = time.perf_counter() - conn.info["query_started"].pop()
+    in_request = has_request_context()
+    if in_request and "db_queries" in g:
+        g.db_queries.record(statement, seconds)
+    if seconds >= settings["slow_seconds"]:
+        where = "on %s %s" % route_labels() if in_request else "outside a request"
+        logger.warning(
+            "Slow query %.1f ms %s: %s", seconds * 1000, where, normalize(statement)
+        )
+
+
+def execute_failed(context):
+    """Forgets the start of a statement that failed"""
+    if context.connection is not None:
+        started = context.connection.info.get("query_started")
+        if started:
+            started.pop()
+
+
+######################################################################
+#  N O R M A L I Z A T I O N
+######################################################################
+
+NORMALIZE_PATTERNS = [
+    # literals, and the bound parameters of the psycopg2 and sqlite drivers
+    (re.compile(r"'(?:[^']|'')*'"), "?"),
+    (re.compile(r"%\(\w+\)s|%s|(?<!:):\w+"), "?"),
+    (re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b"), "?"),
+    # lists of any length are the same statement
+    (re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)"), "(...)"),
+    (re.compile(r"\(\.\.\.\)(?:\s*,\s*\(\.\.\.\))+"), "(...)"),
+    (re.compile(r"\s+"), " "),
+]
+
+
+def normalize(statement):
+    """Returns a statement with its values taken out, so repeats look alike"""
+    for pattern, replacement in NORMALIZE_PATTERNS:
+        statement = pattern.sub(replacement, statement)
+    return statement.strip()
@@ -16,3 +16,56 @@ SQLALCHEMY_TRACK_MODIFICATIONS = False
 # Secret for session management
 SECRET_KEY = os.getenv("SECRET_KEY", "s3cr3t-key-shhhh")
 LOGGING_LEVEL = logging.INFO
+
+# Keyset pagination of the collection endpoints
+DEFAULT_PAGE_SIZE = int(os.getenv("DEFAULT_PAGE_SIZE", "100"))
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", "1000"))
+
+# Read-through cache of the single wishlist and item GETs, per worker process;
+# the writes always read their row from the database.
+# Backends are "lru" and "none"; entries expire after FINDER_CACHE_TTL seconds
+FINDER_CACHE = os.getenv("FINDER_CACHE", "lru")
+FINDER_CACHE_SIZE = int(os.getenv("FINDER_CACHE_SIZE", "4096"))
+FINDER_CACHE_TTL = float(os.getenv("FINDER_CACHE_TTL", "10"))
+
+# Cache of the customer summaries, per worker process. A summary is dropped
+# when a wishlist of the customer is written, item writes show up within
+# SUMMARY_CACHE_TTL seconds
+SUMMARY_CACHE = os.getenv("SUMMARY_CACHE", "lru")
+SUMMARY_CACHE_SIZE = int(os.getenv("SUMMARY_CACHE_SIZE", "4096"))
+SUMMARY_CACHE_TTL = float(os.getenv("SUMMARY_CACHE_TTL", "5"))
+
+# Idempotency-Key support of the create routes: the store is "sql", "memory"
+# or "none"; keys expire after IDEMPOTENCY_TTL seconds and are swept in
+# batches every IDEMPOTENCY_SWEEP_INTERVAL seconds, 0 for never. A request
+# holds its key for IDEMPOTENCY_LEASE seconds, longer than the gunicorn
+# timeout, before a retry may take over the key of a killed worker
+IDEMPOTENCY_STORE = os.getenv("IDEMPOTENCY_STORE", "sql")
+IDEMPOTENCY_TTL = int(os.getenv("IDEMPOTENCY_TTL", "86400"))
+IDEMPOTENCY_LEASE = int(os.getenv("IDEMPOTENCY_LEASE", "60"))
+IDEMPOTENCY_SWEEP_INTERVAL = float(os.getenv("IDEMPOTENCY_SWEEP_INTERVAL", "300"))
+IDEMPOTENCY_SWEEP_BATCH = int(os.getenv("IDEMPOTENCY_SWEEP_BATCH", "1000"))
+
+# Largest number of items accepted by one batch insert
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "1000"))
+
+# Rows fetched at once by the server-side cursor of the NDJSON export
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+
+# Per request SQL statistics: X-DB-Query-Count and X-DB-Time-Ms headers, and
+# a log of statements slower than SLOW_QUERY_MS or repeated by one request
+DB_QUERY_HEADERS = os.getenv("DB_QUERY_HEADERS", "false").lower() == "true"
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "100"))
+REPEATED_QUERY_THRESHOLD = int(os.getenv("REPEATED_QUERY_THRESHOLD", "10"))
+
+# SQLAlchemy connection pool, see service/common/db_pool.py. DB_PGBOUNCER
+# hands the pooling to pgbouncer in transaction mode
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "0"))
+DB_PGBOUNCER = os.getenv("DB_PGBOUNCER", "false").lower() == "true"
+# Direct connection to Postgres for flask db-upgrade, required with DB_PGBOUNCER
+DB_MIGRATION_URI = os.getenv("DB_MIGRATION_URI", "")
@@ -0,0 +1,418 @@
+"""
+Idempotency Keys
+
+Makes the create endpoints safe to retry. A client sends the same
+Idempotency-Key header with every attempt of one request. The first
+attempt claims the key and runs; its response is stored with the key and
+every later attempt gets that response back, without running again and
+without reading the wishlists or items.
+
+A key belongs to one request: reusing it with another method, path or
+body is refused with 422 Unprocessable Entity, and a retry that arrives
+while the first attempt still runs gets 409 Conflict. Attempts that fail
+with an exception or a 5xx status release the key so they can be retried.
+An attempt holds its key for IDEMPOTENCY_LEASE seconds, longer than a
+request may run: once the lease is over without a response, the worker
+was killed mid-request and a retry takes the key over.
+
+Keys expire after IDEMPOTENCY_TTL seconds. The store is picked with
+IDEMPOTENCY_STORE:
+
+    sql     the idempotency_keys table, shared by all of the workers
+    memory  a dict per worker process, for a single process or testing
+    none    the header is ignored
+
+Expired keys are deleted in batches by a sweeper thread in each worker
+that served a keyed request, every IDEMPOTENCY_SWEEP_INTERVAL seconds, or
+with the flask sweep-idempotency-keys command.
+"""
+import datetime
+import functools
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import namedtuple
+from flask import abort, current_app, request
+from flask_restx.utils import unpack
+from sqlalchemy import (
+    Column,
+    DateTime,
+    Integer,
+    LargeBinary,
+    String,
+    Table,
+    Text,
+    and_,
+    or_,
+    select,
+)
+from sqlalchemy.exc import IntegrityError
+from service.common import status
+from service.models import db
+
+logger = logging.getLogger("flask.app")
+
+HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+MAX_KEY_LENGTH = 255
+
+# The headers of a response that are stored and replayed with its body
+STORED_HEADERS = ("Content-Type", "Location", "ETag", "Last-Modified")
+
+# A claimed key, status is None until the first attempt has its response,
+# which has until locked_until to store it
+Record = namedtuple("Record", "fingerprint status headers body expires_on locked_until")
+
+idempotency_keys = Table(
+    "idempotency_keys",
+    db.metadata,
+    Column("key", String(MAX_KEY_LENGTH), primary_key=True),
+    Column("fingerprint", String(64), nullable=False),
+    Column("status", Integer),
+    Column("headers", Text),
+    Column("body", LargeBinary),
+    Column("expires_on", DateTime, nullable=False, index=True),
+    Column("locked_until", DateTime),
+)
+
+
+######################################################################
+#  S T O R E S
+######################################################################
+
+
+class SqlStore:
+    """Keeps the keys in the idempotency_keys table"""
+
+    def __init__(self, engine_source=lambda: db.engine):
+        # the engine is looked up as it is used, db.engine needs the app
+        self._engine = engine_source
+
+    def claim(self, key, fingerprint, ttl, lease):
+        """
+        Claims a key for a new request, or returns the Record of its first one
+
+        The key is inserted and committed at once, in its own transaction,
+        so concurrent attempts see it while the first one runs. An expired
+        key is replaced, and so is a claim left without a response when its
+        lease ran out.
+
+        Args:
+            key (str): the Idempotency-Key of the request
+            fingerprint (str): the digest of the request
+            ttl (int): the seconds the response is kept for
+            lease (int): the seconds the request has to store its response
+        Returns:
+            Record: the existing claim, or None when this request got the key
+        """
+        table = idempotency_keys
+        for _ in range(3):
+            now = datetime.datetime.now()
+            try:
+                with self._engine().begin() as conn:
+                    conn.execute(
+                        table.delete().where(
+                            table.c.key == key,
+                            or_(
+                                table.c.expires_on <= now,
+                                and_(
+                                    table.c.status.is_(None),
+                                    table.c.locked_until <= now,
+                                ),
+                            ),
+                        )
+                    )
+                    conn.execute(
+                        table.insert().values(
+                            key=key,
+                            fingerprint=fingerprint,
+                            expires_on=now + datetime.timedelta(seconds=ttl),
+                            locked_until=now + datetime.timedelta(seconds=lease),
+                        )
+                    )
+                return None
+            except IntegrityError:
+                with self._engine().connect() as conn:
+                    row = conn.execute(select(table).where(table.c.key == key)).first()
+                if row is not None:
+                    return record(row)
+        raise RuntimeError(f"Could not claim the idempotency key {key}")
+
+    def complete(self, key, status_code, headers, body):
+        """Stores the response of the request that claimed a key"""
+        table = idempotency_keys
+        with self._engine().begin() as conn:
+            conn.execute(
+                table.update()
+                .where(table.c.key == key)
+                .values(
+                    status=status_code,
+                    headers=json.dumps(headers),
+                    body=body,
+                    locked_until=None,
+                )
+            )
+
+    def release(self, key):
+        """Gives up a claim, so the request can be retried"""
+        table = idempotency_keys
+        with self._engine().begin() as conn:
+            conn.execute(table.delete().where(table.c.key == key))
+
+    def sweep(self, batch_size=1000):
+        """
+        Deletes the expired keys, batch_size keys per transaction
+
+        Returns:
+            int: the number of keys deleted
+        """
+        table = idempotency_keys
+        deleted = 0
+        while True:
+            expired = (
+                select(table.c.key)
+                .where(table.c.expires_on <= datetime.datetime.now())
+                .limit(batch_size)
+            )
+            with self._engine().begin() as conn:
+                keys = conn.execute(expired).scalars().all()
+                if keys:
+                    conn.execute(table.delete().where(table.c.key.in_(keys)))
+            deleted += len(keys)
+            if len(keys) < batch_size:
+                return deleted
+
+
+class MemoryStore:
+    """Keeps the keys in a dict of the worker process"""
+
+    def __init__(self, clock=datetime.datetime.now):
+        self._clock = clock
+        self._records = {}
+        self._lock = threading.Lock()
+
+    def claim(self, key, fingerprint, ttl, lease):
+        """Claims a key for a new request, or returns the Record of its first one"""
+        with self._lock:
+            now = self._clock()
+            existing = self._records.get(key)
+            if (
+                existing is not None
+                and existing.expires_on > now
+                and (existing.status is not None or existing.locked_until > now)
+            ):
+                return existing
+            self._records[key] = Record(
+                fingerprint,
+                None,
+                None,
+                None,
+                now + datetime.timedelta(seconds=ttl),
+                now + datetime.timedelta(seconds=lease),
+            )
+            return None
+
+    def complete(self, key, status_code, headers, body):
+        """Stores the response of the request that claimed a key"""
+        with self._lock:
+            claimed = self._records[key]
+            self._records[key] = claimed._replace(
+                status=status_code, headers=headers, body=body, locked_until=None
+            )
+
+    def release(self, key):
+        """Gives up a claim, so the request can be retried"""
+        with self._lock:
+            self._records.pop(key, None)
+
+    def sweep(self, batch_size=1000):
+        """Deletes the expired keys, batch_size keys at a time"""
+        deleted = 0
+        while True:
+            with self._lock:
+                now = self._clock()
+                expired = [
+                    key
+                    for key, claimed in self._records.items()
+                    if claimed.expires_on <= now
+                ][:batch_size]
+                for key in expired:
+                    del self._records[key]
+            deleted += len(expired)
+            if len(expired) < batch_size:
+                return deleted
+
+
+STORES = {"sql": SqlStore, "memory": MemoryStore, "none": lambda: None}
+
+# The store of the keys, configured by init_store()
+store = None  # pylint: disable=invalid-name
+
+
+def init_store(app):
+    """Creates the key store from the app configuration"""
+    global store  # pylint: disable=global-statement,invalid-name
+    backend = app.config["IDEMPOTENCY_STORE"]
+    if backend not in STORES:
+        raise ValueError(f"Unknown idempotency store: {backend}")
+    store = STORES[backend]()
+
+
+def record(row):
+    """Returns the Record of a row of the idempotency_keys table"""
+    headers = json.loads(row.headers) if row.headers else None
+    return Record(
+        row.fingerprint,
+        row.status,
+        headers,
+        row.body,
+        row.expires_on,
+        row.locked_until,
+    )
+
+
+######################################################################
+#  S W E E P E R
+######################################################################
+
+
+class Sweeper:
+    """
+    Deletes the expired keys of the store in a daemon thread
+
+    The thread is started by the first keyed request of a process, so that
+    each forked worker gets its own one, and none runs in a preloading master.
+    """
+
+    def __init__(self):
+        self._pid = None
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def ensure_running(self, interval, batch_size):
+        """Starts the thread of this process unless it runs already"""
+        if interval <= 0 or self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._stopped = threading.Event()
+            app = current_app._get_current_object()  # pylint: disable=protected-access
+            thread = threading.Thread(
+                target=self._run,
+                args=(app, self._stopped, interval, batch_size),
+                name="idempotency-sweeper",
+                daemon=True,
+            )
+            thread.start()
+
+    def stop(self):
+        """Stops the thread of this process after its current sweep"""
+        with self._lock:
+            self._stopped.set()
+            self._pid = None
+
+    @staticmethod
+    def _run(app, stopped, interval, batch_size):
+        """Sweeps the store every interval seconds until stopped"""
+        while not stopped.wait(interval):
+            with app.app_context():
+                try:
+                    deleted = store.sweep(batch_size) if store else 0
+                except Exception:  # pylint: disable=broad-except
+                    logger.exception("Sweeping the idempotency keys failed")
+                    continue
+            if deleted:
+                logger.info("Deleted %d expired idempotency keys", deleted)
+
+
+sweeper = Sweeper()
+
+
+######################################################################
+#  D E C O R A T O R
+######################################################################
+
+
+def fingerprint_request():
+    """Returns the digest of the method, path and body of the request"""
+    digest = hashlib.sha256()
+    for part in (request.method, request.full_path):
+        digest.update(part.encode("utf-8") + b"\0")
+    digest.update(request.get_data())
+    return digest.hexdigest()
+
+
+def idempotent(method):
+    """
+    Makes a Flask-RESTX resource method replay its response for a repeated key
+
+    It must be the outermost decorator, above the marshalling, so that it
+    stores the response exactly as it was sent.
+    """
+
+    @functools.wraps(method)
+    def wrapper(resource, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if key is None or store is None:
+            return method(resource, *args, **kwargs)
+        if not key or len(key) > MAX_KEY_LENGTH:
+            abort(
+                status.HTTP_400_BAD_REQUEST,
+                f"{HEADER} must have 1 to {MAX_KEY_LENGTH} characters.",
+            )
+        config = current_app.config
+        sweeper.ensure_running(
+            config["IDEMPOTENCY_SWEEP_INTERVAL"], config["IDEMPOTENCY_SWEEP_BATCH"]
+        )
+        fingerprint = fingerprint_request()
+        claimed = store.claim(
+            key, fingerprint, config["IDEMPOTENCY_TTL"], config["IDEMPOTENCY_LEASE"]
+        )
+        if claimed is not None:
+            return replay(key, fingerprint, claimed)
+
+        try:
+            response = method(resource, *args, **kwargs)
+            if not isinstance(response, current_app.response_class):
+                data, code, headers = unpack(response)
+                response = resource.api.make_response(data, code, headers=headers)
+        except Exception:
+            store.release(key)
+            raise
+        if response.status_code >= 500 or response.is_streamed:
+            store.release(key)
+            return response
+        headers = {
+            name: response.headers[name]
+            for name in STORED_HEADERS
+            if name in response.headers
+        }
+        store.complete(key, response.status_code, headers, response.get_data())
+        return response
+
+    return wrapper
+
+
+def replay(key, fingerprint, claimed):
+    """Returns the stored response of a key, or aborts when it cannot be replayed"""
+    if claimed.fingerprint != fingerprint:
+        logger.warning("Idempotency key %s reused for another request", key)
+        abort(
+            status.HTTP_422_UNPROCESSABLE_ENTITY,
+            f"The {HEADER} was already used for another request.",
+        )
+    if claimed.status is None:
+        abort(
+            status.HTTP_409_CONFLICT,
+            f"A request with this {HEADER} is still in progress.",
+        )
+    logger.info("Replaying the response of idempotency key %s", key)
+    response = current_app.response_class(
+        claimed.body, status=claimed.status, headers=claimed.headers
+    )
+    response.headers[REPLAYED_HEADER] = "true"
+    return response
@@ -0,0 +1,389 @@
+"""
+Bulk Import
+
+Loads wishlists and items from NDJSON or CSV files, in chunks. Each chunk
+is validated with the same rules as the REST API, through
+Wishlists.deserialize and Items.deserialize, then written with one
+COPY FROM STDIN per table on Postgres, or one executemany elsewhere, and
+committed.
+
+The NDJSON input has one wishlist per line with its items nested under
+"items", which is what the export writes. A CSV file holds the rows of a
+single table, with a header line naming the columns.
+"""
+import csv
+import datetime
+import io
+import json
+import time
+from sqlalchemy import Integer, func, select, text
+from service.models import (
+    DataValidationError,
+    Items,
+    Wishlists,
+    item_totals,
+    new_row_values,
+    update_wishlists,
+)
+
+FORMATS = ("ndjson", "csv")
+CSV_TABLES = ("wishlists", "items")
+
+
+class ImportStats:
+    """Counts the rows of an import as it goes"""
+
+    def __init__(self, clock=time.monotonic):
+        self._clock = clock
+        self.started = clock()
+        self.wishlists = 0
+        self.items = 0
+        self.rejected = 0
+
+    @property
+    def rows(self):
+        """The number of rows written so far"""
+        return self.wishlists + self.items
+
+    @property
+    def rate(self):
+        """The rows written per second so far"""
+        elapsed = self._clock() - self.started
+        return self.rows / elapsed if elapsed > 0 else 0.0
+
+
+def import_file(engine, lines, input_format, table="wishlists", **options):
+    """
+    Imports the wishlists and items of an NDJSON or CSV file
+
+    Args:
+        engine (Engine): the database to load into
+        lines (iterable): the lines of the file
+        input_format (string): "ndjson" or "csv"
+        table (string): the table the rows of a CSV file go to
+        options: passed to import_records
+    Returns:
+        ImportStats: the final counts
+    """
+    if input_format == "csv":
+        records = read_csv(lines, table)
+    else:
+        records = read_ndjson(lines)
+    return import_records(engine, records, **options)
+
+
+def read_ndjson(lines):
+    """
+    Yields (line number, table, record) for each wishlist of an NDJSON file
+
+    A line that is not JSON yields a DataValidationError as its record, so
+    it is rejected like any other invalid record instead of ending the import.
+    """
+    for number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as error:
+            record = DataValidationError(f"Invalid JSON: {error}")
+        yield number, "wishlists", record
+
+
+def read_csv(lines, table):
+    """Yields (line number, table, record) for each row of a CSV file"""
+    reader = csv.DictReader(lines)
+    for record in reader:
+        yield reader.line_num, table, record
+
+
+def import_records(engine, records, chunk_size=10000, progress=None, reject=None):
+    """
+    Validates and loads a stream of records, one chunk at a time
+
+    Invalid records are skipped and reported, valid ones are loaded. Each
+    chunk is written and committed in its own transaction, so a failure
+    loses at most one chunk, and what was already loaded stays. The id
+    sequences are moved past the loaded ids even when the import fails.
+
+    Args:
+        engine (Engine): the database to load into
+        records (iterable): (line number, table, record) tuples
+        chunk_size (int): the number of rows written per transaction
+        progress (callable): called with the ImportStats after every chunk
+        reject (callable): called with the line number and the reason of
+            every invalid record
+    Returns:
+        ImportStats: the final counts
+    """
+    stats = ImportStats()
+    reject = reject or (lambda number, reason: None)
+    chunk = Chunk()
+    try:
+        for number, table, record in records:
+            try:
+                if isinstance(record, DataValidationError):
+                    raise record
+                if table == "wishlists":
+                    chunk.add_wishlist(number, record)
+                else:
+                    chunk.add_item(number, record)
+            except DataValidationError as error:
+                stats.rejected += 1
+                reject(number, str(error))
+            if chunk.size >= chunk_size:
+                chunk.load(engine, stats, reject)
+                chunk = Chunk()
+                if progress:
+                    progress(stats)
+        if chunk.size:
+            chunk.load(engine, stats, reject)
+            if progress:
+                progress(stats)
+    finally:
+        # committed chunks may have given ids past the sequences
+        with engine.begin() as conn:
+            reset_id_sequence(conn, Wishlists.__table__)
+            reset_id_sequence(conn, Items.__table__)
+    return stats
+
+
+class Chunk:
+    """The validated rows of one transaction"""
+
+    def __init__(self):
+        self.wishlists = []  # (row, nested item rows)
+        self.items = []  # (line number, row) of items of existing wishlists
+        self.size = 0
+
+    def add_wishlist(self, number, record):
+        """Validates a wishlist and its nested items"""
+        if not isinstance(record, dict):
+            raise DataValidationError(
+                f"Invalid Wishlist: line {number} is not an object"
+            )
+        record = integer_values(record, Wishlists.__table__)
+        row = given_values(record, new_row_values(Wishlists().deserialize(record)))
+        check_constraints(row, Wishlists.__table__, "Wishlist")
+        nested = record.get("items") or []
+        if not isinstance(nested, list) or not all(isinstance(i, dict) for i in nested):
+            raise DataValidationError(
+                "Invalid Wishlist: items must be an array of objects"
+            )
+        # the items are valid whatever wishlist id they will belong to
+        items = [item_row(dict(item, wishlist_id=0)) for item in nested]
+        self.wishlists.append((row, items))
+        self.size += 1 + len(items)
+
+    def add_item(self, number, record):
+        """Validates an item, its wishlist is checked when the chunk is loaded"""
+        record = integer_values(record, Items.__table__)
+        self.items.append((number, item_row(record)))
+        self.size += 1
+
+    def load(self, engine, stats, reject):
+        """Writes the rows of the chunk and commits them"""
+        with engine.begin() as conn:
+            wishlist_rows = [row for row, _ in self.wishlists]
+            assign_ids(conn, Wishlists.__table__, wishlist_rows)
+            item_rows = [
+                dict(item, wishlist_id=row["id"])
+                for row, items in self.wishlists
+                for item in items
+            ]
+            added = self.existing_wishlist_items(conn, stats, reject)
+            item_rows.extend(added)
+            assign_ids(conn, Items.__table__, item_rows)
+            # new wishlists are inserted with the totals of their nested items
+            for row, items in self.wishlists:
+                totals = item_totals(total_rows(items, row["id"])).get(row["id"])
+                if totals is not None:
+                    row.update(totals._asdict())
+            bulk_insert(conn, Wishlists.__table__, wishlist_rows)
+            bulk_insert(conn, Items.__table__, item_rows)
+            totals = item_totals(total_rows(added))
+            update_wishlists(conn, totals, totals)
+        stats.wishlists += len(wishlist_rows)
+        stats.items += len(item_rows)
+
+    def existing_wishlist_items(self, conn, stats, reject):
+        """Returns the item rows whose wishlist exists, rejecting the others"""
+        if not self.items:
+            return []
+        table = Wishlists.__table__
+        wanted = {row["wishlist_id"] for _, row in self.items}
+        found = set(
+            conn.execute(select(table.c.id).where(table.c.id.in_(wanted))).scalars()
+        )
+        rows = []
+        for number, row in self.items:
+            if row["wishlist_id"] in found:
+                rows.append(row)
+            else:
+                stats.rejected += 1
+                reject(
+                    number, f"Invalid wishlist id : {row['wishlist_id']} doesn't exist"
+                )
+        return rows
+
+
+######################################################################
+#  V A L I D A T I O N
+######################################################################
+
+
+def item_row(record):
+    """Validates an item record and returns the row to insert"""
+    item = Items().deserialize(record, verify_wishlist=False)
+    row = given_values(record, new_row_values(item))
+    check_constraints(row, Items.__table__, "Item")
+    return row
+
+
+def check_constraints(row, table, kind):
+    """
+    Rejects the values of a row that the table would refuse
+
+    Deserialize lets some through, like a null name, and a row refused by
+    the database would fail its whole chunk.
+    """
+    for column in table.columns:
+        if column.primary_key or column.key not in row:
+            continue
+        value = row[column.key]
+        if value is None and not column.nullable:
+            raise DataValidationError(f"Invalid {kind} : {column.key} must not be null")
+        length = getattr(column.type, "length", None)
+        if length and isinstance(value, str) and len(value) > length:
+            raise DataValidationError(
+                f"Invalid {kind} : {column.key} is longer than {length} characters"
+            )
+
+
+def total_rows(items, wishlist_id=None):
+    """Returns the (wishlist_id, quantity, price) of item rows for item_totals"""
+    return [
+        (wishlist_id or item["wishlist_id"], item["quantity"], item["price"])
+        for item in items
+    ]
+
+
+def integer_values(record, table):
+    """
+    Converts the integer columns of a CSV record from text
+
+    Empty values are dropped so the column gets its default. Values that are
+    not integers are left as text for deserialize to reject.
+    """
+    record = dict(record)
+    for column in table.columns:
+        value = record.get(column.key)
+        if not isinstance(column.type, Integer) or not isinstance(value, str):
+            continue
+        if not value.strip():
+            del record[column.key]
+        else:
+            try:
+                record[column.key] = int(value)
+            except ValueError:
+                pass
+    return record
+
+
+def given_values(record, row):
+    """Keeps the id, version and timestamps of a record, which deserialize leaves out"""
+    for key in ("id", "version_id"):
+        if record.get(key) is not None:
+            if not isinstance(record[key], int):
+                raise DataValidationError(
+                    f"Invalid type for integer [{key}]: " + str(type(record[key]))
+                )
+            row[key] = record[key]
+    for key in ("created_on", "updated_on"):
+        if record.get(key):
+            try:
+                row[key] = datetime.datetime.fromisoformat(record[key])
+            except (TypeError, ValueError) as error:
+                raise DataValidationError(
+                    f"Invalid datetime [{key}]: {error}"
+                ) from error
+    return row
+
+
+######################################################################
+#  L O A D I N G
+######################################################################
+
+
+def assign_ids(conn, table, rows):
+    """Gives an id from the table's sequence to each row that has none"""
+    missing = [row for row in rows if "id" not in row]
+    if not missing:
+        return
+    if conn.dialect.name == "postgresql":
+        result = conn.execute(
+            text(
+                "SELECT nextval(pg_get_serial_sequence(:table, 'id')) "
+                "FROM generate_series(1, :count)"
+            ),
+            {"table": table.name, "count": len(missing)},
+        )
+        ids = result.scalars().all()
+    else:
+        # without a sequence ids follow max(id), nothing else may insert meanwhile
+        first = conn.execute(select(func.coalesce(func.max(table.c.id), 0))).scalar()
+        ids = range(first + 1, first + 1 + len(missing))
+    for row, new_id in zip(missing, ids):
+        row["id"] = new_id
+
+
+def reset_id_sequence(conn, table):
+    """Moves the id sequence of a table past the ids that were given explicitly"""
+    if conn.dialect.name != "postgresql":
+        return
+    conn.execute(
+        text(
+            f"SELECT setval(pg_get_serial_sequence('{table.name}', 'id'), "
+            f"(SELECT coalesce(max(id), 0) + 1 FROM {table.name}), false)"
+        )
+    )
+
+
+def bulk_insert(conn, table, rows):
+    """
+    Inserts many rows, with COPY FROM STDIN on Postgres, else executemany
+
+    Args:
+        conn (Connection): the connection, inside a transaction
+        table (Table): the table to insert into
+        rows (list): dicts that all have the same keys
+    """
+    if not rows:
+        return
+    columns = list(rows[0])
+    if conn.dialect.driver != "psycopg2":
+        conn.execute(table.insert(), rows)
+        return
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write("\t".join(copy_text(row[column]) for column in columns))
+        buffer.write("\n")
+    buffer.seek(0)
+    with conn.connection.cursor() as cursor:
+        cursor.copy_expert(
+            f"COPY {table.name} ({', '.join(columns)}) FROM STDIN", buffer
+        )
+
+
+def copy_text(value):
+    """Encodes a value for the text format of COPY"""
+    if value is None:
+        return "\\N"
+    if isinstance(value, datetime.datetime):
+        return value.isoformat(" ")
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
@@ -0,0 +1,299 @@
+"""
+Schema Migrations
+
+Versioned, forward-only changes to the database schema. Every migration is
+applied once, in order, and recorded in the schema_migrations table, so all
+of the workers and replicas can safely call upgrade() when they start.
+Behind pgbouncer (DB_PGBOUNCER) they don't, and the migrations are only
+applied by flask db-upgrade over the direct DB_MIGRATION_URI.
+
+Migrations must be idempotent because a brand new database gets its tables
+from the current models in version 1, and later migrations then find their
+changes already in place.
+"""
+import datetime
+import logging
+from collections import namedtuple
+from sqlalchemy import (
+    Column,
+    DateTime,
+    Integer,
+    String,
+    Table,
+    func,
+    inspect,
+    select,
+    text,
+)
+
+logger = logging.getLogger("flask.app")
+
+# Arbitrary key of the Postgres advisory lock that serializes upgrades
+ADVISORY_LOCK_KEY = 2820001
+
+# The wishlists a backfill updates in each of its transactions
+BACKFILL_BATCH_SIZE = 10000
+
+Migration = namedtuple("Migration", "version description upgrade transactional")
+
+MIGRATIONS = []
+
+
+def migration(version, description, transactional=True):
+    """
+    Registers a function as the migration to a schema version
+
+    Args:
+        version (int): the schema version the migration upgrades to
+        description (string): what the migration changes
+        transactional (bool): False for DDL that Postgres refuses to run
+            inside a transaction, like CREATE INDEX CONCURRENTLY, or for
+            backfills that commit in batches
+    """
+
+    def decorator(function):
+        MIGRATIONS.append(Migration(version, description, function, transactional))
+        MIGRATIONS.sort(key=lambda m: m.version)
+        return function
+
+    return decorator
+
+
+######################################################################
+#  M I G R A T I O N S
+######################################################################
+
+
+@migration(1, "create the wishlists and items tables")
+def create_tables(conn, metadata):
+    """Creates any of the model tables that do not exist yet"""
+    metadata.create_all(
+        conn, tables=[metadata.tables["wishlists"], metadata.tables["items"]]
+    )
+
+
+@migration(2, "index wishlists by customer", transactional=False)
+def index_wishlists_customer(conn, metadata):
+    """Indexes the customer lookups and their id ordered pages"""
+    create_index(conn, "ix_wishlists_customer_id", "wishlists", ["customer_id", "id"])
+
+
+@migration(3, "index items by wishlist", transactional=False)
+def index_items_wishlist(conn, metadata):
+    """Indexes the wishlist_id foreign key for the ranked and by-name lookups"""
+    create_index(
+        conn, "ix_items_wishlist_id_rank", "items", ["wishlist_id", "rank", "id"]
+    )
+    create_index(conn, "ix_items_wishlist_id_name", "items", ["wishlist_id", "name"])
+
+
+@migration(4, "index items by product", transactional=False)
+def index_items_product(conn, metadata):
+    """Indexes the product_id of items"""
+    create_index(conn, "ix_items_product_id", "items", ["product_id"])
+
+
+@migration(5, "track when wishlists change")
+def add_wishlists_updated_on(conn, metadata):
+    """Adds the updated_on column of wishlists, starting at their created_on"""
+    add_column(conn, "wishlists", "updated_on", "TIMESTAMP")
+    conn.execute(
+        text("UPDATE wishlists SET updated_on = created_on WHERE updated_on IS NULL")
+    )
+
+
+@migration(6, "version wishlists and items for optimistic concurrency")
+def add_version_ids(conn, metadata):
+    """Adds the version_id columns, a constant default needs no table rewrite"""
+    add_column(conn, "wishlists", "version_id", "INTEGER NOT NULL DEFAULT 1")
+    add_column(conn, "items", "version_id", "INTEGER NOT NULL DEFAULT 1")
+
+
+@migration(7, "index wishlists by name", transactional=False)
+def index_wishlists_name(conn, metadata):
+    """Indexes the name filter and the name ordered pages of wishlists"""
+    create_index(conn, "ix_wishlists_name", "wishlists", ["name", "id"])
+
+
+@migration(8, "index wishlist and item names for text search", transactional=False)
+def index_names_for_search(conn, metadata):
+    """Adds the trigram indexes on Postgres, or the FTS5 tables on SQLite"""
+    from service import search  # pylint: disable=import-outside-toplevel
+
+    search.create_indexes(conn)
+
+
+@migration(9, "keep the totals of the items of wishlists", transactional=False)
+def add_wishlist_totals(conn, metadata):
+    """
+    Adds the item_count, total_quantity and total_value of wishlists
+
+    The totals are backfilled one range of ids at a time, each committed on
+    its own, so no transaction holds the locks of every wishlist at once.
+    The ranges set the totals rather than add to them, so an interrupted
+    backfill is simply run again.
+    """
+    add_column(conn, "wishlists", "item_count", "INTEGER NOT NULL DEFAULT 0")
+    add_column(conn, "wishlists", "total_quantity", "BIGINT NOT NULL DEFAULT 0")
+    add_column(conn, "wishlists", "total_value", "BIGINT NOT NULL DEFAULT 0")
+    first_id, last_id = conn.execute(
+        text("SELECT min(id), max(id) FROM wishlists")
+    ).first()
+    if first_id is None:
+        return
+    # the connection autocommits, each range is its own transaction
+    for start in range(first_id, last_id + 1, BACKFILL_BATCH_SIZE):
+        # wishlists without items keep the defaults
+        conn.execute(
+            text(
+                "UPDATE wishlists SET "
+                "item_count = (SELECT count(*) FROM items "
+                "WHERE items.wishlist_id = wishlists.id), "
+                "total_quantity = (SELECT coalesce(sum(quantity), 0) FROM items "
+                "WHERE items.wishlist_id = wishlists.id), "
+                "total_value = (SELECT coalesce(sum(quantity * price), 0) "
+                "FROM items WHERE items.wishlist_id = wishlists.id) "
+                "WHERE id >= :start AND id < :end AND EXISTS "
+                "(SELECT 1 FROM items WHERE items.wishlist_id = wishlists.id)"
+            ),
+            {"start": start, "end": start + BACKFILL_BATCH_SIZE},
+        )
+
+
+@migration(10, "store idempotency keys")
+def add_idempotency_keys(conn, metadata):
+    """Creates the table of the Idempotency-Key headers of the create routes"""
+    from service import idempotency  # pylint: disable=import-outside-toplevel
+
+    idempotency.idempotency_keys.create(conn, checkfirst=True)
+
+
+@migration(11, "lease idempotency keys")
+def add_idempotency_lease(conn, metadata):
+    """Adds the time a claimed idempotency key can be taken over"""
+    add_column(conn, "idempotency_keys", "locked_until", "TIMESTAMP")
+
+
+######################################################################
+#  U T I L I T Y   F U N C T I O N S
+######################################################################
+
+
+def add_column(conn, table, name, definition):
+    """Adds a column to a table unless it is already there"""
+    if name in {c["name"] for c in inspect(conn).get_columns(table)}:
+        return
+    logger.info("Adding column %s to %s", name, table)
+    conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {definition}"))
+
+
+def create_index(conn, name, table, columns):
+    """
+    Creates an index if it does not exist yet
+
+    On Postgres the index is built with CREATE INDEX CONCURRENTLY so the
+    table stays writable, which requires a connection in autocommit mode.
+    An invalid index left behind by an interrupted build is rebuilt.
+    """
+    concurrently = ""
+    if conn.dialect.name == "postgresql":
+        concurrently = "CONCURRENTLY "
+        invalid = conn.execute(
+            text(
+                "SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+                "WHERE c.relname = :name AND NOT i.indisvalid"
+            ),
+            {"name": name},
+        ).first()
+        if invalid:
+            logger.warning("Rebuilding invalid index %s", name)
+            conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+    logger.info("Creating index %s on %s (%s)", name, table, ", ".join(columns))
+    conn.execute(
+        text(
+            f"CREATE INDEX {concurrently}IF NOT EXISTS {name} "
+            f"ON {table} ({', '.join(columns)})"
+        )
+    )
+
+
+def version_table(metadata):
+    """Returns the table that records the applied migrations"""
+    if "schema_migrations" in metadata.tables:
+        return metadata.tables["schema_migrations"]
+    return Table(
+        "schema_migrations",
+        metadata,
+        Column("version", Integer, primary_key=True),
+        Column("description", String(255), nullable=False),
+        Column("applied_on", DateTime, nullable=False),
+    )
+
+
+def current_version(conn, metadata):
+    """Returns the version of the schema, 0 for an empty database"""
+    table = version_table(metadata)
+    table.create(conn, checkfirst=True)
+    return conn.execute(select(func.max(table.c.version))).scalar() or 0
+
+
+def upgrade(db, engine=None):
+    """
+    Applies all of the pending migrations to the database
+
+    The advisory lock is held by one session across all of the steps, so the
+    engine must reach Postgres directly and not through a transaction pooler
+    like pgbouncer, which could run the lock and the unlock on different
+    server sessions and leak the lock.
+
+    Args:
+        db (SQLAlchemy): the Flask-SQLAlchemy object holding the models
+        engine (Engine): the database to migrate, db.engine by default
+    Returns:
+        list: the versions that were applied
+    """
+    engine = engine or db.engine
+    applied = []
+    with engine.connect() as conn:
+        # the lock is held by a connection that never sits idle in a
+        # transaction, which CREATE INDEX CONCURRENTLY would wait on forever
+        lock_conn = conn.execution_options(isolation_level="AUTOCOMMIT")
+        if engine.dialect.name == "postgresql":
+            lock_conn.execute(
+                text("SELECT pg_advisory_lock(:key)"), {"key": ADVISORY_LOCK_KEY}
+            )
+        try:
+            version = current_version(lock_conn, db.metadata)
+            for step in MIGRATIONS:
+                if step.version <= version:
+                    continue
+                logger.info(
+                    "Migrating schema to version %d: %s", step.version, step.description
+                )
+                if step.transactional:
+                    with engine.begin() as step_conn:
+                        step.upgrade(step_conn, db.metadata)
+                        record(step_conn, db.metadata, step)
+                else:
+                    step.upgrade(lock_conn, db.metadata)
+                    record(lock_conn, db.metadata, step)
+                applied.append(step.version)
+        finally:
+            if engine.dialect.name == "postgresql":
+                lock_conn.execute(
+                    text("SELECT pg_advisory_unlock(:key)"), {"key": ADVISORY_LOCK_KEY}
+                )
+    return applied
+
+
+def record(conn, metadata, step):
+    """Records a migration as applied"""
+    conn.execute(
+        version_table(metadata)
+        .insert()
+        .values(
+            version=step.version,
+            description=step.description,
+            applied_on=datetime.datetime.now(),
+        )
+    )
@@ -3,10 +3,34 @@ Models for Wishlists, Items
 
 All of the models are stored in this module
 """
+import base64
+import binascii
+import json
 import logging
+from collections import namedtuple
 from flask_sqlalchemy import SQLAlchemy
 import datetime
+from sqlalchemy import (
+    DateTime,
+    Integer,
+    and_,
+    bindparam,
+    case,
+    event,
+    func,
+    inspect,
+    literal,
+    or_,
+    select,
+    tuple_,
+)
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.orm.util import identity_key
 from werkzeug.exceptions import NotFound
+from service import migrations
+from service.common.cache import NullCache, create_cache
+from service.common.db_pool import init_pool
+from service.common.filters import FilterSet
 
 
 logger = logging.getLogger("flask.app")
@@ -24,6 +48,411 @@ class DataValidationError(Exception):
     """Used for an data validation errors when deserializing"""
 
 
+class VersionConflictError(Exception):
+    """Used when a row was changed since the version an update expected"""
+
+
+def new_row_values(instance):
+    """
+    Returns the column values of a new instance with the defaults filled in
+
+    For statements that bypass the unit of work, like a multi-row INSERT or
+    a COPY, which would otherwise leave the Python side defaults out.
+    The primary key is left out.
+    """
+    values = {}
+    for column in instance.__table__.columns:
+        if column.primary_key:
+            continue
+        value = getattr(instance, column.key)
+        if value is None and column.default is not None:
+            value = column.default.arg
+            if column.default.is_callable:
+                value = value(None)
+        values[column.key] = value
+    return values
+
+
+######################################################################
+#  F I N D E R   C A C H E
+######################################################################
+
+# Read-through cache of the primary key lookups, configured by init_cache()
+finder_cache = NullCache()
+
+# Short lived cache of Wishlists.summary by customer id, see init_cache()
+summary_cache = NullCache()
+
+
+def init_cache(app):
+    """Creates the finder and summary caches from the app configuration"""
+    global finder_cache, summary_cache  # pylint: disable=global-statement,invalid-name
+    finder_cache = create_cache(
+        app.config["FINDER_CACHE"],
+        max_entries=app.config["FINDER_CACHE_SIZE"],
+        ttl=app.config["FINDER_CACHE_TTL"],
+    )
+    summary_cache = create_cache(
+        app.config["SUMMARY_CACHE"],
+        max_entries=app.config["SUMMARY_CACHE_SIZE"],
+        ttl=app.config["SUMMARY_CACHE_TTL"],
+    )
+
+
+def find_values(model, by_id, fields, *keys):
+    """
+    Finds the column values of a row by primary key, without building a model
+
+    Only read-only paths use the cache: the writes find their rows with a
+    query, so a stale cached row can never be the base of an update.
+    A row held by the finder cache is returned with all of its columns.
+    Otherwise only the columns named by fields and the key columns are
+    selected, and only a complete row is cached.
+    """
+    try:
+        by_id = int(by_id)
+    except (TypeError, ValueError):
+        return None
+    key = (model.__tablename__, by_id)
+    values = finder_cache.get(key)
+    if values is not None:
+        return values
+    columns = projected_columns(model, fields, *keys)
+    row = db.session.execute(select(*columns).where(model.id == by_id)).first()
+    if row is None:
+        return None
+    if fields is None:
+        finder_cache.set(key, dict(row._mapping))
+    return row._mapping
+
+
+def projected_columns(model, fields, *keys):
+    """
+    Returns the columns of a model named by fields, in table order
+
+    Args:
+        model (Model): the model of the table
+        fields (list): the names of the columns, all of them when None
+        keys (Column): columns that are needed whatever the fields, e.g.
+            the sort key of the pagination
+    """
+    columns = model.__table__.columns
+    if fields is None:
+        return list(columns)
+    names = set(fields).union(key.key for key in keys)
+    return [column for column in columns if column.key in names]
+
+
+def invalidate_summaries(wishlist):
+    """Drops the summaries of the customer of a wishlist, and of its former one"""
+    for customer_id in inspect(wishlist).attrs.customer_id.history.sum():
+        summary_cache.invalidate(customer_id)
+
+
+def invalidate_cached(model, ids=None):
+    """Removes rows of a model from the finder cache, all of them when ids is None"""
+    if ids is None:
+        finder_cache.invalidate_where(lambda key, _: key[0] == model.__tablename__)
+    else:
+        for by_id in ids:
+            finder_cache.invalidate((model.__tablename__, by_id))
+
+
+def invalidate_written(session, model, ids):
+    """Invalidates rows written by a session, now and once more after commit"""
+    keys = session.info.setdefault("finder_cache_keys", set())
+    for by_id in ids:
+        key = (model.__tablename__, by_id)
+        keys.add(key)
+        finder_cache.invalidate(key)
+
+
+@event.listens_for(db.session, "after_flush")
+def invalidate_flushed(session, _):
+    """Invalidates the rows written by a flush"""
+    for instance in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(instance, (Wishlists, Items)) and instance.id is not None:
+            invalidate_written(session, type(instance), [instance.id])
+        if isinstance(instance, Wishlists):
+            invalidate_summaries(instance)
+
+
+@event.listens_for(db.session, "after_commit")
+def invalidate_committed(session):
+    """Invalidates the rows written by a transaction once it is visible"""
+    for key in session.info.pop("finder_cache_keys", ()):
+        finder_cache.invalidate(key)
+
+
+@event.listens_for(db.session, "after_soft_rollback")
+def forget_flushed(session, _):
+    """Forgets the rows of a rolled back transaction, they are unchanged"""
+    session.info.pop("finder_cache_keys", None)
+
+
+@event.listens_for(db.session, "after_bulk_update")
+@event.listens_for(db.session, "after_bulk_delete")
+def invalidate_bulk(context):
+    """Invalidates a whole model after a set-based UPDATE or DELETE"""
+    invalidate_cached(context.mapper.class_)
+
+
+######################################################################
+#  O P T I M I S T I C   C O N C U R R E N C Y
+######################################################################
+
+
+# The key of the InstanceState.info set of the columns assigned since the
+# last save_changes, see remember_assigned
+ASSIGNED = "assigned_columns"
+
+
+def remember_assigned(target, value, oldvalue, initiator):
+    """Records the assignment of a column, even of the value it already has"""
+    # pylint: disable=unused-argument
+    inspect(target).info.setdefault(ASSIGNED, set()).add(initiator.key)
+
+
+def save_changes(instance, versions=None):
+    """
+    Writes the assigned columns of an instance with one UPDATE statement
+
+    Every column the caller assigned is written, even with the value it
+    was read with: another request may have changed the row since, and
+    the update must still leave the row as it was asked to.
+
+    The statement also increments version_id. When versions are given it
+    only matches the row at one of those versions, so a concurrent change
+    is detected in the same round trip without locking the row.
+
+    Args:
+        instance: a persistent Wishlists or Items with pending changes
+        versions (list): the version_ids the update is allowed to replace,
+            None to replace any version
+    Raises:
+        VersionConflictError: the row is no longer at any of the versions
+        NotFound: the row was deleted
+    """
+    model = type(instance)
+    table = model.__table__
+    state = inspect(instance)
+    row_id = state.identity[0]
+    assigned = state.info.pop(ASSIGNED, set())
+    changes = {}
+    for attr in state.mapper.column_attrs:
+        if attr.key in ("id", "version_id"):
+            continue
+        history = state.attrs[attr.key].history
+        if history.added:
+            changes[attr.key] = history.added[0]
+        elif attr.key in assigned and attr.key in state.dict:
+            changes[attr.key] = state.dict[attr.key]
+    changes["updated_on"] = datetime.datetime.now()
+
+    statement = table.update().where(table.c.id == row_id)
+    if versions is not None:
+        statement = statement.where(table.c.version_id.in_(versions))
+    statement = statement.values(dict(changes, version_id=table.c.version_id + 1))
+    with db.session.no_autoflush:
+        if db.engine.dialect.full_returning:
+            row = db.session.execute(statement.returning(table.c.version_id)).first()
+            matched = row is not None
+        else:
+            row = None
+            matched = db.session.execute(statement).rowcount == 1
+    if not matched:
+        db.session.rollback()
+        exists = db.session.query(table.c.id).filter(table.c.id == row_id)
+        if versions is not None and exists.first() is not None:
+            raise VersionConflictError(
+                f"{model.__name__} {row_id} was changed by another request"
+            )
+        raise NotFound(f"{model.__name__} not found id : {row_id}")
+
+    if model is Wishlists:
+        invalidate_summaries(instance)
+    # the row is written, keep the instance from flushing the changes again
+    for key, value in changes.items():
+        set_committed_value(instance, key, value)
+    if row is not None:
+        set_committed_value(instance, "version_id", row[0])
+    else:
+        db.session.expire(instance, ["version_id"])
+    invalidate_written(db.session, model, [row_id])
+
+
+######################################################################
+#  W I S H L I S T   T O T A L S
+######################################################################
+
+# The aggregates of the items of a wishlist, kept in columns of the wishlist
+Totals = namedtuple("Totals", "item_count total_quantity total_value")
+
+
+def item_totals(rows, sign=1):
+    """
+    Sums items by wishlist
+
+    Args:
+        rows (iterable): the (wishlist_id, quantity, price) of the items
+        sign (int): -1 for the items that are removed
+    Returns:
+        dict: the Totals of the items, by wishlist id
+    """
+    sums = {}
+    for wishlist_id, quantity, price in rows:
+        count, total_quantity, total_value = sums.get(wishlist_id, (0, 0, 0))
+        sums[wishlist_id] = (
+            count + sign,
+            total_quantity + sign * quantity,
+            total_value + sign * quantity * price,
+        )
+    return {wishlist_id: Totals(*sums[wishlist_id]) for wishlist_id in sums}
+
+
+def add_totals(*changes):
+    """Adds up dicts of Totals by wishlist id"""
+    sums = {}
+    for totals in changes:
+        for wishlist_id, change in totals.items():
+            before = sums.get(wishlist_id, Totals(0, 0, 0))
+            sums[wishlist_id] = Totals(*(a + b for a, b in zip(before, change)))
+    return sums
+
+
+def update_wishlists(connection, ids, totals=None):
+    """
+    Moves wishlists to a new version and adds Totals of items to them
+
+    One UPDATE per wishlist is sent as a single executemany. Adding to the
+    columns, rather than setting them, keeps concurrent writers right: each
+    adds its own change once it holds the row lock.
+
+    Args:
+        connection: the Session or Connection of the transaction
+        ids (iterable): the ids of the wishlists
+        totals (dict): the Totals to add, by wishlist id, none by default
+    Returns:
+        datetime: the new updated_on of the wishlists
+    """
+    totals = totals or {}
+    table = Wishlists.__table__
+    now = datetime.datetime.now()
+    statement = (
+        table.update()
+        .where(table.c.id == bindparam("wishlist_id"))
+        .values(
+            updated_on=now,
+            version_id=table.c.version_id + 1,
+            item_count=table.c.item_count + bindparam("added_count"),
+            total_quantity=table.c.total_quantity + bindparam("added_quantity"),
+            total_value=table.c.total_value + bindparam("added_value"),
+        )
+    )
+    params = []
+    for by_id in sorted(ids):
+        change = totals.get(by_id, Totals(0, 0, 0))
+        params.append(
+            {
+                "wishlist_id": by_id,
+                "added_count": change.item_count,
+                "added_quantity": change.total_quantity,
+                "added_value": change.total_value,
+            }
+        )
+    if params:
+        connection.execute(statement, params)
+    return now
+
+
+def lock_wishlists(ids):
+    """
+    Locks the rows of wishlists until the end of the transaction
+
+    Writes that subtract the old values of items lock the wishlist first, so
+    no other write of its totals comes between reading and subtracting them.
+    FOR NO KEY UPDATE still lets items be inserted meanwhile; their totals
+    are added once the lock is released. Several wishlists are locked in id
+    order, so two writers of the same wishlists cannot deadlock.
+    """
+    table = Wishlists.__table__
+    db.session.execute(
+        select(table.c.id)
+        .where(table.c.id.in_(sorted(ids)))
+        .order_by(table.c.id)
+        .with_for_update(key_share=True)
+    )
+
+
+######################################################################
+#  K E Y S E T   P A G I N A T I O N
+######################################################################
+
+
+def encode_cursor(values):
+    """Encodes the sort key of the last row of a page into an opaque cursor"""
+    values = [v.isoformat() if isinstance(v, datetime.datetime) else v for v in values]
+    payload = json.dumps(values, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(payload).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor, columns):
+    """Decodes an opaque cursor back into the sort key values of the given columns"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        if not isinstance(values, list) or len(values) != len(columns):
+            raise ValueError("wrong number of key values")
+        return [
+            datetime.datetime.fromisoformat(value)
+            if isinstance(column.type, db.DateTime) and value is not None
+            else value
+            for column, value in zip(columns, values)
+        ]
+    except (ValueError, TypeError, UnicodeError, binascii.Error) as error:
+        raise DataValidationError("Invalid pagination cursor: " + cursor) from error
+
+
+def keyset_page(query, order, limit, after=None):
+    """
+    Returns one page of a query using keyset (cursor) pagination
+
+    Rows are located with a WHERE clause on the sort key instead of an
+    OFFSET, so every page costs the same no matter how deep it is.
+
+    Args:
+        query (Query): the filtered query to page through
+        order (list): (column, descending) pairs that totally order the rows,
+            the last one must be unique (normally the primary key)
+        limit (int): the maximum number of rows to return
+        after (string): the cursor returned with the previous page, if any
+    Returns:
+        (list, string): the rows of the page and the cursor of the next page,
+        which is None on the last page
+    """
+    columns = [column for column, _ in order]
+    if after:
+        values = decode_cursor(after, columns)
+        if len(columns) > 1 and len({desc for _, desc in order}) == 1:
+            # a row value comparison is answered straight from a composite index
+            key, bound = tuple_(*columns), tuple_(*values)
+            query = query.filter(key < bound if order[0][1] else key > bound)
+        else:
+            clauses = []
+            for i, (column, desc) in enumerate(order):
+                ties = [columns[j] == values[j] for j in range(i)]
+                step = column < values[i] if desc else column > values[i]
+                clauses.append(and_(*ties, step))
+            query = query.filter(or_(*clauses))
+    query = query.order_by(*[c.desc() if desc else c.asc() for c, desc in order])
+    # fetch one extra row to learn whether there is a next page
+    rows = query.limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor([getattr(rows[-1], c.key) for c in columns])
+
+
 class Wishlists(db.Model):
     """
     Class that represents Wishlists
@@ -35,8 +464,40 @@ class Wishlists(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(63), nullable=False)
     customer_id = db.Column(db.Integer, nullable=False)
-    created_on = db.Column(db.DateTime, default=datetime.datetime.now())
-    items = db.relationship("Items", backref="wishlists", lazy=True)
+    created_on = db.Column(db.DateTime, default=datetime.datetime.now)
+    # also moved forward whenever one of the items changes, see touch()
+    updated_on = db.Column(
+        db.DateTime, default=datetime.datetime.now, onupdate=datetime.datetime.now
+    )
+    # incremented by every write of the wishlist or of its items, see update()
+    version_id = db.Column(db.Integer, nullable=False, default=1, server_default="1")
+    # totals of the items, written with them in the same transaction, see touch()
+    item_count = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    total_quantity = db.Column(
+        db.BigInteger, nullable=False, default=0, server_default="0"
+    )
+    total_value = db.Column(
+        db.BigInteger, nullable=False, default=0, server_default="0"
+    )
+    # items are removed with set-based deletes, never loaded just to delete them
+    items = db.relationship(
+        "Items",
+        backref="wishlists",
+        lazy=True,
+        passive_deletes=True,
+        order_by="[Items.rank, Items.id]",
+    )
+
+    # Indexes are created on existing databases by service.migrations
+    __table_args__ = (
+        db.Index("ix_wishlists_customer_id", "customer_id", "id"),
+        db.Index("ix_wishlists_name", "name", "id"),
+    )
+
+    # The query parameters of the wishlist collection
+    filters = FilterSet(
+        equal=[id, name, customer_id], ranges=[created_on], sort=[id, name]
+    )
 
     def __repr__(self):
         return "<Wishlist %r id=[%s]>" % (self.name, self.id)
@@ -50,29 +511,351 @@ class Wishlists(db.Model):
         db.session.add(self)
         db.session.commit()
 
-    def update(self):
+    def update(self, versions=None):
         """
         Updates a wishlist to the database
+
+        Args:
+            versions (list): the version_ids the update may replace, as sent
+                in an If-Match header, None for an unconditional update
         """
-        logger.info("Saving %s", self.name)
-        if not self.id:
-            raise DataValidationError("Update called with empty ID field")
+        # loading an expired attribute must not flush the changes unconditionally
+        with db.session.no_autoflush:
+            logger.info("Saving %s", self.name)
+            if not self.id:
+                raise DataValidationError("Update called with empty ID field")
+            save_changes(self, versions)
         db.session.commit()
 
     def delete(self):
-        """Removes a wishlist from the data store"""
+        """Removes a wishlist and all of its items from the data store"""
         logger.info("Deleting %s", self.name)
+        self._delete_items()
         db.session.delete(self)
         db.session.commit()
 
-    def serialize(self):
-        """Serializes a wishlist into a dictionary"""
-        return {
+    def clear(self):
+        """Removes all of the items from a wishlist"""
+        logger.info("Clearing %s", self.name)
+        lock_wishlists([self.id])
+        removed = Items.totals(Items.wishlist_id == self.id, sign=-1)
+        self._delete_items()
+        Wishlists.touch([self.id], removed)
+        db.session.commit()
+
+    def _delete_items(self):
+        """Deletes the items of the wishlist with one DELETE statement"""
+        Items.query.filter(Items.wishlist_id == self.id).delete(
+            synchronize_session="evaluate"
+        )
+        db.session.expire(self, ["items"])
+
+    def copy_items(self, target_id, item_ids=None):
+        """
+        Copies items of the wishlist to another one with one INSERT ... SELECT
+
+        The copies come after the items of the target, in their order.
+
+        Args:
+            target_id (int): the wishlist to copy the items to
+            item_ids (list): the items to copy, all of them when None
+        Raises:
+            DataValidationError: an item is not in the wishlist
+        """
+        logger.info("Copying items of %s to wishlist %s", self.name, target_id)
+        table = Items.__table__
+        criteria = self._transferred_items(target_id, item_ids)
+        copied = Items.totals(*criteria).get(self.id, Totals(0, 0, 0))
+        base, step = self._appended_ranks(target_id, copied.item_count)
+        order = func.row_number().over(order_by=(table.c.rank, table.c.id))
+        now = datetime.datetime.now()
+        columns = ["name", "product_id", "quantity", "price"]
+        db.session.execute(
+            table.insert().from_select(
+                [*columns, "wishlist_id", "rank", "created_on", "updated_on"],
+                select(
+                    *[table.c[key] for key in columns],
+                    literal(target_id, Integer),
+                    literal(base, Integer) + literal(step, Integer) * order,
+                    literal(now, DateTime),
+                    literal(now, DateTime),
+                )
+                .where(*criteria)
+                .order_by(table.c.rank, table.c.id),
+            )
+        )
+        Wishlists.touch([target_id], {target_id: copied})
+        db.session.commit()
+
+    def move_items(self, target_id, item_ids=None):
+        """
+        Moves items of the wishlist to another one with one UPDATE
+
+        The items keep their ids and come after the items of the target, in
+        their order.
+
+        Args:
+            target_id (int): the wishlist to move the items to
+            item_ids (list): the items to move, all of them when None
+        Raises:
+            DataValidationError: an item is not in the wishlist
+        """
+        logger.info("Moving items of %s to wishlist %s", self.name, target_id)
+        table = Items.__table__
+        criteria = self._transferred_items(target_id, item_ids)
+        moved = Items.totals(*criteria).get(self.id, Totals(0, 0, 0))
+        moved_ids = self._move_to(target_id, criteria)
+        self._forget_items(moved_ids)
+        removed = Totals(*(-value for value in moved))
+        Wishlists.touch([self.id, target_id], {self.id: removed, target_id: moved})
+        db.session.commit()
+
+    def merge_into(self, target_id):
+        """
+        Moves all of the items of the wishlist to another one, combining products
+
+        The items of the source with the same product are first folded into
+        the first of them. An item whose product is already in the target
+        then adds its quantity to the first item of that product there and
+        is deleted, the others are moved after the items of the target, in
+        their order. Five statements do it whatever the number of items.
+
+        Args:
+            target_id (int): the wishlist to merge the items into
+        """
+        logger.info("Merging %s into wishlist %s", self.name, target_id)
+        table = Items.__table__
+        source = table.alias("source")
+        criteria = self._transferred_items(target_id)
+        before = Items.totals(table.c.wishlist_id.in_([self.id, target_id]))
+        source_ids = list(
+            db.session.execute(select(table.c.id).where(*criteria)).scalars()
+        )
+        self._fold_products(criteria)
+        in_source = select(source.c.product_id).where(source.c.wishlist_id == self.id)
+        # the first item of each product of the source that is in the target
+        combined = (
+            select(func.min(table.c.id))
+            .where(table.c.wishlist_id == target_id, table.c.product_id.in_(in_source))
+            .group_by(table.c.product_id)
+        )
+        combined_ids = list(db.session.execute(combined).scalars())
+        added_quantity = (
+            select(func.sum(source.c.quantity))
+            .where(
+                source.c.wishlist_id == self.id,
+                source.c.product_id == table.c.product_id,
+            )
+            .scalar_subquery()
+        )
+        db.session.execute(
+            table.update()
+            .where(table.c.id.in_(combined_ids))
+            .values(
+                quantity=table.c.quantity + added_quantity,
+                version_id=table.c.version_id + 1,
+                updated_on=datetime.datetime.now(),
+            )
+        )
+        target = table.alias("target")
+        in_target = select(target.c.product_id).where(target.c.id.in_(combined_ids))
+        db.session.execute(
+            table.delete().where(*criteria, table.c.product_id.in_(in_target))
+        )
+        self._move_to(target_id, criteria)
+        self._forget_items(source_ids + combined_ids)
+        after = Items.totals(table.c.wishlist_id.in_([self.id, target_id]))
+        changes = add_totals(
+            {key: Totals(*(-v for v in value)) for key, value in before.items()},
+            after,
+        )
+        Wishlists.touch([self.id, target_id], changes)
+        db.session.commit()
+
+    def _fold_products(self, criteria):
+        """
+        Sums the items of the same product into the first of them
+
+        Each product is then in the wishlist once, so it is combined with the
+        target's or moved as one item.
+        """
+        table = Items.__table__
+        source = table.alias("source")
+        kept_ids = list(
+            db.session.execute(
+                select(func.min(table.c.id))
+                .where(*criteria)
+                .group_by(table.c.product_id)
+                .having(func.count() > 1)
+            ).scalars()
+        )
+        if not kept_ids:
+            return
+        quantity = (
+            select(func.sum(source.c.quantity))
+            .where(
+                source.c.wishlist_id == self.id,
+                source.c.product_id == table.c.product_id,
+            )
+            .scalar_subquery()
+        )
+        db.session.execute(
+            table.update()
+            .where(table.c.id.in_(kept_ids))
+            .values(
+                quantity=quantity,
+                version_id=table.c.version_id + 1,
+                updated_on=datetime.datetime.now(),
+            )
+        )
+        kept = table.alias("kept")
+        folded = select(kept.c.product_id).where(kept.c.id.in_(kept_ids))
+        db.session.execute(
+            table.delete().where(
+                *criteria,
+                table.c.product_id.in_(folded),
+                table.c.id.not_in(kept_ids),
+            )
+        )
+
+    def _transferred_items(self, target_id, item_ids=None):
+        """
+        Locks the wishlists of a copy, move or merge and checks its items
+
+        Returns:
+            list: the criteria of the items of this wishlist to transfer
+        """
+        if target_id == self.id:
+            raise DataValidationError("Invalid target: the items are in it already")
+        if item_ids is not None and not all(isinstance(i, int) for i in item_ids):
+            raise DataValidationError("Invalid item ids: they must be integers")
+        lock_wishlists([self.id, target_id])
+        table = Items.__table__
+        criteria = [table.c.wishlist_id == self.id]
+        if item_ids is None:
+            return criteria
+        criteria.append(table.c.id.in_(item_ids))
+        found = db.session.execute(select(func.count()).where(*criteria)).scalar()
+        if found != len(set(item_ids)):
+            db.session.rollback()
+            raise DataValidationError(
+                f"Invalid item ids: not all of them are items of wishlist {self.id}"
+            )
+        return criteria
+
+    def _move_to(self, target_id, criteria):
+        """
+        Moves items of the wishlist after those of another one with one UPDATE
+
+        Returns:
+            list: the ids of the moved items, in their order
+        """
+        table = Items.__table__
+        ids = list(
+            db.session.execute(
+                select(table.c.id).where(*criteria).order_by(table.c.rank, table.c.id)
+            ).scalars()
+        )
+        if not ids:
+            return ids
+        base, step = self._appended_ranks(target_id, len(ids))
+        ranks = {item_id: base + step * (n + 1) for n, item_id in enumerate(ids)}
+        db.session.execute(
+            table.update()
+            .where(*criteria)
+            .values(
+                wishlist_id=target_id,
+                rank=case(ranks, value=table.c.id),
+                version_id=table.c.version_id + 1,
+                updated_on=datetime.datetime.now(),
+            )
+        )
+        return ids
+
+    @staticmethod
+    def _appended_ranks(wishlist_id, count):
+        """
+        Returns the (base, step) that rank items after those of a locked wishlist
+
+        The n-th item from 0 gets the rank base + step * (n + 1), between the
+        last item and the rank 0 of new items. Without room for count items
+        there, the wishlist is renumbered further below 0 first.
+        """
+        table = Items.__table__
+        last = db.session.execute(
+            select(func.max(table.c.rank)).where(table.c.wishlist_id == wishlist_id)
+        ).scalar()
+        if last is None:
+            return -(count + 1) * RANK_GAP, RANK_GAP
+        step = min(RANK_GAP, -last // (count + 1))
+        if step >= 1 or count == 0:
+            return last, step
+        ids = db.session.execute(
+            select(table.c.id)
+            .where(table.c.wishlist_id == wishlist_id)
+            .order_by(table.c.rank, table.c.id)
+        ).scalars()
+        ranks = spaced_ranks(list(ids))
+        write_ranks(
+            wishlist_id,
+            {item_id: rank - count * RANK_GAP for item_id, rank in ranks.items()},
+        )
+        return -(count + 1) * RANK_GAP, RANK_GAP
+
+    def _forget_items(self, item_ids):
+        """Drops moved or deleted items from the session and the finder cache"""
+        for item_id in item_ids:
+            instance = db.session.identity_map.get(identity_key(Items, item_id))
+            if instance is not None:
+                db.session.expire(instance)
+        invalidate_written(db.session, Items, item_ids)
+        db.session.expire(self, ["items"])
+
+    @classmethod
+    def touch(cls, ids, totals=None):
+        """
+        Moves the version_id and updated_on of wishlists forward without loading them
+
+        Called whenever items are written, so that the version of a wishlist
+        also changes with its representation with items, and its totals with
+        the items, in the same transaction.
+
+        Args:
+            ids (iterable): the ids of the wishlists
+            totals (dict): the Totals the items added, or removed, by wishlist id
+        """
+        totals = totals or {}
+        ids = {by_id for by_id in ids if by_id is not None}.union(totals)
+        if not ids:
+            return
+        now = update_wishlists(db.session, ids, totals)
+        for by_id in ids:
+            instance = db.session.identity_map.get(identity_key(cls, by_id))
+            if instance is not None:
+                set_committed_value(instance, "updated_on", now)
+                db.session.expire(instance, ["version_id", *Totals._fields])
+        invalidate_written(db.session, cls, ids)
+
+    def serialize(self, with_items=False):
+        """Serializes a wishlist into a dictionary
+
+        Args:
+            with_items (bool): True to embed the serialized items
+        """
+        data = {
             "id": self.id,
             "name": self.name,
             "customer_id": int(self.customer_id),
             "created_on": self.created_on,
+            "updated_on": self.updated_on,
+            "version_id": self.version_id,
+            "item_count": self.item_count,
+            "total_quantity": self.total_quantity,
+            "total_value": self.total_value,
         }
+        if with_items:
+            data["items"] = [item.serialize() for item in self.items]
+        return data
 
     def deserialize(self, data):
         """
@@ -110,9 +893,15 @@ class Wishlists(db.Model):
         logger.info("Initializing database")
         cls.app = app
         # This is where we initialize SQLAlchemy from the Flask app
+        init_pool(app)
         db.init_app(app)
         app.app_context().push()
-        db.create_all()  # make our sqlalchemy tables
+        if app.config["DB_PGBOUNCER"]:
+            # the migration lock needs a session of its own, see db-upgrade
+            logger.info("Behind pgbouncer, leaving the migrations to db-upgrade")
+        else:
+            migrations.upgrade(db)  # make and migrate our sqlalchemy tables
+        init_cache(app)
 
     @classmethod
     def all(cls):
@@ -146,6 +935,192 @@ class Wishlists(db.Model):
         logger.info("Processing customer id query for %s ...", str(customer_id))
         return cls.query.filter(cls.customer_id == customer_id)
 
+    @classmethod
+    def summary(cls, customer_id):
+        """
+        Returns the wishlist count and the totals of the items of a customer
+
+        The stored totals of the wishlists are summed with one GROUP BY over
+        the customer_id index, the items themselves are not read. Summaries
+        are cached for a few seconds, see SUMMARY_CACHE_TTL.
+
+        Args:
+            customer_id (int): the customer to sum up
+        Returns:
+            dict: customer_id, wishlist_count and the Totals of the items
+        """
+        summary = summary_cache.get(customer_id)
+        if summary is not None:
+            return summary
+        logger.info("Processing summary query for customer %s ...", customer_id)
+        table = cls.__table__
+        row = db.session.execute(
+            select(
+                func.count(table.c.id).label("wishlist_count"),
+                *[func.sum(table.c[key]).label(key) for key in Totals._fields],
+            )
+            .where(table.c.customer_id == customer_id)
+            .group_by(table.c.customer_id)
+        ).first()
+        # a customer without wishlists has no group
+        summary = {"customer_id": customer_id, "wishlist_count": 0}
+        summary.update(dict.fromkeys(Totals._fields, 0))
+        if row is not None:
+            # Postgres sums bigints as numeric
+            summary.update((key, int(value)) for key, value in row._mapping.items())
+        summary_cache.set(customer_id, summary)
+        return summary
+
+    @classmethod
+    def exists(cls, by_id):
+        """Returns True if there is a wishlist with the ID, reading the cache"""
+        return find_values(cls, by_id, ["id"]) is not None
+
+    @classmethod
+    def find_values(cls, by_id, fields=None):
+        """Finds the column values of a wishlist by it's ID
+
+        Args:
+            by_id (int): the id of the wishlist
+            fields (list): the names of the columns to select, all of them when
+                None; the version is always selected for the cache validators
+        """
+        logger.info("Processing lookup for id %s ...", by_id)
+        return find_values(cls, by_id, fields, cls.id, cls.version_id, cls.updated_on)
+
+    @classmethod
+    def rows(cls, query, fields=None, sort=None):
+        """Returns a query for the column values of the wishlists of a query
+
+        The rows are plain tuples, no model is built or tracked by the session.
+
+        Args:
+            query (Query): a wishlist query, e.g. from find_by_customer_id
+            fields (list): the names of the columns to select, all of them when
+                None; the sort key is always selected for the pagination
+            sort (tuple): the (column, descending) the rows will be paged by
+        """
+        keys = [key for key, _ in cls.page_order(sort)]
+        return query.with_entities(*projected_columns(cls, fields, *keys))
+
+    @classmethod
+    def page_order(cls, sort=None):
+        """Returns the total order of the wishlist pages, by id unless sorted"""
+        if sort is None:
+            return [(cls.id, False)]
+        column, descending = sort
+        if column.key == "id":
+            return [(cls.id, descending)]
+        return [(column, descending), (cls.id, descending)]
+
+    @classmethod
+    def paginate(cls, query, limit, after=None, sort=None):
+        """Returns a page of wishlists from a query in id order
+
+        Args:
+            query (Query): a wishlist query, e.g. from find_by_customer_id
+            limit (int): the maximum number of wishlists to return
+            after (string): the cursor of the previous page
+            sort (tuple): the (column, descending) to sort by instead of the id
+        """
+        logger.info("Processing wishlist page of %d after %s ...", limit, after)
+        return keyset_page(query, cls.page_order(sort), limit, after)
+
+    @classmethod
+    def export(cls, conn, batch_size=1000):
+        """
+        Streams every wishlist with its items, in id order
+
+        Wishlists are read joined with their items through a server-side
+        cursor, batch_size rows at a time, so memory stays constant no
+        matter how many rows there are. Rows are never loaded as models.
+
+        Args:
+            conn (Connection): the connection to read from, which stays busy
+                until the generator is exhausted
+            batch_size (int): the number of rows fetched at once
+        Yields:
+            dict: a wishlist like serialize(with_items=True) returns it
+        """
+        wishlists, items = cls.__table__, Items.__table__
+        statement = (
+            select(
+                *[c.label(f"w_{c.key}") for c in wishlists.columns],
+                *[c.label(f"i_{c.key}") for c in items.columns],
+            )
+            .select_from(
+                wishlists.outerjoin(items, items.c.wishlist_id == wishlists.c.id)
+            )
+            .order_by(wishlists.c.id, items.c.rank, items.c.id)
+        )
+        result = conn.execution_options(stream_results=True).execute(statement)
+        wishlist = None
+        for row in result.yield_per(batch_size).mappings():
+            if wishlist is None or wishlist["id"] != row["w_id"]:
+                if wishlist is not None:
+                    yield wishlist
+                wishlist = {c.key: row[f"w_{c.key}"] for c in wishlists.columns}
+                wishlist["items"] = []
+            if row["i_id"] is not None:
+                item = {c.key: row[f"i_{c.key}"] for c in items.columns}
+                wishlist["items"].append(item)
+        if wishlist is not None:
+            yield wishlist
+
+    @classmethod
+    def reconcile_totals(cls, batch_size=1000):
+        """
+        Recomputes the totals of every wishlist from its items, in id order
+
+        Each batch of wishlists is locked, its items summed with one GROUP BY
+        and the wishlists whose totals are off corrected, then committed, so
+        the locks are short and writes of other wishlists go on meanwhile.
+
+        Args:
+            batch_size (int): the number of wishlists per transaction
+        Yields:
+            (int, int): the wishlists checked and corrected by each batch
+        """
+        table, items = cls.__table__, Items.__table__
+        last = 0
+        while True:
+            rows = db.session.execute(
+                select(table.c.id, *[table.c[key] for key in Totals._fields])
+                .where(table.c.id > last)
+                .order_by(table.c.id)
+                .limit(batch_size)
+                .with_for_update(key_share=True)
+            ).all()
+            if not rows:
+                db.session.commit()
+                return
+            last = rows[-1].id
+            counted = Items.totals(items.c.wishlist_id.between(rows[0].id, last))
+            wrong = {}
+            for row in rows:
+                actual = counted.get(row.id, Totals(0, 0, 0))
+                stored = Totals(*row[1:])
+                if actual != stored:
+                    wrong[row.id] = Totals(*(a - b for a, b in zip(actual, stored)))
+            if wrong:
+                logger.warning("Correcting the totals of wishlists %s", sorted(wrong))
+                cls.touch([], wrong)
+            db.session.commit()
+            yield len(rows), len(wrong)
+
+    @classmethod
+    def count_and_last_change(cls, query):
+        """Returns the number of wishlists in a query and the latest updated_on
+
+        Args:
+            query (Query): a wishlist query, e.g. from find_by_customer_id
+        """
+        return (
+            query.with_entities(func.count(cls.id), func.max(cls.updated_on))
+            .order_by(None)
+            .one()
+        )
+
     @classmethod
     def find_or_404(cls, by_id):
         """Finds a wishlist item by it's ID"""
@@ -161,6 +1136,64 @@ class Wishlists(db.Model):
         db.session.remove()
 
 
+# loads the customer an expired wishlist had before it is changed, so that
+# invalidate_summaries also finds the former customer in the history
+event.listen(Wishlists.customer_id, "set", lambda *_: None, active_history=True)
+
+
+######################################################################
+#  I T E M   R A N K S
+######################################################################
+
+# The distance between the ranks of a renumbered wishlist, so that an item
+# can be moved between two others many times before they need renumbering
+RANK_GAP = 1024
+# The ranks must fit in the 32 bit integer column
+RANK_LIMIT = 2**31 - 1
+
+
+def spaced_ranks(ids):
+    """
+    Returns evenly spaced ranks for items in the given order, by item id
+
+    The ranks count up to -RANK_GAP, below the rank 0 of new items, so the
+    items added later still come after the ordered ones.
+    """
+    count = len(ids)
+    return {item_id: (index - count) * RANK_GAP for index, item_id in enumerate(ids)}
+
+
+def write_ranks(wishlist_id, ranks):
+    """
+    Sets the ranks of items of a wishlist with one UPDATE ... CASE statement
+
+    The items move to a new version, and their wishlist too.
+
+    Args:
+        wishlist_id (int): the wishlist of the items
+        ranks (dict): the new ranks, by item id
+    """
+    table = Items.__table__
+    now = datetime.datetime.now()
+    db.session.execute(
+        table.update()
+        .where(table.c.wishlist_id == wishlist_id, table.c.id.in_(list(ranks)))
+        .values(
+            rank=case(ranks, value=table.c.id),
+            version_id=table.c.version_id + 1,
+            updated_on=now,
+        )
+    )
+    for item_id, rank in ranks.items():
+        instance = db.session.identity_map.get(identity_key(Items, item_id))
+        if instance is not None:
+            set_committed_value(instance, "rank", rank)
+            set_committed_value(instance, "updated_on", now)
+            db.session.expire(instance, ["version_id"])
+    invalidate_written(db.session, Items, ranks)
+    Wishlists.touch([wishlist_id])
+
+
 class Items(db.Model):
     """
     Class that represents Wishlists
@@ -178,8 +1211,26 @@ class Items(db.Model):
     rank = db.Column(db.Integer, nullable=False, default=0)
     quantity = db.Column(db.Integer, nullable=False, default=1)
     price = db.Column(db.Integer, nullable=False, default=0)
-    created_on = db.Column(db.DateTime, default=datetime.datetime.now())
-    updated_on = db.Column(db.DateTime, default=datetime.datetime.now())
+    created_on = db.Column(db.DateTime, default=datetime.datetime.now)
+    updated_on = db.Column(
+        db.DateTime, default=datetime.datetime.now, onupdate=datetime.datetime.now
+    )
+    # incremented by every update of the item, see update()
+    version_id = db.Column(db.Integer, nullable=False, default=1, server_default="1")
+
+    # Indexes are created on existing databases by service.migrations
+    __table_args__ = (
+        db.Index("ix_items_wishlist_id_rank", "wishlist_id", "rank", "id"),
+        db.Index("ix_items_wishlist_id_name", "wishlist_id", "name"),
+        db.Index("ix_items_product_id", "product_id"),
+    )
+
+    # The query parameters of the item collection of a wishlist
+    filters = FilterSet(
+        equal=[id, name, product_id],
+        ranges=[price, quantity, created_on],
+        sort=[rank, name, price, quantity],
+    )
 
     def __repr__(self):
         return "<Items %r id=[%s]>" % (self.name, self.id)
@@ -191,20 +1242,204 @@ class Items(db.Model):
         logger.info("Creating %s", self.name)
         self.id = None  # id must be none to generate next primary key
         db.session.add(self)
+        db.session.flush()  # fills in the default quantity and price
+        Wishlists.touch([], item_totals([self.total_row()]))
         db.session.commit()
 
-    def update(self):
+    @classmethod
+    def create_many(cls, items):
+        """
+        Adds many wishlist items to the database in a single transaction
+
+        Databases that can return the generated keys of a multi-row INSERT
+        get one INSERT statement, the others one INSERT per item. Either way
+        there is only one commit.
+
+        Args:
+            items (list): the new Items, their ids are filled in
+        """
+        logger.info("Creating %d items", len(items))
+        if not items:
+            return
+        if db.engine.dialect.full_returning:
+            rows = [item.column_values() for item in items]
+            # RETURNING has no defined order, but the ids are drawn from the
+            # sequence in the order of the VALUES list, so they sort into it
+            new_ids = sorted(
+                db.session.execute(
+                    cls.__table__.insert().values(rows).returning(cls.__table__.c.id)
+                ).scalars()
+            )
+            for item, row, new_id in zip(items, rows, new_ids):
+                for key, value in row.items():
+                    setattr(item, key, value)
+                item.id = new_id
+        else:
+            for item in items:
+                item.id = None  # id must be none to generate next primary key
+            db.session.add_all(items)
+            db.session.flush()
+        Wishlists.touch([], item_totals(item.total_row() for item in items))
+        db.session.commit()
+
+    def column_values(self):
+        """Returns the column values of a new item with the defaults filled in"""
+        return new_row_values(self)
+
+    def total_row(self):
+        """Returns the (wishlist_id, quantity, price) the totals are made of"""
+        return self.wishlist_id, self.quantity, self.price
+
+    @classmethod
+    def totals(cls, *criteria, sign=1):
+        """Returns the Totals of the items that match, by wishlist id
+
+        Args:
+            criteria: the filters of the items, e.g. Items.wishlist_id == 1
+            sign (int): -1 for items that are about to be removed
+        """
+        table = cls.__table__
+        rows = db.session.execute(
+            select(
+                table.c.wishlist_id,
+                func.count(),
+                func.sum(table.c.quantity),
+                func.sum(table.c.quantity * table.c.price),
+            )
+            .where(*criteria)
+            .group_by(table.c.wishlist_id)
+        )
+        return {
+            row.wishlist_id: Totals(*(sign * int(value) for value in row[1:]))
+            for row in rows
+        }
+
+    def update(self, versions=None):
         """
         Updates a wishlist item to the database
+
+        Args:
+            versions (list): the version_ids the update may replace, as sent
+                in an If-Match header, None for an unconditional update
+        """
+        # loading an expired attribute must not flush the changes unconditionally
+        with db.session.no_autoflush:
+            logger.info("Saving %s", self.name)
+            if not self.id:
+                raise DataValidationError("Update called with empty ID field")
+            # the stored quantity and price before and after the write, the
+            # instance may not hold the columns another request changed since
+            lock_wishlists([self.wishlist_id])
+            removed = Items.totals(Items.id == self.id, sign=-1)
+            save_changes(self, versions)
+            added = Items.totals(Items.id == self.id)
+        Wishlists.touch([self.wishlist_id], add_totals(removed, added))
+        db.session.commit()
+
+    @classmethod
+    def reorder(cls, wishlist_id, ids):
         """
-        logger.info("Saving %s", self.name)
-        if not self.id:
-            raise DataValidationError("Update called with empty ID field")
+        Puts the items of a wishlist in the given order, in one statement
+
+        Args:
+            wishlist_id (int): the wishlist of the items
+            ids (list): the ids of all of the items of the wishlist, in order
+        Raises:
+            DataValidationError: the ids are not those of the wishlist's items
+        """
+        logger.info("Reordering the items of wishlist %s", wishlist_id)
+        if not all(isinstance(item_id, int) for item_id in ids):
+            raise DataValidationError("Invalid order: item ids must be integers")
+        lock_wishlists([wishlist_id])
+        table = cls.__table__
+        current = set(
+            db.session.execute(
+                select(table.c.id).where(table.c.wishlist_id == wishlist_id)
+            ).scalars()
+        )
+        if len(set(ids)) != len(ids) or set(ids) != current:
+            db.session.rollback()
+            raise DataValidationError(
+                "Invalid order: the ids must name every item of the wishlist once"
+            )
+        if ids:
+            write_ranks(wishlist_id, spaced_ranks(ids))
         db.session.commit()
 
+    def move(self, after=None):
+        """
+        Moves the item right after another item of its wishlist
+
+        Only the moved item is written, with a rank halfway between those of
+        its new neighbours, or between the last item and 0 to come last. The
+        whole wishlist is renumbered only when there is no rank left between
+        them.
+
+        Args:
+            after (int): the id of the item to follow, None to come first
+        Raises:
+            DataValidationError: after is not another item of the wishlist
+        """
+        logger.info("Moving %s after %s", self.name, after)
+        table = Items.__table__
+        lock_wishlists([self.wishlist_id])
+        in_wishlist = and_(
+            table.c.wishlist_id == self.wishlist_id, table.c.id != self.id
+        )
+        previous = None
+        following = select(table.c.id, table.c.rank).where(in_wishlist)
+        if after is not None:
+            previous = db.session.execute(
+                select(table.c.id, table.c.rank).where(in_wishlist, table.c.id == after)
+            ).first()
+            if previous is None:
+                db.session.rollback()
+                raise DataValidationError(
+                    f"Invalid move: item {after} is not another item of the wishlist"
+                )
+            following = following.where(
+                tuple_(table.c.rank, table.c.id) > tuple_(previous.rank, previous.id)
+            )
+        following = db.session.execute(
+            following.order_by(table.c.rank, table.c.id).limit(1)
+        ).first()
+
+        if previous is None and following is None:
+            rank = self.rank  # the only item
+        elif previous is None:
+            rank = following.rank - RANK_GAP
+        else:
+            # the last item stays below the rank 0 the new items come at
+            ceiling = 0 if following is None else following.rank
+            rank = (previous.rank + ceiling) // 2
+        if (previous is not None and rank <= previous.rank) or abs(rank) > RANK_LIMIT:
+            # no room left between the neighbours
+            write_ranks(self.wishlist_id, spaced_ranks(self._order_after(after)))
+        else:
+            write_ranks(self.wishlist_id, {self.id: rank})
+        db.session.commit()
+
+    def _order_after(self, after):
+        """Returns the ids of the items of the wishlist with this one after another"""
+        table = Items.__table__
+        ids = [
+            item_id
+            for item_id in db.session.execute(
+                select(table.c.id)
+                .where(table.c.wishlist_id == self.wishlist_id)
+                .order_by(table.c.rank, table.c.id)
+            ).scalars()
+            if item_id != self.id
+        ]
+        ids.insert(0 if after is None else ids.index(after) + 1, self.id)
+        return ids
+
     def delete(self):
         """Removes a wishlist item from the data store"""
         logger.info("Deleting %s", self.name)
+        lock_wishlists([self.wishlist_id])
+        removed = Items.totals(Items.id == self.id, sign=-1)
+        Wishlists.touch([self.wishlist_id], removed)
         db.session.delete(self)
         db.session.commit()
 
@@ -220,6 +1455,7 @@ class Items(db.Model):
             "price": self.price,
             "quantity": self.quantity,
             "updated_on": self.updated_on,
+            "version_id": self.version_id,
         }
 
     def deserialize_check_pid(self, data):
@@ -232,11 +1468,10 @@ class Items(db.Model):
                 + str(type(data["product_id"]))
             )
 
-    def deserialize_check_wid(self, data):
+    def deserialize_check_wid(self, data, verify_wishlist=True):
         """Deserialize helper"""
         if isinstance(data["wishlist_id"], int):
-            wishlist = Wishlists.find(data["wishlist_id"])
-            if not wishlist:
+            if verify_wishlist and not Wishlists.exists(data["wishlist_id"]):
                 raise DataValidationError(
                     "Invalid wishlist id : Wishlist with id : {0} doesn't exist".format(
                         data["wishlist_id"]
@@ -277,12 +1512,14 @@ class Items(db.Model):
                     + str(type(data["quantity"]))
                 )
 
-    def deserialize(self, data):
+    def deserialize(self, data, verify_wishlist=True):
         """
         Deserializes a WishlistsModel from a dictionary
 
         Args:
             data (dict): A dictionary containing the resource data
+            verify_wishlist (bool): False when the caller has already checked
+                that the wishlist exists
         """
         try:
             self.name = data["name"]
@@ -297,7 +1534,7 @@ class Items(db.Model):
 
             self.deserialize_check_pid(data)
 
-            self.deserialize_check_wid(data)
+            self.deserialize_check_wid(data, verify_wishlist)
 
             self.deserialize_check_meta(data)
 
@@ -316,9 +1553,15 @@ class Items(db.Model):
         logger.info("Initializing database")
         cls.app = app
         # This is where we initialize SQLAlchemy from the Flask app
+        init_pool(app)
         db.init_app(app)
         app.app_context().push()
-        db.create_all()  # make our sqlalchemy tables
+        if app.config["DB_PGBOUNCER"]:
+            # the migration lock needs a session of its own, see db-upgrade
+            logger.info("Behind pgbouncer, leaving the migrations to db-upgrade")
+        else:
+            migrations.upgrade(db)  # make and migrate our sqlalchemy tables
+        init_cache(app)
 
     @classmethod
     def disconnect_db(cls):
@@ -357,6 +1600,85 @@ class Items(db.Model):
         logger.info("Processing wishlist id query for %s ...", str(wishlist_id))
         return cls.query.filter(cls.wishlist_id == wishlist_id)
 
+    @classmethod
+    def find_values(cls, by_id, fields=None):
+        """Finds the column values of a wishlist item by it's ID
+
+        Args:
+            by_id (int): the id of the item
+            fields (list): the names of the columns to select, all of them when
+                None; the version is always selected for the cache validators
+        """
+        logger.info("Processing lookup for id %s ...", by_id)
+        return find_values(cls, by_id, fields, cls.id, cls.version_id, cls.updated_on)
+
+    @classmethod
+    def rows(cls, query, fields=None, sort=None):
+        """Returns a query for the column values of the items of a query
+
+        The rows are plain tuples, no model is built or tracked by the session.
+
+        Args:
+            query (Query): an item query, e.g. from find_by_wishlist_id
+            fields (list): the names of the columns to select, all of them when
+                None; the sort key is always selected for the pagination
+            sort (tuple): the (column, descending) the rows will be paged by
+        """
+        keys = [key for key, _ in cls.page_order(sort)]
+        return query.with_entities(*projected_columns(cls, fields, *keys))
+
+    @classmethod
+    def rows_by_wishlist(cls, wishlist_ids):
+        """Returns the item rows of some wishlists in (rank, id) order, by wishlist id
+
+        Args:
+            wishlist_ids (list): the ids of the wishlists, e.g. of a page
+        """
+        table = cls.__table__
+        items = {wishlist_id: [] for wishlist_id in wishlist_ids}
+        if not items:
+            return items
+        statement = (
+            select(table)
+            .where(table.c.wishlist_id.in_(list(items)))
+            .order_by(table.c.wishlist_id, table.c.rank, table.c.id)
+        )
+        for row in db.session.execute(statement):
+            items[row.wishlist_id].append(row._mapping)
+        return items
+
+    @classmethod
+    def page_order(cls, sort=None):
+        """Returns the total order of the item pages, by (rank, id) unless sorted"""
+        column, descending = sort or (cls.rank, False)
+        return [(column, descending), (cls.id, descending)]
+
+    @classmethod
+    def paginate(cls, query, limit, after=None, sort=None):
+        """Returns a page of wishlist items from a query in (rank, id) order
+
+        Args:
+            query (Query): an item query, e.g. from find_by_wishlist_id
+            limit (int): the maximum number of items to return
+            after (string): the cursor of the previous page
+            sort (tuple): the (column, descending) to sort by instead of the rank
+        """
+        logger.info("Processing item page of %d after %s ...", limit, after)
+        return keyset_page(query, cls.page_order(sort), limit, after)
+
+    @classmethod
+    def count_and_last_change(cls, query):
+        """Returns the number of items in a query and the latest updated_on
+
+        Args:
+            query (Query): an item query, e.g. from find_by_wishlist_id
+        """
+        return (
+            query.with_entities(func.count(cls.id), func.max(cls.updated_on))
+            .order_by(None)
+            .one()
+        )
+
     @classmethod
     def find_or_404(cls, by_id):
         """Finds a wishlist item by it's ID"""
@@ -365,3 +1687,13 @@ class Items(db.Model):
         if not item:
             raise NotFound("Item not found id : " + str(by_id))
         return item
+
+
+def listen_for_assignments(*models):
+    """Makes the column assignments of models known to save_changes"""
+    for model in models:
+        for column in model.__mapper__.column_attrs:
+            event.listen(getattr(model, column.key), "set", remember_assigned)
+
+
+listen_for_assignments(Wishlists, Items)
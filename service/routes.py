@@ -5,10 +5,17 @@ Describe what your service does here
 
 
 # from email.mime import application
+import datetime
+import hashlib
+import re
+from urllib.parse import urlencode
 from flask_restx import Api, Resource, fields, reqparse, inputs
-from flask import jsonify, request, url_for, abort
-from service.models import Wishlists, Items, DataValidationError
-from .common import status  # HTTP Status Codes
+from flask import jsonify, request, url_for, abort, stream_with_context
+from werkzeug.http import http_date, quote_etag, unquote_etag
+from service import idempotency, models, search
+from service.models import Wishlists, Items, DataValidationError, VersionConflictError
+from service.models import Totals, db
+from .common import fast_json, metrics, ndjson, status  # HTTP Status Codes
 
 # Import Flask application
 from . import app
@@ -58,6 +65,28 @@ API = Api(
 )
 
 
+@API.errorhandler(DataValidationError)
+def api_validation_error(error):
+    """Creates a request validation error for errors raised inside the API."""
+    app.logger.warning("ValidationError: %s", error)
+    return {
+        "status": status.HTTP_400_BAD_REQUEST,
+        "error": "ValidationError",
+        "message": str(error),
+    }, status.HTTP_400_BAD_REQUEST
+
+
+@API.errorhandler(VersionConflictError)
+def api_version_conflict(error):
+    """Creates a precondition failed error when an If-Match version is stale."""
+    app.logger.warning("VersionConflict: %s", error)
+    return {
+        "status": status.HTTP_412_PRECONDITION_FAILED,
+        "error": "Precondition Failed",
+        "message": str(error),
+    }, status.HTTP_412_PRECONDITION_FAILED
+
+
 WISHLIST_MODEL = API.model(
     "Wishlist",
     {
@@ -78,6 +107,21 @@ WISHLIST_MODEL = API.model(
             example=1,
             description="The Unique ID of the customer who made the wishlist.",
         ),
+        "item_count": fields.Integer(
+            readOnly=True,
+            example=3,
+            description="The number of items in the wishlist.",
+        ),
+        "total_quantity": fields.Integer(
+            readOnly=True,
+            example=5,
+            description="The sum of the quantities of the items.",
+        ),
+        "total_value": fields.Integer(
+            readOnly=True,
+            example=4500,
+            description="The sum of the quantity times the price of the items.",
+        ),
     },
 )
 CREATE_WISHLIST_MODEL = API.model(
@@ -129,7 +173,11 @@ ITEM_MODEL = API.model(
         "price": fields.Integer(
             example=1,
             description="The price of each item",
-        )
+        ),
+        "rank": fields.Integer(
+            example=-1024,
+            description="The position of the item in its wishlist, lowest first",
+        ),
     },
 )
 CREATE_ITEM_MODEL = API.model(
@@ -155,7 +203,161 @@ CREATE_ITEM_MODEL = API.model(
             required=False,
             example=1,
             description="The price of each item",
-        )
+        ),
+    },
+)
+
+WISHLIST_WITH_ITEMS_MODEL = API.inherit(
+    "Wishlist With Items",
+    WISHLIST_MODEL,
+    {
+        "items": fields.List(
+            fields.Nested(ITEM_MODEL),
+            # a plain "items" key would be looked up as the dict.items method
+            attribute=lambda wishlist: wishlist.get("items"),
+            description="The items of the wishlist, only present with expand=items.",
+        ),
+    },
+)
+
+BATCH_ITEM_RESULT_MODEL = API.model(
+    "Batch Item Result",
+    {
+        "index": fields.Integer(
+            required=True,
+            example=0,
+            description="The position of the item in the posted array.",
+        ),
+        "status": fields.Integer(
+            required=True,
+            example=201,
+            description="201 when the item was added, 400 when it was not valid.",
+        ),
+        "message": fields.String(
+            description="Why the item was not valid.",
+        ),
+        "item": fields.Nested(
+            ITEM_MODEL,
+            allow_null=True,
+            description="The item that was added.",
+        ),
+    },
+)
+
+ITEM_ORDER_MODEL = API.model(
+    "Item Order",
+    {
+        "item_ids": fields.List(
+            fields.Integer,
+            required=True,
+            example=[3, 1, 2],
+            description="The ids of all of the items of the wishlist, in order.",
+        ),
+    },
+)
+
+MOVE_ITEM_MODEL = API.model(
+    "Item Move",
+    {
+        "after": fields.Integer(
+            example=1,
+            description="The item to put it after, null to put it first.",
+        ),
+    },
+)
+
+ITEM_TRANSFER_MODEL = API.model(
+    "Item Transfer",
+    {
+        "to": fields.Integer(
+            required=True,
+            example=2,
+            description="The wishlist to copy or move the items to.",
+        ),
+        "item_ids": fields.List(
+            fields.Integer,
+            example=[1, 2],
+            description="The items to copy or move, all of them when left out.",
+        ),
+    },
+)
+
+MERGE_MODEL = API.model(
+    "Wishlist Merge",
+    {
+        "into": fields.Integer(
+            required=True,
+            example=2,
+            description="The wishlist that receives the items.",
+        ),
+    },
+)
+
+# Keys of a wishlist body that are kept by the service, not written by a PUT:
+# the items have routes of their own and the totals follow them
+WISHLIST_READ_ONLY = {
+    "id",
+    "created_on",
+    "updated_on",
+    "version_id",
+    "items",
+    *Totals._fields,
+}
+
+IDEMPOTENCY_KEY_HELP = (
+    "A unique key for the request, sent again with its retries, which get "
+    "the response of the first attempt instead of creating duplicates."
+)
+
+SUMMARY_MODEL = API.model(
+    "Customer Summary",
+    {
+        "customer_id": fields.String(
+            required=True, example="1", description="The ID of the customer."
+        ),
+        "wishlist_count": fields.Integer(
+            required=True, example=2, description="The number of wishlists."
+        ),
+        "item_count": fields.Integer(
+            required=True,
+            example=7,
+            description="The number of items in all of the wishlists.",
+        ),
+        "total_quantity": fields.Integer(
+            required=True,
+            example=9,
+            description="The sum of the quantities of the items.",
+        ),
+        "total_value": fields.Integer(
+            required=True,
+            example=12500,
+            description="The sum of the quantity times the price of the items.",
+        ),
+    },
+)
+
+SEARCH_HIT_MODEL = API.model(
+    "Search Hit",
+    {
+        "kind": fields.String(
+            required=True,
+            example="item",
+            description="Whether the name is the one of a wishlist or of an item.",
+        ),
+        "id": fields.Integer(
+            required=True, example=1, description="The ID of the wishlist or item."
+        ),
+        "wishlist_id": fields.String(
+            required=True,
+            example="1",
+            description="The wishlist, or the wishlist of the item.",
+        ),
+        "name": fields.String(required=True, example="Lego set"),
+        "score": fields.Float(
+            required=True,
+            example=1.5,
+            description="How well the name matches, the best hits come first.",
+        ),
     },
 )
 
@@ -164,24 +366,105 @@ CREATE_ITEM_MODEL = API.model(
 # Query Parsers
 ######################################################################
 
-WISHLIST_QUERY_PARSER = reqparse.RequestParser()
-WISHLIST_QUERY_PARSER.add_argument(
-    "id", type=int, required=False, help="The ID of the wishlist"
+WISHLIST_EXPAND_PARSER = reqparse.RequestParser()
+WISHLIST_EXPAND_PARSER.add_argument(
+    "expand",
+    type=str,
+    location="args",
+    required=False,
+    choices=("items",),
+    help="Use expand=items to embed the items of each wishlist.",
+)
+
+WISHLIST_EXPAND_PARSER.add_argument(
+    "fields",
+    type=str,
+    location="args",
+    required=False,
+    help="A comma separated list of the fields to return, e.g. fields=id,name.",
 )
+
+WISHLIST_QUERY_PARSER = Wishlists.filters.add_arguments(WISHLIST_EXPAND_PARSER.copy())
 WISHLIST_QUERY_PARSER.add_argument(
-    "name", type=str, required=False, help="The Name of the wishlist."
+    "limit",
+    type=inputs.int_range(1, app.config["MAX_PAGE_SIZE"]),
+    location="args",
+    required=False,
+    default=app.config["DEFAULT_PAGE_SIZE"],
+    help="The maximum number of wishlists to return.",
 )
 WISHLIST_QUERY_PARSER.add_argument(
-    "customer_id", type=int, required=False, help="The customer ID of the wishlist."
+    "after",
+    type=str,
+    location="args",
+    required=False,
+    help="The cursor from the Link header of the previous page.",
 )
 
-ITEM_QUERY_PARSER = WISHLIST_QUERY_PARSER = reqparse.RequestParser()
+ITEM_FIELDS_PARSER = reqparse.RequestParser()
+ITEM_FIELDS_PARSER.add_argument(
+    "fields",
+    type=str,
+    location="args",
+    required=False,
+    help="A comma separated list of the fields to return, e.g. fields=id,name.",
+)
+
+ITEM_QUERY_PARSER = Items.filters.add_arguments(ITEM_FIELDS_PARSER.copy())
 ITEM_QUERY_PARSER.add_argument(
-    "id", type=int, required=False, help="The ID of the item"
+    "limit",
+    type=inputs.int_range(1, app.config["MAX_PAGE_SIZE"]),
+    location="args",
+    required=False,
+    default=app.config["DEFAULT_PAGE_SIZE"],
+    help="The maximum number of items to return.",
 )
 ITEM_QUERY_PARSER.add_argument(
-    "name", type=str, required=False, help="The Name of the item."
+    "after",
+    type=str,
+    location="args",
+    required=False,
+    help="The cursor from the Link header of the previous page.",
+)
+SEARCH_PARSER = reqparse.RequestParser()
+SEARCH_PARSER.add_argument(
+    "q",
+    type=inputs.regex(r"^\s*\S.{0,99}$"),
+    location="args",
+    required=True,
+    help="The text to search for, at most 100 characters.",
+)
+SEARCH_PARSER.add_argument(
+    "customer_id",
+    type=int,
+    location="args",
+    required=False,
+    help="Search the wishlists of this customer and their items.",
 )
+SEARCH_PARSER.add_argument(
+    "wishlist_id",
+    type=int,
+    location="args",
+    required=False,
+    help="Search the items of this wishlist.",
+)
+SEARCH_PARSER.add_argument(
+    "limit",
+    type=inputs.int_range(1, app.config["MAX_PAGE_SIZE"]),
+    location="args",
+    required=False,
+    default=app.config["DEFAULT_PAGE_SIZE"],
+    help="The maximum number of hits to return.",
+)
+SEARCH_PARSER.add_argument(
+    "after",
+    type=str,
+    location="args",
+    required=False,
+    help="The cursor from the Link header of the previous page.",
+)
+
+
 ######################################################################
 # GET HEALTH CHECK
 ######################################################################
@@ -191,6 +474,25 @@ def healthcheck():
     return jsonify(status=200, message="Healthy"), status.HTTP_200_OK
 
 
+######################################################################
+# GET CACHE STATISTICS
+######################################################################
+@app.route("/cache/stats")
+def cache_stats():
+    """Returns the hit and miss counters of the finder cache"""
+    return jsonify(models.finder_cache.stats()), status.HTTP_200_OK
+
+
+######################################################################
+# GET METRICS
+######################################################################
+@app.route("/metrics")
+def prometheus_metrics():
+    """Returns the request and connection pool metrics for Prometheus"""
+    body, content_type = metrics.latest()
+    return body, status.HTTP_200_OK, {"Content-Type": content_type}
+
+
 ######################################################################
 # GET INDEX
 ######################################################################
@@ -214,8 +516,11 @@ class WishlistResource(Resource):
     """Handles all routes for the wishlist model."""
 
     @API.doc("get_wishlist")
+    @API.expect(WISHLIST_EXPAND_PARSER)
+    @API.response(200, "Success", WISHLIST_WITH_ITEMS_MODEL)
+    @API.response(304, "The wishlist has not changed.")
+    @API.response(400, "Unknown fields.")
     @API.response(404, "No wishlist for the query found.")
-    @API.marshal_list_with(WISHLIST_MODEL)
     def get(self, wishlist_id):
         """
         Retrieve a single wishlist
@@ -223,8 +528,10 @@ class WishlistResource(Resource):
         """
 
         app.logger.info("Request to get wishlist with id %s", wishlist_id)
+        args = WISHLIST_EXPAND_PARSER.parse_args()
+        fields = requested_fields(args["fields"], WISHLIST_WITH_ITEMS_MODEL)
 
-        wishlist = Wishlists.find(wishlist_id)
+        wishlist = Wishlists.find_values(wishlist_id, fields)
 
         if not wishlist:
             API.abort(
@@ -232,16 +539,32 @@ class WishlistResource(Resource):
                 f"Wishlist with arguments '{wishlist_id}' was not found.",
             )
 
-        app.logger.info("Returning wishlist: %s", wishlist.name)
-        return wishlist.serialize(), status.HTTP_200_OK
+        # the version of a wishlist also moves when its items change
+        headers, not_modified = check_not_modified(
+            version_etag(wishlist["version_id"], variant(args["expand"], fields)),
+            wishlist["updated_on"],
+        )
+        if not_modified:
+            return not_modified
+
+        app.logger.info("Returning wishlist: %s", wishlist_id)
+        if with_items(args["expand"], fields):
+            items = Items.rows_by_wishlist([wishlist["id"]])
+            wishlist = dict(wishlist, items=items[wishlist["id"]])
+        encode = fast_json.encoder(WISHLIST_WITH_ITEMS_MODEL, True, fields)
+        return fast_json.response(encode(wishlist), status.HTTP_200_OK, headers)
 
     @API.doc("update_wishlist")
     @API.response(404, "Wishlist not found")
     @API.response(400, "The posted wishlist is not valid")
+    @API.response(412, "The wishlist was changed since the If-Match version")
     @API.expect(WISHLIST_MODEL)
     @API.marshal_with(WISHLIST_MODEL)
     def put(self, wishlist_id):
-        """Updates a wishlist."""
+        """
+        Updates a wishlist.
+        Send the ETag of the wishlist in If-Match to update it only if it is unchanged.
+        """
         app.logger.info("Request to update wishlist %s", wishlist_id)
         wishlist = Wishlists.find(wishlist_id)
 
@@ -253,10 +576,12 @@ class WishlistResource(Resource):
         body = request.get_json()
         app.logger.info("Got body=%s", body)
         for k, new_value in body.items():
-            setattr(wishlist, k, new_value)
-        wishlist.update()
+            if k not in WISHLIST_READ_ONLY:
+                setattr(wishlist, k, new_value)
+        wishlist.update(if_match_versions())
 
-        return wishlist.serialize(), status.HTTP_200_OK
+        headers = {"ETag": version_etag(wishlist.version_id)}
+        return wishlist.serialize(), status.HTTP_200_OK, headers
 
     @API.doc("delete_wishlist")
     @API.response(204, "Wishlist Deleted")
@@ -265,12 +590,6 @@ class WishlistResource(Resource):
         app.logger.info("Request to delete wishlist with id: %s", wishlist_id)
         wishlist = Wishlists.find(wishlist_id)
 
-        if wishlist:
-            while wishlist.items:
-                item = wishlist.items[0]
-                wishlist.items.remove(item)
-                item.delete()
-                
         if wishlist:
             wishlist.delete()
 
@@ -297,22 +616,102 @@ class WishlistItemsResource(Resource):
                 f"Wishlist with id '{wishlist_id}' was not found.",
             )
 
-        if wishlist:
-            while wishlist.items:
-                item = wishlist.items[0]
-                wishlist.items.remove(item)
-                item.delete()
+        wishlist.clear()
 
-        app.logger.info("Wishlist cleared.", wishlist_id)
+        app.logger.info("Wishlist with ID [%s] cleared.", wishlist_id)
         return "", status.HTTP_204_NO_CONTENT
 
 
+@API.route("/wishlists/<int:wishlist_id>/merge", strict_slashes=False)
+@API.param("wishlist_id", "The wishlist ID")
+class WishlistMergeResource(Resource):
+    """Resource for merging a wishlist into another one."""
+
+    @API.doc("merge_wishlist")
+    @API.expect(MERGE_MODEL)
+    @API.response(400, "The target is missing or is the wishlist itself.")
+    @API.response(404, "Wishlist not found")
+    @API.marshal_with(WISHLIST_MODEL)
+    def post(self, wishlist_id):
+        """
+        Merges the items of a wishlist into another one.
+        Items of a product the target already has add their quantity to it,
+        the others are moved. The emptied wishlist is kept.
+        Returns the target wishlist.
+        """
+        app.logger.info("Request to merge wishlist %s", wishlist_id)
+        check_content_type("application/json")
+        wishlist, target = transfer_wishlists(wishlist_id, "into")
+        wishlist.merge_into(target.id)
+
+        headers = {"ETag": version_etag(target.version_id)}
+        return target.serialize(), status.HTTP_200_OK, headers
+
+
+@API.route("/wishlists/<int:wishlist_id>/items/copy", strict_slashes=False)
+@API.param("wishlist_id", "The wishlist ID")
+class ItemCopyResource(Resource):
+    """Resource for copying items to another wishlist."""
+
+    @idempotency.idempotent
+    @API.doc("copy_items")
+    @API.param(idempotency.HEADER, IDEMPOTENCY_KEY_HELP, _in="header")
+    @API.response(409, "A request with the Idempotency-Key is in progress.")
+    @API.response(422, "The Idempotency-Key was used for another request.")
+    @API.expect(ITEM_TRANSFER_MODEL)
+    @API.response(400, "The target or the items are not valid.")
+    @API.response(404, "Wishlist not found")
+    @API.marshal_with(WISHLIST_MODEL)
+    def post(self, wishlist_id):
+        """
+        Copies items of a wishlist to another one.
+        All of the items are copied unless item_ids names some of them. The
+        copies come after the items of the target. Returns the target wishlist.
+        """
+        app.logger.info("Request to copy items of wishlist %s", wishlist_id)
+        check_content_type("application/json")
+        wishlist, target = transfer_wishlists(wishlist_id, "to")
+        wishlist.copy_items(target.id, transferred_item_ids())
+
+        headers = {"ETag": version_etag(target.version_id)}
+        return target.serialize(), status.HTTP_200_OK, headers
+
+
+@API.route("/wishlists/<int:wishlist_id>/items/move", strict_slashes=False)
+@API.param("wishlist_id", "The wishlist ID")
+class ItemTransferResource(Resource):
+    """Resource for moving items to another wishlist."""
+
+    @API.doc("move_items")
+    @API.expect(ITEM_TRANSFER_MODEL)
+    @API.response(400, "The target or the items are not valid.")
+    @API.response(404, "Wishlist not found")
+    @API.marshal_with(WISHLIST_MODEL)
+    def post(self, wishlist_id):
+        """
+        Moves items of a wishlist to another one.
+        All of the items are moved unless item_ids names some of them. They
+        keep their ids and come after the items of the target.
+        Returns the target wishlist.
+        """
+        app.logger.info("Request to move items of wishlist %s", wishlist_id)
+        check_content_type("application/json")
+        wishlist, target = transfer_wishlists(wishlist_id, "to")
+        wishlist.move_items(target.id, transferred_item_ids())
+
+        headers = {"ETag": version_etag(target.version_id)}
+        return target.serialize(), status.HTTP_200_OK, headers
+
 
 @API.route("/wishlists", strict_slashes=False)
 class WishlistCollection(Resource):
     """Resource for handling multiple wishlists."""
 
+    @idempotency.idempotent
     @API.doc("create_wishlist")
+    @API.param(idempotency.HEADER, IDEMPOTENCY_KEY_HELP, _in="header")
+    @API.response(409, "A request with the Idempotency-Key is in progress.")
+    @API.response(422, "The Idempotency-Key was used for another request.")
     @API.expect(CREATE_WISHLIST_MODEL)
     @API.response(400, "ValueErrors: Missing either a name or a valid customer id.")
     @API.marshal_with(WISHLIST_MODEL)
@@ -336,27 +735,131 @@ class WishlistCollection(Resource):
         return wishlist.serialize(), status.HTTP_201_CREATED, {"location": location_url}
 
     @API.doc("list_wishlists")
-    @API.marshal_list_with(WISHLIST_MODEL)
+    @API.response(200, "Success", [WISHLIST_WITH_ITEMS_MODEL])
+    @API.response(304, "None of the wishlists have changed.")
+    @API.response(400, "Invalid pagination arguments or unknown fields.")
     @API.expect(WISHLIST_QUERY_PARSER, validate=True)
     def get(self):
-        """Lists the wishlists."""
+        """
+        Lists the wishlists.
+        All of the filters given apply. Results are paged in id order, or by
+        the sort field; the next page is linked from the Link header.
+        """
         app.logger.info("Request to list wishlist...")
+        args = WISHLIST_QUERY_PARSER.parse_args()
+        fields = requested_fields(args["fields"], WISHLIST_WITH_ITEMS_MODEL)
+        sort = Wishlists.filters.sort_key(args)
+        query = Wishlists.filters.apply(Wishlists.query, args)
+
+        count, last_change = Wishlists.count_and_last_change(query)
+        headers, not_modified = check_not_modified(
+            digest_etag(count, last_change), last_change, by_date=False
+        )
+        if not_modified:
+            return not_modified
 
-        wishlist_id = request.args.get("id")
-        customer_id = request.args.get("customer_id")
-        name = request.args.get("name")
-        wishlists = []
-        if customer_id:
-            wishlists = Wishlists.find_by_customer_id(customer_id)
-        elif name:
-            wishlists = Wishlists.find_by_name(name)
-        elif wishlist_id:
-            wishlists = [Wishlists.find(wishlist_id)]
-        else:
-            wishlists = Wishlists.all()
-        wishlists = [w.serialize() for w in wishlists]
+        rows, cursor = Wishlists.paginate(
+            Wishlists.rows(query, fields, sort), args["limit"], args["after"], sort
+        )
+        wishlists = [row._mapping for row in rows]
+        if with_items(args["expand"], fields):
+            items = Items.rows_by_wishlist([row.id for row in rows])
+            wishlists = [dict(w, items=items[w["id"]]) for w in wishlists]
         app.logger.info("Found %d wishlists", len(wishlists))
-        return wishlists, status.HTTP_200_OK
+        headers.update(next_page_link(cursor))
+        encode = fast_json.encoder(WISHLIST_WITH_ITEMS_MODEL, True, fields)
+        return fast_json.response(
+            [encode(w) for w in wishlists], status.HTTP_200_OK, headers
+        )
+
+
+@API.route("/wishlists/export", strict_slashes=False)
+class WishlistExportResource(Resource):
+    """Resource for exporting all of the wishlists at once."""
+
+    @API.doc("export_wishlists")
+    @API.produces([ndjson.MEDIA_TYPE])
+    @API.response(200, "One wishlist with its items per line.")
+    def get(self):
+        """
+        Exports every wishlist with its items as NDJSON.
+        The rows are streamed from a server-side cursor as they are read,
+        so the response starts at once and memory stays constant.
+        """
+        app.logger.info("Request to export all wishlists")
+        batch_size = app.config["EXPORT_BATCH_SIZE"]
+
+        def generate():
+            with db.engine.connect() as conn:
+                wishlists = Wishlists.export(conn, batch_size)
+                yield from ndjson.iter_dumps(wishlists, chunk_size=64 * 1024)
+
+        return app.response_class(
+            stream_with_context(generate()), mimetype=ndjson.MEDIA_TYPE
+        )
+
+
+@API.route("/wishlists/search", strict_slashes=False)
+class WishlistSearchResource(Resource):
+    """Resource for searching the names of wishlists and items."""
+
+    @API.doc("search_wishlists")
+    @API.expect(SEARCH_PARSER, validate=True)
+    @API.response(200, "Success", [SEARCH_HIT_MODEL])
+    @API.response(400, "No query, no customer or wishlist, or an invalid cursor.")
+    def get(self):
+        """
+        Searches the names of the wishlists and items of a customer.
+        With a wishlist_id only the items of that wishlist are searched.
+        Names match on a prefix of their words, and on Postgres on similar
+        words too. The best matches come first and the next page is linked
+        from the Link header.
+        """
+        args = SEARCH_PARSER.parse_args()
+        app.logger.info("Request to search for %s", args["q"])
+        if args["customer_id"] is None and args["wishlist_id"] is None:
+            API.abort(
+                status.HTTP_400_BAD_REQUEST,
+                "A search needs a customer_id or a wishlist_id.",
+            )
+        hits, cursor = search.search(
+            args["q"],
+            args["customer_id"],
+            args["wishlist_id"],
+            args["limit"],
+            args["after"],
+        )
+        app.logger.info("Found %d hits", len(hits))
+        encode = fast_json.encoder(SEARCH_HIT_MODEL)
+        return fast_json.response(
+            [encode(hit) for hit in hits], status.HTTP_200_OK, next_page_link(cursor)
+        )
+
+
+######################################################################
+# Customer handling
+######################################################################
+
+
+@API.route("/customers/<int:customer_id>/summary", strict_slashes=False)
+@API.param("customer_id", "The customer ID")
+class CustomerSummaryResource(Resource):
+    """Resource for the totals of all of the wishlists of a customer."""
+
+    @API.doc("get_customer_summary")
+    @API.marshal_with(SUMMARY_MODEL)
+    def get(self, customer_id):
+        """
+        Sums up the wishlists of a customer.
+        Returns the number of wishlists, and of items and their total value
+        across all of them, computed in one query. The summary is cached for
+        SUMMARY_CACHE_TTL seconds.
+        """
+        app.logger.info("Request for the summary of customer %s", customer_id)
+        summary = Wishlists.summary(customer_id)
+        max_age = int(app.config["SUMMARY_CACHE_TTL"])
+        headers = {"Cache-Control": f"private, max-age={max_age}"}
+        return summary, status.HTTP_200_OK, headers
 
 
 ######################################################################
@@ -371,8 +874,11 @@ class ItemResource(Resource):
     """Class to handle items."""
 
     @API.doc("get_wishlist_item")
+    @API.expect(ITEM_FIELDS_PARSER)
+    @API.response(200, "Success", ITEM_MODEL)
+    @API.response(304, "The item has not changed.")
+    @API.response(400, "Unknown fields.")
     @API.response(404, "No item found in wishlist")
-    @API.marshal_with(ITEM_MODEL)
     def get(self, wishlist_id, item_id):
         """
         Retrieve a single wishlist
@@ -381,16 +887,26 @@ class ItemResource(Resource):
         app.logger.info(
             "Request for items with id: %s from wishlist %s", item_id, wishlist_id
         )
+        args = ITEM_FIELDS_PARSER.parse_args()
+        fields = requested_fields(args["fields"], ITEM_MODEL)
 
-        item = Items.find(item_id)
+        item = Items.find_values(item_id, fields)
         if not item:
             abort(
                 status.HTTP_404_NOT_FOUND,
                 f"Wishlist Item with id '{item_id}' was not found.",
             )
 
-        app.logger.info("Returning wishlist item: %s", item.name)
-        return item.serialize(), status.HTTP_200_OK
+        headers, not_modified = check_not_modified(
+            version_etag(item["version_id"], variant(None, fields)),
+            item["updated_on"],
+        )
+        if not_modified:
+            return not_modified
+
+        app.logger.info("Returning wishlist item: %s", item_id)
+        encode = fast_json.encoder(ITEM_MODEL, False, fields)
+        return fast_json.response(encode(item), status.HTTP_200_OK, headers)
 
     @API.doc("delete_item")
     @API.response(204, "Item Deleted")
@@ -410,9 +926,13 @@ class ItemResource(Resource):
 
     @API.doc("update_item")
     @API.expect(ITEM_QUERY_PARSER, validate=True)
+    @API.response(412, "The item was changed since the If-Match version")
     def put(self, wishlist_id, item_id):
 
-        """Updates the name of an item in a wishlist."""
+        """
+        Updates the name of an item in a wishlist.
+        Send the ETag of the item in If-Match to update it only if it is unchanged.
+        """
 
         app.logger.info(
             "Request to update product %d in wishlist %d", wishlist_id, item_id
@@ -444,11 +964,88 @@ class ItemResource(Resource):
             wishlist_product.quantity = new_qty
 
         if new_price:
-            wishlist_product.proce = new_price
+            wishlist_product.price = new_price
+
+        new_rank = body.get("rank", None)
+        if new_rank is not None:
+            if not isinstance(new_rank, int):
+                abort(status.HTTP_400_BAD_REQUEST, "The rank must be an integer.")
+            wishlist_product.rank = new_rank
+
+        wishlist_product.update(if_match_versions())
+
+        headers = {"ETag": version_etag(wishlist_product.version_id)}
+        return {}, status.HTTP_202_ACCEPTED, headers
+
+
+@API.route(
+    "/wishlists/<int:wishlist_id>/items/<int:item_id>/move", strict_slashes=False
+)
+@API.param("wishlist_id", "The wishlist ID")
+@API.param("item_id", "The item ID")
+class ItemMoveResource(Resource):
+    """Class for moving one item within its wishlist."""
 
-        wishlist_product.update()
+    @API.doc("move_item")
+    @API.expect(MOVE_ITEM_MODEL)
+    @API.response(400, "The item to put it after is not in the wishlist.")
+    @API.response(404, "No item found in wishlist")
+    @API.marshal_with(ITEM_MODEL)
+    def put(self, wishlist_id, item_id):
+        """
+        Moves an item after another one of its wishlist, or first.
+        Usually only the moved item is written, for a drag and drop.
+        """
+        app.logger.info("Request to move item %s in wishlist %s", item_id, wishlist_id)
+        check_content_type("application/json")
+        body = request.get_json()
+        after = body.get("after") if isinstance(body, dict) else None
+        if after is not None and not isinstance(after, int):
+            abort(status.HTTP_400_BAD_REQUEST, "after must be an item id or null.")
+        item = Items.find(item_id)
+        if not item or item.wishlist_id != wishlist_id:
+            abort(
+                status.HTTP_404_NOT_FOUND, f"Item {item_id} not found in {wishlist_id}"
+            )
+        item.move(after)
+
+        headers = {"ETag": version_etag(item.version_id)}
+        return item.serialize(), status.HTTP_200_OK, headers
+
+
+@API.route("/wishlists/<int:wishlist_id>/items/order", strict_slashes=False)
+@API.param("wishlist_id", "The wishlist ID")
+class ItemOrderResource(Resource):
+    """Class for putting all of the items of a wishlist in order at once."""
+
+    @API.doc("reorder_items")
+    @API.expect(ITEM_ORDER_MODEL)
+    @API.response(400, "The ids are not those of the items of the wishlist.")
+    @API.response(404, "No wishlist found.")
+    @API.response(200, "Success", [ITEM_MODEL])
+    def put(self, wishlist_id):
+        """
+        Reorders the items of a wishlist.
+        Takes the ids of all of the items in their new order and ranks them
+        with one statement. Returns the items in that order. The order is not
+        capped like a batch: it can only name the items of the wishlist.
+        """
+        app.logger.info("Request to reorder the items of wishlist %s", wishlist_id)
+        check_content_type("application/json")
+        body = request.get_json()
+        ids = body.get("item_ids") if isinstance(body, dict) else None
+        if not isinstance(ids, list):
+            API.abort(status.HTTP_400_BAD_REQUEST, "Expected an array of item_ids.")
+        if not Wishlists.exists(wishlist_id):
+            API.abort(
+                status.HTTP_404_NOT_FOUND,
+                f"Wishlist with id '{wishlist_id}' was not found.",
+            )
+        Items.reorder(wishlist_id, ids)
 
-        return {}, status.HTTP_202_ACCEPTED
+        rows = Items.rows_by_wishlist([wishlist_id]).get(wishlist_id, [])
+        encode = fast_json.encoder(ITEM_MODEL)
+        return fast_json.response([encode(row) for row in rows], status.HTTP_200_OK)
 
 
 @API.route("/wishlists/<int:wishlist_id>/items", strict_slashes=False)
@@ -456,7 +1053,11 @@ class ItemResource(Resource):
 class ItemCollectionResource(Resource):
     """Class for handling collection of items."""
 
+    @idempotency.idempotent
     @API.doc("create_item")
+    @API.param(idempotency.HEADER, IDEMPOTENCY_KEY_HELP, _in="header")
+    @API.response(409, "A request with the Idempotency-Key is in progress.")
+    @API.response(422, "The Idempotency-Key was used for another request.")
     @API.expect(CREATE_ITEM_MODEL)
     @API.response(400, "ValueErrors: Missing either a name or a valid wishlist id.")
     @API.marshal_with(ITEM_MODEL)
@@ -480,26 +1081,47 @@ class ItemCollectionResource(Resource):
 
     @API.doc("list_wishlist_items")
     @API.expect(ITEM_QUERY_PARSER, validate=True)
+    @API.response(200, "Success", [ITEM_MODEL])
+    @API.response(304, "None of the items have changed.")
+    @API.response(400, "Invalid pagination arguments or unknown fields.")
     @API.response(404, "No wishlist found.")
-    @API.marshal_list_with(ITEM_MODEL)
     def get(self, wishlist_id):
-        """Gets items from a wishlist."""
+        """
+        Gets items from a wishlist.
+        All of the filters given apply. Results are paged in (rank, id) order,
+        or by the sort field; the next page is linked from the Link header and
+        X-Total-Count holds the number of matching items.
+        """
         app.logger.info("Request for items in wishlist: %s", str(wishlist_id))
-        name = request.args.get("name")
-        if(name):
-            items = Items.find_by_name(name)
-        else:
-            items = Items.find_by_wishlist_id(wishlist_id)
-            
-        items_serialized = [i.serialize() for i in items]
-        app.logger.info(items_serialized)
-        if len(items_serialized) == 0:
-            return {
+        args = ITEM_QUERY_PARSER.parse_args()
+        fields = requested_fields(args["fields"], ITEM_MODEL)
+        sort = Items.filters.sort_key(args)
+        query = Items.filters.apply(Items.find_by_wishlist_id(wishlist_id), args)
+
+        total, last_change = Items.count_and_last_change(query)
+        headers, not_modified = check_not_modified(
+            digest_etag(total, last_change), last_change, by_date=False
+        )
+        if not_modified:
+            return not_modified
+
+        rows, cursor = Items.paginate(
+            Items.rows(query, fields, sort), args["limit"], args["after"], sort
+        )
+        app.logger.info("Found %d of %d items", len(rows), total)
+        if total == 0:
+            message = {
                 "message": "No items found for this wishlist - " + str(wishlist_id)
-            }, status.HTTP_200_OK
+            }
+            return API.marshal(message, ITEM_MODEL), status.HTTP_200_OK, headers
 
         app.logger.info("Returning wishlist items for wishlist: %s", wishlist_id)
-        return items_serialized, status.HTTP_200_OK
+        headers.update(next_page_link(cursor))
+        headers["X-Total-Count"] = str(total)
+        encode = fast_json.encoder(ITEM_MODEL, False, fields)
+        return fast_json.response(
+            [encode(row._mapping) for row in rows], status.HTTP_200_OK, headers
+        )
 
     @API.doc("clear_wishlist")
     @API.response(404, "No wishlist found.")
@@ -509,20 +1131,112 @@ class ItemCollectionResource(Resource):
         wishlist = Wishlists.find(wishlist_id)
 
         if wishlist:
-            while wishlist.items:
-                item = wishlist.items[0]
-                wishlist.items.remove(item)
-                item.delete()
+            wishlist.clear()
 
         app.logger.info("Wishlist with ID [%s] delete complete.", wishlist_id)
         return "", status.HTTP_204_NO_CONTENT
 
 
+@API.route("/wishlists/<int:wishlist_id>/items/batch", strict_slashes=False)
+@API.param("wishlist_id", "The wishlist ID")
+class ItemBatchResource(Resource):
+    """Class for adding many items to a wishlist at once."""
+
+    @idempotency.idempotent
+    @API.doc("create_items")
+    @API.param(idempotency.HEADER, IDEMPOTENCY_KEY_HELP, _in="header")
+    @API.response(409, "A request with the Idempotency-Key is in progress.")
+    @API.response(422, "The Idempotency-Key was used for another request.")
+    @API.expect([CREATE_ITEM_MODEL])
+    @API.response(207, "Some of the items were not valid.")
+    @API.response(400, "None of the items were valid.")
+    @API.response(404, "No wishlist found.")
+    @API.response(413, "Too many items in one batch.")
+    @API.marshal_list_with(
+        BATCH_ITEM_RESULT_MODEL, skip_none=True, code=status.HTTP_201_CREATED
+    )
+    def post(self, wishlist_id):
+        """
+        Adds many Items to a wishlist
+        All items are validated first, then the valid ones are added in one
+        transaction. The result for each posted item is returned in order.
+        """
+        app.logger.info("Request to create a batch of items in a wishlist")
+        check_content_type("application/json")
+        payload = request.get_json()
+        if not isinstance(payload, list) or not payload:
+            API.abort(status.HTTP_400_BAD_REQUEST, "Expected an array of items.")
+        if len(payload) > app.config["MAX_BATCH_SIZE"]:
+            API.abort(
+                status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                f"At most {app.config['MAX_BATCH_SIZE']} items can be added at once.",
+            )
+        if not Wishlists.exists(wishlist_id):
+            API.abort(
+                status.HTTP_404_NOT_FOUND,
+                f"Wishlist with id '{wishlist_id}' was not found.",
+            )
+
+        results, items = [], []
+        for index, data in enumerate(payload):
+            if isinstance(data, dict):
+                data = dict(data, wishlist_id=wishlist_id)
+            try:
+                item = Items().deserialize(data, verify_wishlist=False)
+            except DataValidationError as error:
+                result = {"status": status.HTTP_400_BAD_REQUEST, "message": str(error)}
+            else:
+                items.append(item)
+                result = {"status": status.HTTP_201_CREATED, "item": item}
+            results.append(dict(result, index=index))
+        Items.create_many(items)
+
+        for result in results:
+            if "item" in result:
+                result["item"] = result["item"].serialize()
+        app.logger.info("Created %d of %d items.", len(items), len(payload))
+        if not items:
+            return results, status.HTTP_400_BAD_REQUEST
+        if len(items) < len(payload):
+            return results, status.HTTP_207_MULTI_STATUS
+        return results, status.HTTP_201_CREATED
+
+
 ######################################################################
 #  U T I L I T Y   F U N C T I O N S
 ######################################################################
 
 
+def transfer_wishlists(wishlist_id, key):
+    """
+    Returns the wishlist of the path and the one named by a key of the body
+
+    Aborts with 400 when the body names no wishlist and with 404 when either
+    of them does not exist.
+    """
+    body = request.get_json()
+    target_id = body.get(key) if isinstance(body, dict) else None
+    if not isinstance(target_id, int):
+        abort(status.HTTP_400_BAD_REQUEST, f"{key} must be a wishlist id.")
+    wishlist = Wishlists.find(wishlist_id)
+    target = Wishlists.find(target_id)
+    for by_id, found in ((wishlist_id, wishlist), (target_id, target)):
+        if not found:
+            abort(
+                status.HTTP_404_NOT_FOUND,
+                f"Wishlist with id '{by_id}' was not found.",
+            )
+    return wishlist, target
+
+
+def transferred_item_ids():
+    """Returns the item_ids of the body of a copy or move, None for all items"""
+    item_ids = request.get_json().get("item_ids")
+    if item_ids is not None and not isinstance(item_ids, list):
+        abort(status.HTTP_400_BAD_REQUEST, "item_ids must be an array of ids.")
+    return item_ids
+
+
 def check_content_type(content_type):
     """Checks that the media type is correct"""
     if "Content-Type" not in request.headers:
@@ -542,9 +1256,137 @@ def check_content_type(content_type):
     )
 
 
-@app.before_first_request
+def version_etag(version_id, variant=None):
+    """
+    Returns the strong ETag of a row at a version
+
+    Args:
+        version_id (int): the version_id of the row
+        variant (string): what else the representation holds, e.g. "items"
+    """
+    return quote_etag(f"{version_id}-{variant}" if variant else str(version_id))
+
+
+def variant(expand=None, fields=None):
+    """Returns the ETag variant of a representation, None when it is the full one"""
+    parts = [expand] if expand else []
+    if fields is not None:
+        digest = hashlib.sha1(",".join(sorted(fields)).encode("utf-8"))
+        parts.append(digest.hexdigest()[:8])
+    return "_".join(parts) or None
+
+
+VERSION_ETAG = re.compile(r"(\d+)(?:-\w+)?")
+
+
+def if_match_versions():
+    """
+    Returns the version_ids named by the If-Match header of the request
+
+    Weak tags never match an If-Match. None is returned when there is no
+    If-Match header, or it is "*" which any current version matches.
+    """
+    if not request.if_match or request.if_match.star_tag:
+        return None
+    versions = []
+    for tag in request.if_match.as_set():
+        match = VERSION_ETAG.fullmatch(tag)
+        if match:
+            versions.append(int(match.group(1)))
+    return versions
+
+
+def requested_fields(value, model):
+    """
+    Returns the field names of a fields query parameter
+
+    Args:
+        value (string): the comma separated names, e.g. "id,name", or None
+        model (Model): the model of the response, which names the valid fields
+    Returns:
+        tuple: the names in the order of the model, or None for all of the fields
+    """
+    if value is None:
+        return None
+    names = {name.strip() for name in value.split(",")} - {""}
+    unknown = names.difference(model.resolved)
+    if unknown or not names:
+        API.abort(
+            status.HTTP_400_BAD_REQUEST,
+            f"Unknown fields: '{value}'. Valid fields are " + ", ".join(model.resolved),
+        )
+    return tuple(name for name in model.resolved if name in names)
+
+
+def with_items(expand, fields):
+    """Returns True when the items of the wishlists are to be embedded"""
+    return expand == "items" and (fields is None or "items" in fields)
+
+
+def digest_etag(*state):
+    """
+    Returns a strong ETag for a representation that has no single version
+
+    The tag is a digest of the request path and query string, which select
+    the representation, and of the state it is built from.
+    """
+    digest = hashlib.sha1(repr((request.full_path, state)).encode("utf-8"))
+    return quote_etag(digest.hexdigest())
+
+
+def check_not_modified(etag, last_modified, by_date=True):
+    """
+    Checks the conditional headers of the request against the cache validators
+
+    The validators are computed before the response body, so a 304 costs
+    no serialization.
+
+    Args:
+        etag (string): the quoted ETag of the representation
+        last_modified (datetime): when the representation last changed, if known
+        by_date (bool): False when last_modified cannot see deleted rows, as
+            for a collection, so only If-None-Match is answered with a 304
+    Returns:
+        (dict, Response): the ETag and Last-Modified headers, and the 304
+        response to return when the client's copy is current, else None
+    """
+    headers = {"ETag": etag}
+    if last_modified is not None:
+        # HTTP dates are in UTC with a resolution of one second
+        last_modified = last_modified.replace(microsecond=0).astimezone(
+            datetime.timezone.utc
+        )
+        headers["Last-Modified"] = http_date(last_modified)
+
+    if request.if_none_match:
+        fresh = request.if_none_match.contains_weak(unquote_etag(etag)[0])
+    elif by_date and request.if_modified_since and last_modified is not None:
+        fresh = last_modified <= request.if_modified_since
+    else:
+        fresh = False
+    if not fresh:
+        return headers, None
+    response = app.response_class(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return headers, response
+
+
+def next_page_link(cursor):
+    """Returns the Link header pointing at the page after the cursor, if any"""
+    if cursor is None:
+        return {}
+    args = request.args.to_dict()
+    args["after"] = cursor
+    return {"Link": f'<{request.base_url}?{urlencode(args)}>; rel="next"'}
+
+
 def init_db():
-    """Initializes the SQLAlchemy app"""
+    """
+    Initializes the SQLAlchemy app
+
+    Loading the service already does this, once in the gunicorn master when
+    it preloads the app, so it is not run again on the first request of
+    every worker.
+    """
     global app
     Wishlists.init_db(app)
     Items.init_db(app)
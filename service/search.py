@@ -0,0 +1,213 @@
+"""
+Text Search
+
+Searches the names of the wishlists and items of a customer, or the items
+of one wishlist, and ranks the hits.
+
+On Postgres the names are indexed with pg_trgm GIN indexes. A name matches
+when it contains the query, or when one of its words is similar to it, so
+misspellings are found too. The score is the word similarity of the query
+and the name, plus 1 when the name starts with the query.
+
+SQLite, used for local testing, has no trigrams. The names are indexed in
+FTS5 tables kept up to date by triggers, and match when their words start
+with the words of the query. The score is the BM25 rank, plus 1 when the
+name starts with the query. There is no fuzzy matching on SQLite.
+
+The index is created with the tables, by create_all() or migration 1, and
+added to existing databases by migration 8.
+"""
+import logging
+import re
+from sqlalchemy import DDL, Float, Integer, String, event, text
+from sqlalchemy.sql import column
+from service.models import Items, Wishlists, db, decode_cursor, encode_cursor
+
+logger = logging.getLogger("flask.app")
+
+TABLES = ("wishlists", "items")
+
+# The sort key of the hits, all descending
+CURSOR_COLUMNS = [column("score", Float), column("kind", String), column("id", Integer)]
+
+
+######################################################################
+#  I N D E X E S
+######################################################################
+
+
+def trigram_index_ddl(table, concurrently=False):
+    """Returns the DDL of the trigram index of the names of a table on Postgres"""
+    return (
+        f"CREATE INDEX {'CONCURRENTLY ' if concurrently else ''}IF NOT EXISTS "
+        f"ix_{table}_name_trgm ON {table} USING gin (name gin_trgm_ops)"
+    )
+
+
+def fts_ddl(table):
+    """Returns the DDL of the FTS5 index of the names of a table on SQLite"""
+    search = f"{table}_search"
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {search} USING fts5("
+        f"name, content='{table}', content_rowid='id')",
+        f"CREATE TRIGGER IF NOT EXISTS {search}_insert AFTER INSERT ON {table} "
+        f"BEGIN INSERT INTO {search} (rowid, name) VALUES (new.id, new.name); END",
+        f"CREATE TRIGGER IF NOT EXISTS {search}_delete AFTER DELETE ON {table} "
+        f"BEGIN INSERT INTO {search} ({search}, rowid, name) "
+        f"VALUES ('delete', old.id, old.name); END",
+        f"CREATE TRIGGER IF NOT EXISTS {search}_update AFTER UPDATE OF name "
+        f"ON {table} BEGIN INSERT INTO {search} ({search}, rowid, name) "
+        f"VALUES ('delete', old.id, old.name); "
+        f"INSERT INTO {search} (rowid, name) VALUES (new.id, new.name); END",
+    ]
+
+
+def create_indexes(conn):
+    """
+    Indexes the names of existing tables, for migration 8
+
+    On Postgres the indexes are built concurrently, so the connection must
+    be in autocommit mode. On SQLite the FTS5 tables are filled with the
+    rows that are already there.
+    """
+    if conn.dialect.name == "postgresql":
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        for table in TABLES:
+            logger.info("Creating the trigram index of %s", table)
+            conn.execute(text(trigram_index_ddl(table, concurrently=True)))
+    elif conn.dialect.name == "sqlite":
+        for table in TABLES:
+            logger.info("Creating the full text index of %s", table)
+            for statement in fts_ddl(table):
+                conn.execute(text(statement))
+            search = f"{table}_search"
+            conn.execute(text(f"INSERT INTO {search} ({search}) VALUES ('rebuild')"))
+
+
+def listen_for_tables():
+    """Creates and drops the indexes with the tables, e.g. by create_all()"""
+    if event.contains(db.metadata, "before_create", create_extension):
+        return
+    event.listen(db.metadata, "before_create", create_extension)
+    for model in (Wishlists, Items):
+        table = model.__table__
+        postgres = DDL(trigram_index_ddl(table.name)).execute_if(dialect="postgresql")
+        event.listen(table, "after_create", postgres)
+        for statement in fts_ddl(table.name):
+            sqlite = DDL(statement).execute_if(dialect="sqlite")
+            event.listen(table, "after_create", sqlite)
+        drop = DDL(f"DROP TABLE IF EXISTS {table.name}_search")
+        event.listen(table, "before_drop", drop.execute_if(dialect="sqlite"))
+
+
+def create_extension(metadata, conn, **kw):  # pylint: disable=unused-argument
+    """Creates the pg_trgm extension before the tables on Postgres"""
+    if conn.dialect.name == "postgresql":
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+
+
+listen_for_tables()
+
+
+######################################################################
+#  S E A R C H
+######################################################################
+
+
+def escape_like(value):
+    """Escapes the wildcards of a LIKE pattern, with a backslash"""
+    return re.sub(r"([\\%_])", r"\\\1", value)
+
+
+def fts_query(value):
+    """Returns the FTS5 query that matches the names with words starting like value"""
+    return " ".join(f'"{word}"*' for word in re.findall(r"\w+", value))
+
+
+def hits_sql(dialect, customer_id=None, wishlist_id=None):
+    """
+    Returns the SQL of the hits of a search as a union of wishlists and items
+
+    Every hit has the columns kind, id, wishlist_id, name and score.
+    """
+    if dialect == "postgresql":
+        source = "{table} AS t"
+        match = "(t.name ILIKE :contains OR :q <% t.name)"
+        score = "word_similarity(:q, t.name)"
+        starts = "t.name ILIKE :prefix"
+    else:
+        source = "{table}_search JOIN {table} AS t ON t.id = {table}_search.rowid"
+        match = "{table}_search MATCH :match"
+        score = "-bm25({table}_search)"
+        starts = "t.name LIKE :prefix"
+    template = (
+        "SELECT '{kind}' AS kind, t.id AS id, {wishlist_id} AS wishlist_id, "
+        f"t.name AS name, {score} + CASE WHEN {starts} ESCAPE '\\' THEN 1 ELSE 0 END "
+        f"AS score FROM {source}{{join}} WHERE {match}"
+    )
+
+    selects = []
+    if wishlist_id is None:
+        wishlists = template.format(
+            kind="wishlist", table="wishlists", wishlist_id="t.id", join=""
+        )
+        selects.append(wishlists + " AND t.customer_id = :customer_id")
+    join = " JOIN wishlists AS w ON w.id = t.wishlist_id" if customer_id else ""
+    items = template.format(
+        kind="item", table="items", wishlist_id="t.wishlist_id", join=join
+    )
+    if customer_id is not None:
+        items += " AND w.customer_id = :customer_id"
+    if wishlist_id is not None:
+        items += " AND t.wishlist_id = :wishlist_id"
+    selects.append(items)
+    return " UNION ALL ".join(selects)
+
+
+def search(q, customer_id=None, wishlist_id=None, limit=100, after=None):
+    """
+    Returns a page of the wishlists and items whose names match a query
+
+    Args:
+        q (string): the text to search for
+        customer_id (int): search the wishlists of this customer and their items
+        wishlist_id (int): search the items of this wishlist only
+        limit (int): the maximum number of hits to return
+        after (string): the cursor of the previous page
+    Returns:
+        (list, string): the hits, best first, and the cursor of the next page,
+        which is None on the last page
+    """
+    if customer_id is None and wishlist_id is None:
+        raise ValueError("A search needs a customer_id or a wishlist_id")
+    q = q.strip()
+    dialect = db.engine.dialect.name
+    params = {
+        "q": q,
+        "match": fts_query(q),
+        "prefix": escape_like(q) + "%",
+        "contains": "%" + escape_like(q) + "%",
+        "customer_id": customer_id,
+        "wishlist_id": wishlist_id,
+        "limit": limit + 1,
+    }
+    if dialect != "postgresql" and not params["match"]:
+        return [], None
+    where = ""
+    if after:
+        params["score"], params["kind"], params["id"] = decode_cursor(
+            after, CURSOR_COLUMNS
+        )
+        where = "WHERE (score, kind, id) < (:score, :kind, :id)"
+    statement = text(
+        f"SELECT kind, id, wishlist_id, name, score FROM "
+        f"({hits_sql(dialect, customer_id, wishlist_id)}) AS hits {where} "
+        f"ORDER BY score DESC, kind DESC, id DESC LIMIT :limit"
+    )
+    logger.info("Processing search for %r ...", q)
+    hits = [row._mapping for row in db.session.execute(statement, params)]
+    if len(hits) <= limit:
+        return hits, None
+    hits = hits[:limit]
+    last = hits[-1]
+    return hits, encode_cursor([last["score"], last["kind"], last["id"]])
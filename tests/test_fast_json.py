@@ -0,0 +1,97 @@
+# Copyright 2016, 2022 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Test cases for the fast JSON encoders
+
+Test cases can be run with:
+    nosetests
+    coverage report -m
+"""
+import json
+import unittest
+from unittest.mock import patch
+from flask_restx import fields
+from service import app
+from service.common import fast_json
+from service.routes import API, ITEM_MODEL, WISHLIST_WITH_ITEMS_MODEL
+
+ITEM = {
+    "id": 7,
+    "name": "Tea",
+    "wishlist_id": 3,
+    "product_id": 42,
+    "quantity": 2,
+    "price": 5,
+    "rank": 1,
+}
+WISHLIST = {"id": 3, "name": "Gifts", "customer_id": 12}
+
+
+######################################################################
+#  F A S T   J S O N   T E S T   C A S E S
+######################################################################
+class TestFastJson(unittest.TestCase):
+    """Test Cases for the encoders compiled from the API models"""
+
+    def test_encode_item(self):
+        """It should encode an item like API.marshal"""
+        encode = fast_json.compile_encoder(ITEM_MODEL)
+        self.assertEqual(encode(ITEM), API.marshal(ITEM, ITEM_MODEL))
+        row = dict(ITEM, price=None)
+        self.assertEqual(encode(row), API.marshal(row, ITEM_MODEL))
+
+    def test_encode_wishlist_with_items(self):
+        """It should encode a wishlist and its items like API.marshal"""
+        encode = fast_json.compile_encoder(WISHLIST_WITH_ITEMS_MODEL, skip_none=True)
+        for wishlist in [WISHLIST, dict(WISHLIST, items=[ITEM, dict(ITEM, id=8)])]:
+            self.assertEqual(
+                encode(wishlist),
+                API.marshal(wishlist, WISHLIST_WITH_ITEMS_MODEL, skip_none=True),
+            )
+        self.assertNotIn("items", encode(WISHLIST))
+
+    def test_encode_fields(self):
+        """It should encode only some of the fields, with a cached encoder"""
+        encode = fast_json.encoder(ITEM_MODEL, only=("id", "price"))
+        self.assertEqual(encode(ITEM), {"id": 7, "price": 5})
+        self.assertIs(fast_json.encoder(ITEM_MODEL, only=("id", "price")), encode)
+
+    def test_encode_default(self):
+        """It should use the default of a field for missing values"""
+        model = API.model("Defaulted", {"size": fields.Integer(default=1)})
+        self.assertEqual(fast_json.compile_encoder(model)({}), {"size": 1})
+
+    def test_unsupported_fields(self):
+        """It should refuse fields it cannot encode like API.marshal"""
+        model = API.model("Dated", {"created_on": fields.DateTime()})
+        self.assertRaises(TypeError, fast_json.compile_encoder, model)
+        model = API.model("Called", {"size": fields.Integer(default=lambda: 1)})
+        self.assertRaises(TypeError, fast_json.compile_encoder, model)
+
+    def test_dumps_without_orjson(self):
+        """It should dump the same JSON with the json module"""
+        value = [API.marshal(ITEM, ITEM_MODEL)]
+        with patch.object(fast_json, "orjson", None):
+            self.assertEqual(json.loads(fast_json.dumps(value)), value)
+        self.assertEqual(json.loads(fast_json.dumps(value)), value)
+
+    def test_response(self):
+        """It should return a JSON response with headers"""
+        with app.app_context():
+            response = fast_json.response([ITEM], 200, {"X-Total-Count": "1"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, "application/json")
+        self.assertEqual(response.headers["X-Total-Count"], "1")
+        self.assertEqual(response.get_json(), [ITEM])
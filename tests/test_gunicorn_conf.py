@@ -0,0 +1,115 @@
+# Copyright 2016, 2022 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Test cases for the sizing of the gunicorn server profile
+
+Test cases can be run with:
+    nosetests
+    coverage report -m
+"""
+import os
+import runpy
+import tempfile
+import unittest
+from unittest.mock import patch
+
+CONF_PATH = os.path.join(os.path.dirname(__file__), "..", "gunicorn.conf.py")
+
+
+def load_conf(**env):
+    """Runs gunicorn.conf.py with some environment, leaving ours unchanged"""
+    with patch.dict(os.environ, env):
+        return runpy.run_path(CONF_PATH)
+
+
+######################################################################
+#  G U N I C O R N   C O N F   T E S T   C A S E S
+######################################################################
+class TestGunicornConf(unittest.TestCase):
+    """Test Cases for gunicorn.conf.py"""
+
+    def setUp(self):
+        """This runs before each test"""
+        self.conf = load_conf()
+        self.tempdir = tempfile.TemporaryDirectory()  # pylint: disable=R1732
+        self.cgroup = self.tempdir.name
+
+    def tearDown(self):
+        """This runs after each test"""
+        self.tempdir.cleanup()
+
+    def _write(self, name, content):
+        path = os.path.join(self.cgroup, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="ascii") as file:
+            file.write(content + "\n")
+
+    ######################################################################
+    #  T E S T   C A S E S
+    ######################################################################
+
+    @patch("os.sched_getaffinity", return_value=set(range(8)))
+    def test_cpu_limit(self, _):
+        """It should cap the CPUs by the cgroup quota"""
+        cpu_limit = self.conf["cpu_limit"]
+        self.assertEqual(cpu_limit(self.cgroup), 8)
+        self._write("cpu.max", "max 100000")
+        self.assertEqual(cpu_limit(self.cgroup), 8)
+        self._write("cpu.max", "150000 100000")
+        self.assertEqual(cpu_limit(self.cgroup), 2)
+        os.remove(os.path.join(self.cgroup, "cpu.max"))
+        self._write("cpu/cpu.cfs_quota_us", "50000")
+        self._write("cpu/cpu.cfs_period_us", "100000")
+        self.assertEqual(cpu_limit(self.cgroup), 1)
+        self._write("cpu/cpu.cfs_quota_us", "-1")
+        self.assertEqual(cpu_limit(self.cgroup), 8)
+
+    def test_memory_limit(self):
+        """It should read the memory limit of cgroup v2 and v1"""
+        memory_limit = self.conf["memory_limit"]
+        self.assertIsNone(memory_limit(self.cgroup))
+        self._write("memory/memory.limit_in_bytes", str(2**63 - 4096))
+        self.assertIsNone(memory_limit(self.cgroup))
+        self._write("memory/memory.limit_in_bytes", "268435456")
+        self.assertEqual(memory_limit(self.cgroup), 268435456)
+        self._write("memory.max", "max")
+        self.assertIsNone(memory_limit(self.cgroup))
+        self._write("memory.max", "536870912")
+        self.assertEqual(memory_limit(self.cgroup), 536870912)
+
+    def test_server_profile(self):
+        """It should size the workers and threads of each worker class"""
+        server_profile = self.conf["server_profile"]
+        self.assertEqual(server_profile("sync", 4), (9, 1))
+        self.assertEqual(server_profile("gthread", 4), (5, 4))
+        self.assertEqual(server_profile("gevent", 4), (5, 1))
+        self.assertEqual(server_profile("sync", 4, memory=256 * 2**20), (2, 1))
+        self.assertEqual(server_profile("sync", 1, memory=64 * 2**20), (1, 1))
+
+    def test_environment_overrides(self):
+        """It should take the worker class, workers and threads from the environment"""
+        conf = load_conf(
+            GUNICORN_WORKER_CLASS="sync", WEB_CONCURRENCY="7", GUNICORN_THREADS="3"
+        )
+        self.assertEqual(conf["worker_class"], "sync")
+        self.assertEqual(conf["workers"], 7)
+        self.assertEqual(conf["threads"], 3)
+        self.assertTrue(conf["preload_app"])
+
+    def test_workers_do_not_migrate(self):
+        """It should leave the migrations to the loading of the app"""
+        from service import app  # pylint: disable=import-outside-toplevel
+
+        self.assertEqual(app.before_first_request_funcs, [])
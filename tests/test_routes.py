@@ -27,11 +27,12 @@ Test cases can be run with the following:
 import os
 import logging
 from unittest import TestCase
+from sqlalchemy import event
 
 # from unittest.mock import MagicMock, patch
 from service import app
 from service.routes import init_db, disconnect_db
-from service.common import status
+from service.common import ndjson, status
 from service.models import db, Wishlists, Items
 from tests.factories import WishlistsFactory, ItemsFactory
 
@@ -186,6 +187,30 @@ class TestWishlistsService(TestCase):
         wishlist = response.get_json()
         self.assertEqual(wishlist["name"], "Test Rename")
 
+    def test_rename_wishlist_if_match(self):
+        """It should only rename a wishlist that is unchanged since its ETag"""
+        test_wishlist = self._create_wishlists(1)[0]
+        url = f"{BASE_URL}/{test_wishlist['id']}"
+        etag = self.client.get(url).headers["ETag"]
+
+        response = self.client.put(
+            url, json={"name": "first"}, headers={"If-Match": etag}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response.headers["ETag"], etag)
+        self.assertEqual(self.client.get(url).headers["ETag"], response.headers["ETag"])
+
+        response = self.client.put(
+            url, json={"name": "second"}, headers={"If-Match": etag}
+        )
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        self.assertEqual(self.client.get(url).get_json()["name"], "first")
+
+        response = self.client.put(
+            url, json={"name": "third"}, headers={"If-Match": "*"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
     def test_list_all_wishlists(self):
 
         "It should display all the wishlists when present."
@@ -217,6 +242,42 @@ class TestWishlistsService(TestCase):
             self.assertEqual(int(r["customer_id"]), customer_id)
             self.assertIn(int(r["id"]), ids)
 
+    def test_list_wishlists_paginated(self):
+        """It should page through the wishlists with the Link header"""
+        test_wishlists = self._create_wishlists(5)
+        url = f"{BASE_URL}?limit=2"
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            page = response.get_json()
+            self.assertLessEqual(len(page), 2)
+            ids.extend(w["id"] for w in page)
+            link = response.headers.get("Link")
+            url = link[link.index("<") + 1:link.index(">")] if link else None
+        self.assertEqual(ids, [w["id"] for w in test_wishlists])
+
+    def test_list_wishlists_paginated_by_customer(self):
+        """It should keep the customer filter across pages"""
+        self._create_wishlists_by_customer(3, 1234)
+        self._create_wishlists_by_customer(2, 5678)
+        response = self.client.get(f"{BASE_URL}?customer_id=1234&limit=2")
+        self.assertEqual(len(response.get_json()), 2)
+        link = response.headers["Link"]
+        self.assertIn("customer_id=1234", link)
+        response = self.client.get(link[link.index("<") + 1:link.index(">")])
+        page = response.get_json()
+        self.assertEqual(len(page), 1)
+        self.assertEqual(int(page[0]["customer_id"]), 1234)
+        self.assertNotIn("Link", response.headers)
+
+    def test_list_wishlists_bad_page_arguments(self):
+        """It should not list wishlists with a bad limit or cursor"""
+        response = self.client.get(f"{BASE_URL}?limit=0")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(f"{BASE_URL}?after=garbage")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_list_wishlist_id(self):
         "It should display the wishlists for a particular wishlist id"
         test_wishlist = self._create_wishlists(1)[0]
@@ -401,6 +462,65 @@ class TestItemsService(TestCase):
         self.assertEqual(n_item["name"], new_item["name"])
         self.assertEqual(n_item["product_id"], new_item["product_id"])
 
+    def test_add_items_batch(self):
+        """It should add many items to a wishlist at once"""
+        test_wishlist = WishlistsFactory()
+        test_wishlist.create()
+        new_items = [
+            {"name": f"item {i}", "product_id": i, "quantity": 2, "price": 100}
+            for i in range(5)
+        ]
+        response = self.client.post(
+            f"{BASE_URL}/{test_wishlist.id}/items/batch", json=new_items
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        results = response.get_json()
+        self.assertEqual([r["index"] for r in results], list(range(5)))
+        for result, new_item in zip(results, new_items):
+            self.assertEqual(result["status"], status.HTTP_201_CREATED)
+            self.assertEqual(result["item"]["name"], new_item["name"])
+            self.assertEqual(int(result["item"]["wishlist_id"]), test_wishlist.id)
+            self.assertIsNotNone(Items.find(result["item"]["id"]))
+        self.assertEqual(Items.find_by_wishlist_id(test_wishlist.id).count(), 5)
+
+    def test_add_items_batch_partly_valid(self):
+        """It should add the valid items of a batch and report the others"""
+        test_wishlist = WishlistsFactory()
+        test_wishlist.create()
+        new_items = [
+            {"name": "good", "product_id": 1},
+            {"name": "bad product", "product_id": "1"},
+            {"product_id": 3},
+        ]
+        response = self.client.post(
+            f"{BASE_URL}/{test_wishlist.id}/items/batch", json=new_items
+        )
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        results = response.get_json()
+        self.assertEqual(
+            [r["status"] for r in results],
+            [status.HTTP_201_CREATED, status.HTTP_400_BAD_REQUEST, status.HTTP_400_BAD_REQUEST],
+        )
+        self.assertNotIn("item", results[1])
+        self.assertIn("product_id", results[1]["message"])
+        self.assertEqual(Items.find_by_wishlist_id(test_wishlist.id).count(), 1)
+
+    def test_add_items_batch_bad_requests(self):
+        """It should not add a batch that is invalid as a whole"""
+        test_wishlist = WishlistsFactory()
+        test_wishlist.create()
+        url = f"{BASE_URL}/{test_wishlist.id}/items/batch"
+        response = self.client.post(url, json={"name": "not a list"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(url, json=[{"product_id": 1}])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(
+            f"{BASE_URL}/0/items/batch", json=[{"name": "x", "product_id": 1}]
+        )
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.post(url, data="[]")
+        self.assertEqual(response.status_code, status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+
     def test_delete_item(self):
         """It should Delete a Item"""
         test_item = self._create_items(1)[0]
@@ -457,6 +577,32 @@ class TestItemsService(TestCase):
         )
         self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
 
+    def test_update_product_if_match(self):
+        """It should only update an item that is unchanged since its ETag"""
+        wishlist = Wishlists(name="Wishlist", customer_id=1)
+        wishlist.create()
+        item = Items(name="Test", wishlist_id=wishlist.id, product_id=1)
+        item.create()
+        url = f"{BASE_URL}/{wishlist.id}/items/{item.id}"
+        etag = self.client.get(url).headers["ETag"]
+
+        response = self.client.put(
+            url,
+            json={"product_name": "first", "price": 5},
+            headers={"If-Match": etag},
+        )
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        data = self.client.get(url).get_json()
+        self.assertEqual(data["name"], "first")
+        self.assertEqual(data["price"], 5)
+
+        for stale in (etag, f"W/{etag}"):
+            response = self.client.put(
+                url, json={"product_name": "second"}, headers={"If-Match": stale}
+            )
+            self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        self.assertEqual(self.client.get(url).get_json()["name"], "first")
+
     def test_update_product_no_wid(self):
         """It should Update a product Name"""
         wishlist = Wishlists(name="Wishlist", customer_id=1)
@@ -524,9 +670,458 @@ class TestItemsService(TestCase):
         # Checking the attributed of the Wishlist Item
         n_item = response.get_json()
         self.assertEqual(len(n_item), len(items["pid"]))
-        for i, actual in enumerate(n_item):
-            self.assertEqual(actual["name"], items["name"][i])
-            self.assertEqual(actual["product_id"], items["pid"][i])
+        self.assertEqual(response.headers["X-Total-Count"], str(len(items["pid"])))
+        self.assertCountEqual([i["name"] for i in n_item], items["name"])
+        # items are listed in (rank, id) order
+        found = [Items.find(i["id"]) for i in n_item]
+        self.assertEqual(found, sorted(found, key=lambda i: (i.rank, i.id)))
+
+    def test_list_wishlist_items_paginated(self):
+        """It should page through the items of a wishlist"""
+        wishlist, items = self._create_wishlist_with_items(5)
+        url = f"{BASE_URL}/{wishlist.id}/items?limit=2"
+        names = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.headers["X-Total-Count"], "5")
+            page = response.get_json()
+            self.assertLessEqual(len(page), 2)
+            names.extend(i["name"] for i in page)
+            link = response.headers.get("Link")
+            url = link[link.index("<") + 1:link.index(">")] if link else None
+        self.assertCountEqual(names, items["name"])
+
+    def test_list_wishlist_items_bad_cursor(self):
+        """It should not list items with a malformed cursor"""
+        wishlist, _ = self._create_wishlist_with_items(1)
+        response = self.client.get(f"{BASE_URL}/{wishlist.id}/items?after=garbage")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_get_wishlist_expand_items(self):
+        """It should embed the items of a wishlist with expand=items"""
+        wishlist, items = self._create_wishlist_with_items(3)
+        response = self.client.get(f"{BASE_URL}/{wishlist.id}?expand=items")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.get_json()
+        self.assertEqual(data["id"], wishlist.id)
+        self.assertCountEqual([i["name"] for i in data["items"]], items["name"])
+        response = self.client.get(f"{BASE_URL}/{wishlist.id}?expand=nothing")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_list_wishlists_expand_items(self):
+        """It should load the items of a page of wishlists with a fixed number of queries"""
+        created = [self._create_wishlist_with_items(2) for _ in range(3)]
+        statements = []
+
+        def record(conn, cursor, statement, *args):  # pylint: disable=unused-argument
+            statements.append(statement)
+
+        event.listen(db.engine, "before_cursor_execute", record)
+        try:
+            response = self.client.get(f"{BASE_URL}?expand=items")
+        finally:
+            event.remove(db.engine, "before_cursor_execute", record)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.get_json()
+        self.assertEqual(len(data), 3)
+        for wishlist, (_, items) in zip(data, created):
+            self.assertCountEqual([i["name"] for i in wishlist["items"]], items["name"])
+        # the cache validators, the page of wishlists and the items of the page
+        self.assertEqual(len(statements), 3)
+
+    def test_list_wishlists_without_expand(self):
+        """It should not embed items unless asked to"""
+        self._create_wishlist_with_items(1)
+        response = self.client.get(BASE_URL)
+        self.assertNotIn("items", response.get_json()[0])
+
+    def test_get_fields(self):
+        """It should return only the fields named by fields"""
+        wishlist, _ = self._create_wishlist_with_items(2)
+        items = Items.find_by_wishlist_id(wishlist.id).order_by(Items.rank, Items.id)
+        item = items.first()
+        urls = {
+            f"{BASE_URL}?fields=name,id": [{"id": wishlist.id, "name": wishlist.name}],
+            f"{BASE_URL}/{wishlist.id}?fields=name": {"name": wishlist.name},
+            f"{BASE_URL}/{wishlist.id}/items?fields=price": [
+                {"price": i.price} for i in items
+            ],
+            f"{BASE_URL}/{wishlist.id}/items/{item.id}?fields=id, quantity": {
+                "id": item.id,
+                "quantity": item.quantity,
+            },
+        }
+        for url, expected in urls.items():
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.get_json(), expected)
+
+        response = self.client.get(f"{BASE_URL}/{wishlist.id}?expand=items&fields=id")
+        self.assertEqual(response.get_json(), {"id": wishlist.id})
+        response = self.client.get(f"{BASE_URL}?expand=items&fields=id,items")
+        self.assertEqual(len(response.get_json()[0]["items"]), 2)
+
+    def test_get_unknown_fields(self):
+        """It should not return fields that the model does not have"""
+        wishlist, _ = self._create_wishlist_with_items(1)
+        for url in (
+            f"{BASE_URL}?fields=id,secret",
+            f"{BASE_URL}/{wishlist.id}?fields=",
+            f"{BASE_URL}/{wishlist.id}/items?fields=customer_id",
+        ):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_get_fields_projects_columns(self):
+        """It should select only the columns of the fields"""
+        self._create_wishlist_with_items(1)
+        statements = []
+
+        def record(conn, cursor, statement, *args):  # pylint: disable=unused-argument
+            statements.append(statement)
+
+        event.listen(db.engine, "before_cursor_execute", record)
+        try:
+            response = self.client.get(f"{BASE_URL}?fields=name")
+        finally:
+            event.remove(db.engine, "before_cursor_execute", record)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        page = statements[-1]
+        self.assertIn("wishlists.name", page)
+        self.assertNotIn("wishlists.customer_id", page)
+        self.assertNotIn("wishlists.created_on", page)
+
+    def test_get_fields_etag(self):
+        """It should give each set of fields its own ETag"""
+        wishlist, _ = self._create_wishlist_with_items(1)
+        url = f"{BASE_URL}/{wishlist.id}"
+        etag = self.client.get(url).headers["ETag"]
+        response = self.client.get(f"{url}?fields=id", headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        fields_etag = response.headers["ETag"]
+        self.assertNotEqual(fields_etag, etag)
+        response = self.client.get(
+            f"{url}?fields=id", headers={"If-None-Match": fields_etag}
+        )
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        # the tag still names the version for a conditional update
+        response = self.client.put(
+            url, json={"name": "renamed"}, headers={"If-Match": fields_etag}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_get_wishlist_totals(self):
+        """It should return the totals of the items of a wishlist, read only"""
+        wishlist, _ = self._create_wishlist_with_items(2)
+        url = f"{BASE_URL}/{wishlist.id}"
+        items = self.client.get(f"{url}/items").get_json()
+        data = self.client.get(url).get_json()
+        self.assertEqual(data["item_count"], 2)
+        self.assertEqual(data["total_quantity"], sum(i["quantity"] for i in items))
+        self.assertEqual(
+            data["total_value"], sum(i["quantity"] * i["price"] for i in items)
+        )
+        listed = self.client.get(f"{BASE_URL}?customer_id={wishlist.customer_id}")
+        self.assertEqual(listed.get_json()[0]["item_count"], 2)
+        data["item_count"] = 100
+        response = self.client.put(url, json=data)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.get_json()["item_count"], 2)
+
+    def test_update_wishlist_with_items(self):
+        """It should update a wishlist from its representation with the items"""
+        wishlist, _ = self._create_wishlist_with_items(2)
+        url = f"{BASE_URL}/{wishlist.id}"
+        data = self.client.get(f"{url}?expand=items").get_json()
+        self.assertEqual(len(data["items"]), 2)
+        data["name"] = "renamed"
+        data["id"] = 0
+        response = self.client.put(url, json=data)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.get_json()["name"], "renamed")
+        self.assertEqual(response.get_json()["id"], wishlist.id)
+        response = self.client.put(url, json={"name": "emptied", "items": []})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = self.client.get(f"{url}?expand=items").get_json()
+        self.assertEqual(len(data["items"]), 2)
+
+    def test_customer_summary(self):
+        """It should return the totals of all of the wishlists of a customer"""
+        wishlist, _ = self._create_wishlist_with_items(2)
+        other = WishlistsFactory(id=None, customer_id=wishlist.customer_id)
+        other.create()
+        response = self.client.get(f"/api/customers/{wishlist.customer_id}/summary")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        summary = response.get_json()
+        self.assertEqual(summary["customer_id"], str(wishlist.customer_id))
+        self.assertEqual(summary["wishlist_count"], 2)
+        self.assertEqual(summary["item_count"], 2)
+        self.assertIn("max-age", response.headers["Cache-Control"])
+        response = self.client.get("/api/customers/0/summary")
+        self.assertEqual(response.get_json()["wishlist_count"], 0)
+
+    def test_reorder_items(self):
+        """It should put the items of a wishlist in a new order"""
+        wishlist, _ = self._create_wishlist_with_items(3)
+        url = f"{BASE_URL}/{wishlist.id}/items"
+        ids = [item["id"] for item in self.client.get(url).get_json()][::-1]
+        etag = self.client.get(f"{BASE_URL}/{wishlist.id}").headers["ETag"]
+        response = self.client.put(f"{url}/order", json={"item_ids": ids})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item["id"] for item in response.get_json()], ids)
+        self.assertEqual([item["id"] for item in self.client.get(url).get_json()], ids)
+        self.assertNotEqual(
+            self.client.get(f"{BASE_URL}/{wishlist.id}").headers["ETag"], etag
+        )
+
+        response = self.client.put(f"{url}/order", json={"item_ids": ids[1:]})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.put(f"{url}/order", json=ids)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.put(f"{BASE_URL}/0/items/order", json={"item_ids": []})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_reorder_more_items_than_a_batch(self):
+        """It should reorder a wishlist with more items than MAX_BATCH_SIZE"""
+        wishlist, _ = self._create_wishlist_with_items(3)
+        url = f"{BASE_URL}/{wishlist.id}/items"
+        ids = [item["id"] for item in self.client.get(url).get_json()][::-1]
+        batch_size = app.config["MAX_BATCH_SIZE"]
+        app.config["MAX_BATCH_SIZE"] = 2
+        try:
+            response = self.client.put(f"{url}/order", json={"item_ids": ids})
+        finally:
+            app.config["MAX_BATCH_SIZE"] = batch_size
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item["id"] for item in response.get_json()], ids)
+
+    def test_move_item(self):
+        """It should move one item of a wishlist after another"""
+        wishlist, _ = self._create_wishlist_with_items(3)
+        url = f"{BASE_URL}/{wishlist.id}/items"
+        first, second, third = [item["id"] for item in self.client.get(url).get_json()]
+        response = self.client.put(f"{url}/{third}/move", json={"after": first})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.get_json()["id"], third)
+        listed = [item["id"] for item in self.client.get(url).get_json()]
+        self.assertEqual(listed, [first, third, second])
+        response = self.client.put(f"{url}/{second}/move", json={"after": None})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        listed = [item["id"] for item in self.client.get(url).get_json()]
+        self.assertEqual(listed, [second, first, third])
+
+        response = self.client.put(f"{url}/{second}/move", json={"after": 0})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.put(f"{url}/{second}/move", json={"after": "x"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.put(f"{BASE_URL}/0/items/{second}/move", json={})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_update_item_rank(self):
+        """It should change the rank of an item with a PUT"""
+        wishlist, _ = self._create_wishlist_with_items(2)
+        url = f"{BASE_URL}/{wishlist.id}/items"
+        first, second = [item["id"] for item in self.client.get(url).get_json()]
+        response = self.client.put(
+            f"{url}/{first}", json={"product_name": "last", "rank": 5}
+        )
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        listed = self.client.get(url).get_json()
+        self.assertEqual([item["id"] for item in listed], [second, first])
+        self.assertEqual(listed[1]["rank"], 5)
+        response = self.client.put(
+            f"{url}/{first}", json={"product_name": "last", "rank": "top"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_copy_move_and_merge_items(self):
+        """It should copy, move and merge items between wishlists"""
+        source, _ = self._create_wishlist_with_items(2)
+        target, _ = self._create_wishlist_with_items(1)
+        items_url = f"{BASE_URL}/{source.id}/items"
+        item_ids = [item["id"] for item in self.client.get(items_url).get_json()]
+
+        response = self.client.post(f"{items_url}/copy", json={"to": target.id})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.get_json()["id"], target.id)
+        self.assertEqual(response.get_json()["item_count"], 3)
+
+        response = self.client.post(
+            f"{items_url}/move", json={"to": target.id, "item_ids": item_ids[:1]}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.get_json()["item_count"], 4)
+        response = self.client.get(f"{BASE_URL}/{target.id}/items/{item_ids[0]}")
+        self.assertEqual(response.get_json()["wishlist_id"], str(target.id))
+
+        response = self.client.post(
+            f"{BASE_URL}/{source.id}/merge", json={"into": target.id}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        emptied = self.client.get(f"{BASE_URL}/{source.id}").get_json()
+        self.assertEqual(emptied["item_count"], 0)
+        # the remaining item adds its quantity to its copy
+        self.assertEqual(response.get_json()["item_count"], 4)
+
+        response = self.client.post(f"{items_url}/copy", json={"to": source.id})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(f"{items_url}/move", json={"to": "x"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(
+            f"{items_url}/move", json={"to": target.id, "item_ids": [0]}
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(f"{BASE_URL}/{source.id}/merge", json={"into": 0})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_list_wishlists_filters(self):
+        """It should combine the filters of wishlists"""
+        wishlists = []
+        for customer_id, name in [(1, "home"), (1, "work"), (2, "home"), (3, "home")]:
+            wishlist = WishlistsFactory(id=None, customer_id=customer_id, name=name)
+            wishlist.create()
+            wishlists.append(wishlist.id)
+        queries = {
+            "customer_id=1&name=home": [wishlists[0]],
+            "customer_id=1,2&name=home": [wishlists[0], wishlists[2]],
+            f"id={wishlists[1]},{wishlists[3]}": [wishlists[1], wishlists[3]],
+            "name=home&sort=-id": [wishlists[3], wishlists[2], wishlists[0]],
+            "created_on_min=2000-01-01T00:00:00Z&customer_id=3": [wishlists[3]],
+            "created_on_max=2000-01-01": [],
+        }
+        for query, expected in queries.items():
+            response = self.client.get(f"{BASE_URL}?{query}")
+            self.assertEqual(response.status_code, status.HTTP_200_OK, query)
+            self.assertEqual([w["id"] for w in response.get_json()], expected, query)
+        for query in ("customer_id=1,x", "sort=customer_id", "created_on_min=never"):
+            response = self.client.get(f"{BASE_URL}?{query}")
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, query)
+
+    def test_list_wishlist_items_filters(self):
+        """It should filter the items of one wishlist only"""
+        wishlist, other = WishlistsFactory(id=None), WishlistsFactory(id=None)
+        wishlist.create()
+        other.create()
+        for owner in (wishlist, other):
+            Items.create_many(
+                [
+                    Items(name="tea", wishlist_id=owner.id, product_id=1, price=5),
+                    Items(name="tea", wishlist_id=owner.id, product_id=2, price=50),
+                    Items(name="cup", wishlist_id=owner.id, product_id=3, price=20),
+                ]
+            )
+        url = f"{BASE_URL}/{wishlist.id}/items"
+        queries = {
+            "name=tea": [1, 2],
+            "name=tea&price_min=10": [2],
+            "product_id=1,3&sort=-price": [3, 1],
+            "price_min=5&price_max=20&quantity_max=1&sort=price": [1, 3],
+        }
+        for query, expected in queries.items():
+            response = self.client.get(f"{url}?{query}")
+            self.assertEqual(response.status_code, status.HTTP_200_OK, query)
+            data = response.get_json()
+            self.assertEqual([i["product_id"] for i in data], expected, query)
+            self.assertTrue(all(i["wishlist_id"] == str(wishlist.id) for i in data))
+        response = self.client.get(f"{url}?sort=wishlist_id")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_list_wishlist_items_sorted_pages(self):
+        """It should page through the items in the order of the sort field"""
+        wishlist, items = self._create_wishlist_with_items(5)
+        url = f"{BASE_URL}/{wishlist.id}/items?sort=-price&limit=2"
+        prices = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            prices.extend(i["price"] for i in response.get_json())
+            link = response.headers.get("Link")
+            url = link[link.index("<") + 1 : link.index(">")] if link else None
+        self.assertEqual(len(prices), len(items["name"]))
+        self.assertEqual(prices, sorted(prices, reverse=True))
+
+    def test_get_wishlist_not_modified(self):
+        """It should answer a conditional GET of an unchanged wishlist with a 304"""
+        wishlist, _ = self._create_wishlist_with_items(1)
+        url = f"{BASE_URL}/{wishlist.id}?expand=items"
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response.headers["ETag"]
+        last_modified = response.headers["Last-Modified"]
+
+        response = self.client.get(url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.data, b"")
+        self.assertEqual(response.headers["ETag"], etag)
+        response = self.client.get(url, headers={"If-Modified-Since": last_modified})
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        # each representation has its own tag
+        response = self.client.get(
+            f"{BASE_URL}/{wishlist.id}", headers={"If-None-Match": etag}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_get_wishlist_modified_by_items(self):
+        """It should change the ETag of a wishlist when one of its items changes"""
+        wishlist, _ = self._create_wishlist_with_items(2)
+        url = f"{BASE_URL}/{wishlist.id}?expand=items"
+        etag = self.client.get(url).headers["ETag"]
+        item = Items.find_by_wishlist_id(wishlist.id).first()
+        response = self.client.delete(f"{BASE_URL}/{wishlist.id}/items/{item.id}")
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        response = self.client.get(url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.get_json()["items"]), 1)
+        self.assertNotEqual(response.headers["ETag"], etag)
+
+    def test_get_wishlist_item_not_modified(self):
+        """It should answer a conditional GET of an unchanged item with a 304"""
+        test_item = self._create_items(1)[0]
+        url = f'{BASE_URL}/{test_item["wishlist_id"]}/items/{test_item["id"]}'
+        etag = self.client.get(url).headers["ETag"]
+        response = self.client.get(url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        response = self.client.put(url, json={"product_name": "renamed"})
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        response = self.client.get(url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.get_json()["name"], "renamed")
+
+    def test_list_not_modified(self):
+        """It should answer conditional GETs of unchanged collections with a 304"""
+        wishlist, _ = self._create_wishlist_with_items(2)
+        for url in (BASE_URL, f"{BASE_URL}/{wishlist.id}/items"):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertIn("Last-Modified", response.headers)
+            etag = response.headers["ETag"]
+            response = self.client.get(url, headers={"If-None-Match": etag})
+            self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+            response = self.client.get(url, headers={"If-None-Match": '"stale"'})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        # deleting a row changes the tag of the collection
+        etag = self.client.get(BASE_URL).headers["ETag"]
+        self.client.delete(f"{BASE_URL}/{wishlist.id}")
+        response = self.client.get(BASE_URL, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_export_wishlists(self):
+        """It should stream every wishlist with its items as NDJSON"""
+        created = [self._create_wishlist_with_items(n) for n in (2, 0, 3)]
+        response = self.client.get(f"{BASE_URL}/export")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.mimetype, ndjson.MEDIA_TYPE)
+        lines = response.get_data(as_text=True).splitlines()
+        records = [record for _, record in ndjson.iter_loads(lines)]
+        self.assertEqual([r["id"] for r in records], [w.id for w, _ in created])
+        for record, (wishlist, items) in zip(records, created):
+            self.assertEqual(record["name"], wishlist.name)
+            self.assertCountEqual([i["name"] for i in record["items"]], items["name"])
+            for item in record["items"]:
+                self.assertEqual(item["wishlist_id"], wishlist.id)
 
     def test_get_wishlist_item_not_found(self):
         """It should not retrieve a wishlist item"""
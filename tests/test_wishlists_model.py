@@ -27,7 +27,7 @@ import os
 import logging
 import unittest
 from werkzeug.exceptions import NotFound
-from service.models import Wishlists, DataValidationError, db
+from service.models import Wishlists, DataValidationError, VersionConflictError, db
 from service import app
 from tests.factories import WishlistsFactory
 import datetime
@@ -131,6 +131,37 @@ class TestWishlistsModel(unittest.TestCase):
         self.assertEqual(wishlists[0].id, original_id)
         self.assertEqual(wishlists[0].customer_id, 2)
 
+    def test_update_with_version(self):
+        """It should only Update a wishlist at an expected version"""
+        wishlist = WishlistsFactory()
+        wishlist.id = None
+        wishlist.create()
+        version = wishlist.version_id
+        wishlist.name = "first"
+        wishlist.update([version])
+        self.assertEqual(wishlist.version_id, version + 1)
+
+        # a second writer still holding the old version loses
+        wishlist.name = "second"
+        self.assertRaises(VersionConflictError, wishlist.update, [version])
+        self.assertEqual(Wishlists.find(wishlist.id).name, "first")
+        db.session.remove()
+        wishlist = Wishlists.find(wishlist.id)
+        self.assertEqual(wishlist.name, "first")
+        self.assertEqual(wishlist.version_id, version + 1)
+
+    def test_update_deleted_wishlist(self):
+        """It should not Update a wishlist that was deleted"""
+        wishlist = WishlistsFactory()
+        wishlist.id = None
+        wishlist.create()
+        version = wishlist.version_id
+        # deleted by another request
+        with db.engine.begin() as conn:
+            conn.execute(Wishlists.__table__.delete())
+        wishlist.name = "gone"
+        self.assertRaises(NotFound, wishlist.update, [version])
+
     def test_update_no_id(self):
         """It should not Update a wishlist with no id"""
         wishlist = WishlistsFactory()
@@ -260,3 +291,23 @@ class TestWishlistsModel(unittest.TestCase):
     def test_find_or_404_not_found(self):
         """It should return 404 not found"""
         self.assertRaises(NotFound, Wishlists.find_or_404, 0)
+
+    def test_paginate(self):
+        """It should page through Wishlists in id order"""
+        wishlists = WishlistsFactory.create_batch(5)
+        for wishlist in wishlists:
+            wishlist.create()
+        page, cursor = Wishlists.paginate(Wishlists.query, 2)
+        self.assertEqual([w.id for w in page], [w.id for w in wishlists[:2]])
+        self.assertIsNotNone(cursor)
+        page, cursor = Wishlists.paginate(Wishlists.query, 2, cursor)
+        self.assertEqual([w.id for w in page], [w.id for w in wishlists[2:4]])
+        page, cursor = Wishlists.paginate(Wishlists.query, 2, cursor)
+        self.assertEqual([w.id for w in page], [wishlists[4].id])
+        self.assertIsNone(cursor)
+
+    def test_paginate_bad_cursor(self):
+        """It should not paginate with a malformed cursor"""
+        self.assertRaises(
+            DataValidationError, Wishlists.paginate, Wishlists.query, 2, "not-a-cursor"
+        )